@@ -0,0 +1,23 @@
+# Gunicorn 設定
+# 起動例: gunicorn -c gunicorn.conf.py math_project.wsgi
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+
+# マスターでアプリを読み込んでから fork し、読み込み済みのモジュールを共有する
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def when_ready(server):
+    """マスター起動完了時：DB 以外（views・テンプレート・URL）を温める"""
+    if not preload_app:
+        return
+    from math_app.warmup import warm_up
+    warm_up(include_db=False)
+
+
+def post_worker_init(worker):
+    """ワーカー初期化後・リクエスト受付前：DB 接続と単元データを温める"""
+    from math_app.warmup import warm_up
+    warm_up()
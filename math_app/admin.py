@@ -1,7 +1,14 @@
-from django.contrib import admin
+from datetime import datetime
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Problem, Tag, Hint, Grade, UserProfile, Subject, Question, Question
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Problem, Tag, Grade, UserProfile, Subject, Question
 
 
 # ==============================================================================
@@ -160,72 +167,14 @@ class ProblemAdmin(admin.ModelAdmin):
     # カスタム表示メソッド
     # =========================================================================
     def get_tags(self, obj):
-        """このProblemに紐付くタグを表示"""
-        tags = obj.tags.all()
-        if tags:
-            return ', '.join([tag.name for tag in tags])
+        """このProblemに紐付くタグを表示（非正規化スナップショットから、JOIN なし）"""
+        if obj.tag_snapshot:
+            return ', '.join(tag['name'] for tag in obj.tag_snapshot)
         return '-'
     
     get_tags.short_description = 'タグ'
 
 
-# ==============================================================================
-# Hint Adminクラス
-# ==============================================================================
-@admin.register(Hint)
-class HintAdmin(admin.ModelAdmin):
-    """
-    Hint モデルの Admin カスタマイズ
-    レガシー互換（今後は使用しない予定）
-    """
-    
-    list_display = (
-        'problem',
-        'get_stage_type',
-        'content_preview',
-        'created_at'
-    )
-    
-    list_filter = (
-        'stage_type',
-        'created_at',
-        'problem__user'
-    )
-    
-    search_fields = (
-        'problem__title',
-        'content'
-    )
-    
-    ordering = ('-created_at',)
-    readonly_fields = ('created_at',)
-    
-    fieldsets = (
-        ('ヒント情報', {
-            'fields': ('problem', 'stage_type', 'content')
-        }),
-        
-        ('投稿情報', {
-            'fields': ('created_at',),
-            'classes': ('collapse',)
-        }),
-    )
-    
-    def get_stage_type(self, obj):
-        """ヒント種類を日本語で表示"""
-        return obj.get_stage_type_display()
-    
-    get_stage_type.short_description = 'ヒント種類'
-    
-    def content_preview(self, obj):
-        """ヒント内容をプレビュー表示"""
-        if len(obj.content) > 50:
-            return obj.content[:50] + '...'
-        return obj.content
-    
-    content_preview.short_description = 'ヒント内容'
-
-
 # ==============================================================================
 # Question Adminクラス
 # ==============================================================================
@@ -234,11 +183,17 @@ class QuestionAdmin(admin.ModelAdmin):
     """
     Question モデルの Admin カスタマイズ
     """
-    list_display = ('id', 'name', 'email', 'subject', 'is_replied', 'created_at')
-    list_filter = ('is_replied', 'created_at')
+    list_display = ('id', 'name', 'email', 'subject', 'is_replied', 'is_archived', 'created_at')
+    list_filter = ('is_replied', 'is_archived', 'created_at')
     search_fields = ('name', 'email', 'subject', 'message')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+    actions = ('mark_replied', 'archive')
+    show_full_result_count = False  # 絞り込み時に全件数の COUNT(*) を発行しない
+    change_list_template = 'admin/math_app/question/change_list.html'
+    
+    # 振り分けビューの 1 ページの件数
+    triage_per_page = 50
     
     fieldsets = (
         ('質問者情報', {
@@ -250,10 +205,97 @@ class QuestionAdmin(admin.ModelAdmin):
         }),
         
         ('管理情報', {
-            'fields': ('is_replied', 'created_at')
+            'fields': ('is_replied', 'is_archived', 'created_at')
         }),
     )
     
     def has_add_permission(self, request):
         """管理画面から質問の追加は不可"""
         return False
+    
+    # =========================================================================
+    # 一括操作（1 本の UPDATE / DELETE）
+    # =========================================================================
+    @admin.action(description='選択した質問を返信済みにする', permissions=['change'])
+    def mark_replied(self, request, queryset):
+        count = queryset.mark_replied()
+        self.message_user(request, f'{count} 件を返信済みにしました', messages.SUCCESS)
+    
+    @admin.action(description='選択した質問をアーカイブする', permissions=['change'])
+    def archive(self, request, queryset):
+        count = queryset.archive()
+        self.message_user(request, f'{count} 件をアーカイブしました', messages.SUCCESS)
+    
+    def delete_queryset(self, request, queryset):
+        """「選択された質問の削除」：添付画像の削除は sweep_deleted_files に任せる"""
+        queryset.delete_with_attachments()
+    
+    def delete_model(self, request, obj):
+        Question.objects.filter(pk=obj.pk).delete_with_attachments()
+    
+    # =========================================================================
+    # 未返信の振り分けビュー（キーセットページング）
+    # =========================================================================
+    def get_urls(self):
+        urls = [
+            path(
+                'triage/',
+                self.admin_site.admin_view(self.triage_view),
+                name='math_app_question_triage',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def triage_view(self, request):
+        """
+        未返信・未アーカイブの質問を新しい順に表示する
+        OFFSET を使わず「前のページの最後の行より古いもの」を読むので、何ページ目でも部分インデックスを辿るだけで済む
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        
+        if request.method == 'POST':
+            # 数字でない ID（改ざんされたフォームなど）は無視する
+            ids = [value for value in request.POST.getlist('ids') if value.isdigit()]
+            action = request.POST.get('action')
+            questions = Question.objects.filter(pk__in=ids)
+            if action == 'mark_replied':
+                self.message_user(request, f'{questions.mark_replied()} 件を返信済みにしました', messages.SUCCESS)
+            elif action == 'archive':
+                self.message_user(request, f'{questions.archive()} 件をアーカイブしました', messages.SUCCESS)
+            return redirect(request.get_full_path())
+        
+        inbox = Question.objects.inbox().order_by('-created_at', '-id')
+        cursor = self._parse_cursor(request.GET.get('before', ''))
+        if cursor:
+            created_at, pk = cursor
+            inbox = inbox.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        
+        questions = list(
+            inbox.only('id', 'name', 'email', 'subject', 'message', 'problem_image', 'created_at')
+            [:self.triage_per_page + 1]
+        )
+        next_cursor = None
+        if len(questions) > self.triage_per_page:
+            questions = questions[:self.triage_per_page]
+            last = questions[-1]
+            next_cursor = f"{last.created_at.isoformat()},{last.pk}"
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': '未返信の質問',
+            'questions': questions,
+            'next_cursor': next_cursor,
+            'is_first_page': cursor is None,
+        }
+        return TemplateResponse(request, 'admin/math_app/question/triage.html', context)
+    
+    @staticmethod
+    def _parse_cursor(value):
+        """「送信日時（ISO 形式）,ID」→ (datetime, int)。不正な値は None（先頭から）"""
+        created_at, _, pk = value.rpartition(',')
+        try:
+            return datetime.fromisoformat(created_at), int(pk)
+        except ValueError:
+            return None
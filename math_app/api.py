@@ -0,0 +1,332 @@
+# 問題の読み取り専用 JSON API（モバイルクライアント向け）
+#
+# - 一覧：GET /api/problems/?cursor=...&limit=20&tag=3&fields=id,title
+#   （新しい順、(created_at, id) のキーセットページング。next に次ページのカーソルを返す）
+# - 詳細：GET /api/problems/<id>/
+# - 複数：GET /api/problems/bulk/?ids=1,2,3
+# - 差分同期：GET /api/problems/sync/?cursor=...（前回の cursor 以降に変わった問題と、削除された問題の ID）
+# いずれもログインユーザーの問題だけを返す。fields= で返す項目を選べる（既定ではヒント本文を含めない）。
+# 先に (id, updated_at) だけを読んで ETag / Last-Modified を作り、一致すれば本文を読まずに 304 を返す。
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods
+
+from .db import read_from_replica
+from .models import Problem, ProblemTombstone
+
+# 返せる項目 → 読む列
+API_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'grade': ('grade_id',),
+    'image': ('image',),
+    'tags': ('tag_snapshot',),
+    'hint_excerpt': ('hint_excerpt',),
+    'hint_approach': ('hint_approach',),
+    'hint_formula': ('hint_formula',),
+    'hint_technique': ('hint_technique',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+}
+DEFAULT_FIELDS = ('id', 'title', 'grade', 'image', 'tags', 'hint_excerpt', 'created_at', 'updated_at')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# 差分同期：この秒数より新しい変更は、次回の同期でもう一度返す
+# （updated_at は保存時刻なので、同時に走るトランザクションが後から古い時刻でコミットすることがある）
+SYNC_SETTLE_SECONDS = 5
+# 削除記録の保存期間。これより古い cursor は削除を取りこぼすので、最初から同期し直してもらう
+TOMBSTONE_RETENTION_DAYS = 90
+
+# 区切りの空白を省き、日本語はエスケープしない（\uXXXX にすると 3 倍近くになる）
+JSON_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+class APIError(Exception):
+    pass
+
+
+def error_response(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def parse_fields(request):
+    value = request.GET.get('fields', '')
+    if not value:
+        return DEFAULT_FIELDS
+    if value == 'all':
+        return tuple(API_FIELDS)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        raise APIError(f"unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise APIError('invalid cursor')
+
+
+def serialize(row, fields):
+    data = {}
+    for name in fields:
+        if name == 'grade':
+            data[name] = row['grade_id']
+        elif name == 'image':
+            data[name] = default_storage.url(row['image']) if row['image'] else None
+        elif name == 'tags':
+            data[name] = row['tag_snapshot']
+        elif name in ('created_at', 'updated_at'):
+            data[name] = row[name].isoformat()
+        else:
+            data[name] = row[name]
+    return data
+
+
+def fetch_rows(queryset, fields, *extra_columns):
+    """必要な列だけを values() で読む（モデルのインスタンスは作らない）"""
+    columns = {'id', 'created_at', *extra_columns}
+    for name in fields:
+        columns.update(API_FIELDS[name])
+    return list(queryset.values(*columns))
+
+
+def conditional(request, versions, *extra):
+    """
+    (id, updated_at) の並びと、応答を変えるパラメータから ETag / Last-Modified を作る
+    条件付きリクエストが一致すれば 304 を、そうでなければ (None, ヘッダー) を返す
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{request.user.pk}|{'|'.join(map(str, extra))}".encode())
+    for pk, updated_at in versions:
+        digest.update(f"|{pk}:{updated_at.isoformat()}".encode())
+    etag = f'"{digest.hexdigest()[:32]}"'
+    last_modified = max((updated_at for _, updated_at in versions), default=None)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    headers = {'ETag': etag}
+    if timestamp:
+        headers['Last-Modified'] = http_date(timestamp)
+    if response is not None:
+        for key, value in headers.items():
+            response[key] = value
+    return response, headers
+
+
+def json_response(data, headers):
+    response = JsonResponse(data, json_dumps_params=JSON_PARAMS)
+    for key, value in headers.items():
+        response[key] = value
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def problem_list(request):
+    try:
+        fields = parse_fields(request)
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        cursor = request.GET.get('cursor')
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return error_response('invalid limit')
+    except APIError as e:
+        return error_response(str(e))
+
+    problems = Problem.objects.filter(user=request.user).order_by('-created_at', '-id')
+    tag_id = request.GET.get('tag')
+    if tag_id:
+        if not tag_id.isdigit():
+            return error_response('invalid tag')
+        problems = problems.filter(tags__id=tag_id)
+    if position:
+        created_at, pk = position
+        problems = problems.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # 1 件多く読み、次のページがあるかを判定する
+    versions = list(problems.values_list('id', 'updated_at')[:limit + 1])
+    has_next = len(versions) > limit
+    versions = versions[:limit]
+
+    not_modified, headers = conditional(request, versions, 'list', ','.join(fields), cursor, limit, tag_id)
+    if not_modified:
+        return not_modified
+
+    ids = [pk for pk, _ in versions]
+    rows = fetch_rows(Problem.objects.filter(pk__in=ids).order_by('-created_at', '-id'), fields)
+    next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_next and rows else None
+    return json_response({
+        'results': [serialize(row, fields) for row in rows],
+        'next': next_cursor,
+    }, headers)
+
+
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def problem_detail(request, pk):
+    try:
+        fields = parse_fields(request) if request.GET.get('fields') else tuple(API_FIELDS)
+    except APIError as e:
+        return error_response(str(e))
+
+    versions = list(Problem.objects.filter(user=request.user, pk=pk).values_list('id', 'updated_at'))
+    if not versions:
+        return error_response('not found', status=404)
+
+    not_modified, headers = conditional(request, versions, 'detail', ','.join(fields))
+    if not_modified:
+        return not_modified
+
+    rows = fetch_rows(Problem.objects.filter(pk=pk), fields)
+    return json_response(serialize(rows[0], fields), headers)
+
+
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def problem_bulk(request):
+    """ids= の順に返す（存在しない・他人の問題の ID は含めない）"""
+    try:
+        fields = parse_fields(request)
+        ids = list(dict.fromkeys(int(value) for value in request.GET.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        return error_response('invalid ids')
+    except APIError as e:
+        return error_response(str(e))
+    if not ids:
+        return error_response('ids is required')
+    if len(ids) > MAX_LIMIT:
+        return error_response(f'at most {MAX_LIMIT} ids')
+
+    order = {pk: index for index, pk in enumerate(ids)}
+    versions = sorted(
+        Problem.objects.filter(user=request.user, pk__in=ids).values_list('id', 'updated_at'),
+        key=lambda version: order[version[0]],
+    )
+
+    not_modified, headers = conditional(request, versions, 'bulk', ','.join(fields))
+    if not_modified:
+        return not_modified
+
+    rows = fetch_rows(Problem.objects.filter(pk__in=[pk for pk, _ in versions]), fields)
+    rows.sort(key=lambda row: order[row['id']])
+    return json_response({'results': [serialize(row, fields) for row in rows]}, headers)
+
+
+def encode_sync_cursor(changed, deleted):
+    """(updated_at, id) と (deleted_at, id) の位置を 1 つの不透明な文字列にする"""
+    raw = json.dumps([
+        changed[0].isoformat() if changed[0] else None, changed[1],
+        deleted[0].isoformat(), deleted[1],
+    ], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_sync_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        changed_at, changed_id, deleted_at, deleted_id = json.loads(raw)
+        return (
+            (datetime.fromisoformat(changed_at) if changed_at else None, int(changed_id)),
+            (datetime.fromisoformat(deleted_at), int(deleted_id)),
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise APIError('invalid cursor')
+
+
+def after(queryset, field, position):
+    """(field, id) が position より後の行"""
+    timestamp, pk = position
+    if timestamp is None:
+        return queryset
+    return queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk}))
+
+
+def settle(position, settled_at):
+    """まだ確定していない時間帯に入った位置を、確定済みの時刻まで戻す"""
+    if position[0] is not None and position[0] > settled_at:
+        return settled_at, 0
+    return position
+
+
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def problem_sync(request):
+    """
+    cursor 以降に作成・更新された問題（changed）と削除された問題の ID（deleted）を返す
+    cursor なしで呼ぶと全件を返す。has_more が true の間は返った cursor で続けて呼ぶ
+    どちらも (時刻, id) の索引を順に読むだけなので、手間は変更の件数に比例する
+    """
+    now = timezone.now()
+    settled_at = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    try:
+        fields = parse_fields(request)
+        limit = min(max(int(request.GET.get('limit', MAX_LIMIT)), 1), MAX_LIMIT)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            changed_position, deleted_position = decode_sync_cursor(cursor)
+        else:
+            # 初回：問題は全件、削除はこれから起きるものだけ
+            changed_position, deleted_position = (None, 0), (settled_at, 0)
+    except ValueError:
+        return error_response('invalid limit')
+    except APIError as e:
+        return error_response(str(e))
+
+    if deleted_position[0] < now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        return error_response('cursor expired; sync again without a cursor', status=410)
+
+    problems = after(Problem.objects.filter(user=request.user), 'updated_at', changed_position)
+    rows = fetch_rows(problems.order_by('updated_at', 'id')[:limit + 1], fields, 'updated_at')
+    tombstones = list(
+        after(ProblemTombstone.objects.filter(user=request.user), 'deleted_at', deleted_position)
+        .order_by('deleted_at', 'id')
+        .values_list('id', 'problem_id', 'deleted_at')[:limit + 1]
+    )
+    changed_more, deleted_more = len(rows) > limit, len(tombstones) > limit
+    rows, tombstones = rows[:limit], tombstones[:limit]
+
+    if rows:
+        changed_position = (rows[-1]['updated_at'], rows[-1]['id'])
+    if tombstones:
+        deleted_position = (tombstones[-1][2], tombstones[-1][0])
+    # 読み切った側だけ、確定していない時間帯を次回に回す
+    if not changed_more:
+        changed_position = settle(changed_position, settled_at)
+    if not deleted_more:
+        # 削除がなくても確定済みの時刻まで進める（進めないと保持期間を過ぎて 410 になる）
+        deleted_position = max(settle(deleted_position, settled_at), (settled_at, 0))
+
+    return json_response({
+        'changed': [serialize(row, fields) for row in rows],
+        'deleted': [problem_id for _, problem_id, _ in tombstones],
+        'cursor': encode_sync_cursor(changed_position, deleted_position),
+        'has_more': changed_more or deleted_more,
+    }, {})
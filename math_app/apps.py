@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MathAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'math_app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite
+        from . import signals  # noqa: F401
+
+        connection_created.connect(configure_sqlite, dispatch_uid='math_app.configure_sqlite')
@@ -0,0 +1,104 @@
+# データベース接続まわりの設定
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    SQLite の接続が作られるたびに性能用の PRAGMA を適用する
+    （connection_created シグナルのハンドラ。PRAGMA は settings.SQLITE_PRAGMAS）
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+# ==============================================================================
+# 読み取りレプリカへのルーティング
+# ==============================================================================
+# リクエスト中にレプリカから読んでよい場合のみ dict が入る（{'alias': 選んだレプリカ}）
+_replica_state = ContextVar('math_app_replica_state', default=None)
+
+# 接続に失敗したレプリカ → 再び試すまでの時刻
+_unhealthy_until = {}
+
+
+def read_from_replica(view_func):
+    """関数ビュー用：安全な GET をレプリカから読んでよいことを示す"""
+    view_func.use_replica = True
+    return view_func
+
+
+class ReplicaReadMixin:
+    """クラスベースビュー用：安全な GET をレプリカから読んでよいことを示す"""
+    use_replica = True
+
+
+def activate_replica_reads():
+    """以降の math_app の読み取りをレプリカに向ける（戻り値は reset 用のトークン）"""
+    return _replica_state.set({})
+
+
+def deactivate_replica_reads(token):
+    _replica_state.reset(token)
+
+
+def pick_replica():
+    """接続できるレプリカを 1 つ選ぶ。すべて使えなければ None（プライマリへ）"""
+    now = time.monotonic()
+    candidates = [
+        alias for alias in settings.REPLICA_DATABASES
+        if _unhealthy_until.get(alias, 0) <= now
+    ]
+    random.shuffle(candidates)
+
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as e:
+            _unhealthy_until[alias] = now + settings.REPLICA_RETRY_SECONDS
+            logger.warning(f"レプリカ {alias} に接続できないためプライマリを使用します: {e}")
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    """
+    ReplicaReadMixin / read_from_replica が付いたビューの間だけ
+    math_app の読み取りをレプリカへ振り分ける。
+    認証・セッションなど他アプリのテーブルと書き込みは常にプライマリ。
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        if state is None or model._meta.app_label != 'math_app':
+            return None
+        # 1 リクエスト内では同じレプリカを使う
+        if 'alias' not in state:
+            state['alias'] = pick_replica()
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # プライマリとレプリカは同じデータなので、どの組み合わせも許可
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,149 @@
+# 似た問題（重複登録）の検出：文字 n-gram の MinHash + LSH
+#
+# タイトルとヒントの文字 3-gram 集合から 64 個の MinHash 値を作り、
+# 4 個ずつ 16 のバンドに分けたハッシュ（バケット）を ProblemLSHBucket に保存する。
+# 登録時はバケットが 1 つでも一致した問題だけを候補として読み、
+# 署名の一致率（Jaccard 係数の推定値）で絞り込むため、件数が増えても候補数だけのコストで済む。
+import hashlib
+import random
+import struct
+import unicodedata
+
+from django.db import transaction
+
+from .models import ProblemLSHBucket, ProblemSignature
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# 署名に使う文字数の上限（正規化後）。ヒントが長くても保存 1 回の計算量を一定にする
+MAX_SIGNATURE_LENGTH = 400
+# 署名の元になるフィールド（どれも変わっていなければ保存時に作り直さない）
+SIGNATURE_FIELDS = ('title', 'hint_approach', 'hint_formula', 'hint_technique')
+
+# この値以上の推定類似度で「似た問題」とみなす
+DUPLICATE_THRESHOLD = 0.6
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20260218)  # 署名は保存されるので、置換は固定の種から作る
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE_FORMAT = f'<{NUM_PERM}I'
+
+
+def signature_text(problem):
+    return '\n'.join(getattr(problem, field) for field in SIGNATURE_FIELDS)
+
+
+def signature_changed(problem):
+    """読み込んだ時点から、署名の元になる値（と持ち主）が変わったか"""
+    original = getattr(problem, '_original', None)
+    if original is None:
+        return True
+    deferred = problem.get_deferred_fields()
+    for field in (*SIGNATURE_FIELDS, 'user_id'):
+        if field in deferred:
+            continue  # 読み込んでいない値は変更されていない
+        if field not in original or original[field] != getattr(problem, field):
+            return True
+    return False
+
+
+def shingles(text):
+    """正規化した文字列の文字 n-gram 集合（空白・大小・全角半角の違いは無視）"""
+    normalized = ''.join(unicodedata.normalize('NFKC', text).lower().split())[:MAX_SIGNATURE_LENGTH]
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def compute_signature(text):
+    """MinHash 署名（NUM_PERM 個の 32bit 値）。文字がなければ None"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for shingle in shingles(text)
+    ]
+    if not hashes:
+        return None
+    return [
+        min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def pack_signature(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+def band_buckets(signature):
+    """バンドごとのバケット値（バンド番号も含めたハッシュ、符号付き 64bit）"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<H{ROWS}I', band, *rows), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def similarity(signature_a, signature_b):
+    """署名の一致率（Jaccard 係数の推定値）"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / NUM_PERM
+
+
+def index_problem(problem):
+    """問題の署名とバケットを作り直す（保存時に signals.py から呼ばれる）"""
+    signature = compute_signature(signature_text(problem))
+    with transaction.atomic():
+        ProblemLSHBucket.objects.filter(problem_id=problem.pk).delete()
+        if signature is None:
+            ProblemSignature.objects.filter(problem_id=problem.pk).delete()
+            return None
+        ProblemSignature.objects.update_or_create(
+            problem_id=problem.pk,
+            defaults={'user_id': problem.user_id, 'minhash': pack_signature(signature)},
+        )
+        ProblemLSHBucket.objects.bulk_create([
+            ProblemLSHBucket(problem_id=problem.pk, user_id=problem.user_id, bucket=bucket)
+            for bucket in band_buckets(signature)
+        ])
+    return signature
+
+
+def find_similar(user_id, signature, exclude_id=None, threshold=DUPLICATE_THRESHOLD):
+    """同じユーザーの似た問題を [(問題 ID, 類似度), ...]（類似度の高い順）で返す"""
+    if signature is None:
+        return []
+
+    candidates = (
+        ProblemLSHBucket.objects
+        .filter(user_id=user_id, bucket__in=band_buckets(signature))
+        .values_list('problem_id', flat=True)
+        .distinct()
+    )
+    if exclude_id is not None:
+        candidates = candidates.exclude(problem_id=exclude_id)
+
+    matches = []
+    for problem_id, data in ProblemSignature.objects.filter(pk__in=candidates).values_list('pk', 'minhash'):
+        score = similarity(signature, unpack_signature(data))
+        if score >= threshold:
+            matches.append((problem_id, score))
+    matches.sort(key=lambda item: item[1], reverse=True)
+    return matches
+
+
+def find_similar_to_problem(problem, threshold=DUPLICATE_THRESHOLD):
+    """保存済みの問題に似た、同じユーザーの他の問題（保存時に作った署名を使う）"""
+    data = (
+        ProblemSignature.objects
+        .filter(problem_id=problem.pk)
+        .values_list('minhash', flat=True)
+        .first()
+    )
+    if data is None:
+        return []
+    return find_similar(problem.user_id, unpack_signature(data), exclude_id=problem.pk, threshold=threshold)
@@ -0,0 +1,45 @@
+# 画像の dHash（64bit の知覚ハッシュ）の計算
+#
+# 画像を 9×8 の濃淡に縮小し、横に隣り合う画素の大小を 64bit にする（索引と検索は imagehash.py）。
+# このモジュールは Django に依存しない。backfill_image_hashes のワーカープロセスは
+# Django を初期化せずにこれだけを読み込む（spawn で起動する Windows / macOS でも動く）。
+# Pillow は最初に画像を読むときに読み込む（起動時や画像を扱わないコマンドでは読み込まない）。
+import io
+import os
+
+
+class UnreadableImage(Exception):
+    """画像として読めない（壊れている・画像でない・画素数が多すぎる）"""
+
+
+def dhash(source):
+    """画像（ファイルパスまたはファイルオブジェクト）の dHash を符号なし 64bit 整数で返す"""
+    from PIL import Image
+
+    try:
+        with Image.open(source) as image:
+            image.draft('L', (64, 64))  # JPEG は縮小して読み込む
+            pixels = list(
+                image.convert('L')
+                .resize((9, 8), Image.Resampling.LANCZOS)
+                .getdata()
+            )
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise UnreadableImage(str(e)) from e
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_source(source):
+    """(dHash, バイト数)。source はファイルパスか画像のバイト列。読めない画像は (None, 0)"""
+    try:
+        if isinstance(source, bytes):
+            return dhash(io.BytesIO(source)), len(source)
+        return dhash(source), os.path.getsize(source)
+    except (OSError, UnreadableImage):
+        return None, 0
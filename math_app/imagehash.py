@@ -0,0 +1,136 @@
+# 画像の重複アップロード検出：dHash（64bit の知覚ハッシュ）
+#
+# 画像を 9×8 の濃淡に縮小し、横に隣り合う画素の大小を 64bit にしたもの（dhash.py）を ImageFingerprint に保存する。
+# 撮り直し・再圧縮・縮小程度の違いならハミング距離は数ビットに収まる。
+# 64bit を 16bit ずつ 4 ブロックに分けて索引を張っておくと、距離が 3 以下の画像は
+# どれか 1 ブロックが必ず一致する（鳩の巣原理）ため、一致したブロックの行だけを読んで
+# int.bit_count() でハミング距離を確かめればよい。
+from django.db import transaction
+from django.db.models import Q
+
+from .dhash import UnreadableImage, dhash
+from .models import ImageFingerprint
+
+# 指紋を作る画像フィールド
+IMAGE_FIELDS = ('image', 'hint_approach_image', 'hint_formula_image', 'hint_technique_image')
+
+# この距離以下を「同じ画像」とみなす（ブロック数 - 1 まで。索引で取りこぼさない上限）
+DUPLICATE_DISTANCE = 3
+
+_BLOCKS = 4
+_BLOCK_BITS = 16
+_BLOCK_MASK = (1 << _BLOCK_BITS) - 1
+
+
+def to_signed(value):
+    """符号なし 64bit → BigIntegerField に入る符号付き 64bit"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+def blocks(value):
+    """ハッシュを 16bit ずつに分けた値（上位から順に）"""
+    value = to_unsigned(value)
+    return [
+        (value >> (_BLOCK_BITS * (_BLOCKS - 1 - i))) & _BLOCK_MASK
+        for i in range(_BLOCKS)
+    ]
+
+
+def hamming(a, b):
+    return (to_unsigned(a) ^ to_unsigned(b)).bit_count()
+
+
+def build_fingerprint(problem_id, user_id, field, name, value, size):
+    block_values = blocks(value)
+    return ImageFingerprint(
+        problem_id=problem_id,
+        user_id=user_id,
+        field=field,
+        name=name,
+        dhash=to_signed(value),
+        block0=block_values[0],
+        block1=block_values[1],
+        block2=block_values[2],
+        block3=block_values[3],
+        size=size,
+    )
+
+
+def index_problem_images(problem):
+    """
+    問題の画像の指紋を作り直す（保存時に signals.py から呼ばれる）
+    ファイル名が変わっていない画像は読み直さない
+    """
+    existing = {
+        fingerprint.field: fingerprint
+        for fingerprint in ImageFingerprint.objects.filter(problem_id=problem.pk)
+    }
+    stale = []
+    fresh = []
+    for field in IMAGE_FIELDS:
+        file = getattr(problem, field)
+        fingerprint = existing.get(field)
+        if not file:
+            if fingerprint:
+                stale.append(fingerprint.pk)
+            continue
+        if fingerprint and fingerprint.name == file.name:
+            continue
+        try:
+            file.open('rb')
+            try:
+                value = dhash(file)
+            finally:
+                file.close()
+            size = file.size
+        except (OSError, UnreadableImage):
+            # 画像として読めないファイルは指紋を作らない
+            if fingerprint:
+                stale.append(fingerprint.pk)
+            continue
+        if fingerprint:
+            stale.append(fingerprint.pk)
+        fresh.append(build_fingerprint(problem.pk, problem.user_id, field, file.name, value, size))
+
+    if stale or fresh:
+        with transaction.atomic():
+            ImageFingerprint.objects.filter(pk__in=stale).delete()
+            ImageFingerprint.objects.bulk_create(fresh)
+    return fresh
+
+
+def find_duplicate_images(user_id, value, exclude_problem_id=None, max_distance=DUPLICATE_DISTANCE):
+    """同じユーザーの見た目が同じ画像を [(ImageFingerprint, 距離), ...]（近い順）で返す"""
+    block_values = blocks(value)
+    candidates = ImageFingerprint.objects.filter(
+        Q(block0=block_values[0]) | Q(block1=block_values[1])
+        | Q(block2=block_values[2]) | Q(block3=block_values[3]),
+        user_id=user_id,
+    )
+    if exclude_problem_id is not None:
+        candidates = candidates.exclude(problem_id=exclude_problem_id)
+
+    matches = []
+    for fingerprint in candidates:
+        distance = hamming(value, fingerprint.dhash)
+        if distance <= max_distance:
+            matches.append((fingerprint, distance))
+    matches.sort(key=lambda item: item[1])
+    return matches
+
+
+def find_duplicates_for_problem(problem, max_distance=DUPLICATE_DISTANCE):
+    """保存済みの問題の画像と同じ画像を持つ、同じユーザーの他の問題の ID"""
+    problem_ids = []
+    for fingerprint in ImageFingerprint.objects.filter(problem_id=problem.pk):
+        for match, _ in find_duplicate_images(
+            problem.user_id, fingerprint.dhash,
+            exclude_problem_id=problem.pk, max_distance=max_distance,
+        ):
+            if match.problem_id not in problem_ids:
+                problem_ids.append(match.problem_id)
+    return problem_ids
@@ -0,0 +1,88 @@
+# 旧 Hint モデルの行を Problem.hint_* に畳み込む
+#
+# fold_legacy_hints コマンドから使う（マイグレーション 0018 は同じ処理を自分の中に固定して持つ）。
+# Hint モデルはもうコードにないため、呼び出し側がマイグレーションの状態から取り出したモデルを渡す。
+# 畳み込んだ Hint の行は同じトランザクションで削除するので、途中で止めても続きから再開できる。
+# 書き換えた問題は updated_at も進める（API の ETag・差分同期が変更として扱う）。抜粋は 0019 で作る。
+from django.db import transaction
+from django.utils import timezone
+
+from .markup import render_hint
+
+# Hint.stage_type → Problem のフィールド
+STAGE_FIELDS = {
+    0: 'hint_approach',
+    1: 'hint_formula',
+    2: 'hint_technique',
+}
+
+# 移行前の最後のマイグレーション（Hint モデルがまだ存在する状態）
+LAST_STATE_WITH_HINT = ('math_app', '0017_question_inbox')
+
+
+def merge_text(current, addition):
+    """既存のヒントに追記する（同じ内容がすでにあれば何もしない）"""
+    addition = addition.strip()
+    if not addition or addition in current:
+        return current
+    if not current.strip():
+        return addition
+    return f"{current.rstrip()}\n\n{addition}"
+
+
+def fold_batch(Hint, Problem, problem_ids):
+    """問題 ID のまとまり 1 つ分を畳み込み、更新した Problem のリストを返す"""
+    fields = list(STAGE_FIELDS.values())
+    problems = {
+        problem.pk: problem
+        for problem in Problem.objects.filter(pk__in=problem_ids).only('pk', 'user_id', 'title', *fields)
+    }
+    hints = (
+        Hint.objects
+        .filter(problem_id__in=problem_ids)
+        .order_by('problem_id', 'stage_type', 'created_at', 'pk')
+        .values_list('problem_id', 'stage_type', 'content')
+    )
+    changed = set()
+    for problem_id, stage_type, content in hints:
+        field = STAGE_FIELDS.get(stage_type)
+        problem = problems.get(problem_id)
+        if field is None or problem is None:
+            continue
+        merged = merge_text(getattr(problem, field), content)
+        if merged != getattr(problem, field):
+            setattr(problem, field, merged)
+            changed.add(problem_id)
+
+    now = timezone.now()
+    updated = [problems[problem_id] for problem_id in sorted(changed)]
+    update_fields = fields + [f'{field}_html' for field in fields] + ['updated_at']
+    for problem in updated:
+        for field in fields:
+            setattr(problem, f'{field}_html', render_hint(getattr(problem, field)))
+        problem.updated_at = now
+
+    with transaction.atomic():
+        Problem.objects.bulk_update(updated, update_fields)
+        Hint.objects.filter(problem_id__in=problem_ids).delete()
+    return updated
+
+
+def fold_hints(Hint, Problem, batch_size=500, on_batch=None):
+    """
+    すべての Hint を畳み込む。batch_size 問ずつ処理するのでメモリ使用量は一定
+    on_batch(処理した Hint の件数, 更新した Problem のリスト) で進捗を受け取れる
+    """
+    while True:
+        problem_ids = list(
+            Hint.objects
+            .order_by('problem_id')
+            .values_list('problem_id', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not problem_ids:
+            break
+        count = Hint.objects.filter(problem_id__in=problem_ids).count()
+        updated = fold_batch(Hint, Problem, problem_ids)
+        if on_batch:
+            on_batch(count, updated)
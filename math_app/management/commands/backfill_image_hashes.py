@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+# ワーカープロセスには Django に依存しない hash_source だけを渡す（子プロセスでは Django を初期化しない）
+from math_app.dhash import hash_source
+from math_app.imagehash import IMAGE_FIELDS, build_fingerprint
+from math_app.models import ImageFingerprint, Problem
+
+
+class Command(BaseCommand):
+    help = "Compute perceptual hashes (dHash) for stored problem and hint images, in parallel across CPU cores."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (1 hashes in this process).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of images hashed and written per batch.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recompute hashes that already exist for the same file.",
+        )
+
+    def handle(self, *args, **options):
+        indexed = {}
+        if not options["force"]:
+            indexed = {
+                (problem_id, field): name
+                for problem_id, field, name in ImageFingerprint.objects.values_list("problem_id", "field", "name")
+            }
+
+        # 指紋がない（またはファイルが差し替わった）画像を集める
+        pending = []
+        rows = Problem.objects.order_by("pk").values_list("pk", "user_id", *IMAGE_FIELDS)
+        for problem_id, user_id, *names in rows.iterator(chunk_size=1000):
+            for field, name in zip(IMAGE_FIELDS, names):
+                if name and indexed.get((problem_id, field)) != name:
+                    pending.append((problem_id, user_id, field, name))
+
+        hashed = failed = 0
+        executor = ProcessPoolExecutor(max_workers=options["workers"]) if options["workers"] > 1 else None
+        try:
+            batch_size = options["batch_size"]
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                sources = [self._source(name) for _, _, _, name in batch]
+                if executor:
+                    results = list(executor.map(hash_source, sources, chunksize=8))
+                else:
+                    results = [hash_source(source) for source in sources]
+
+                fingerprints = []
+                for (problem_id, user_id, field, name), (value, size) in zip(batch, results):
+                    if value is None:
+                        failed += 1
+                        continue
+                    fingerprints.append(build_fingerprint(problem_id, user_id, field, name, value, size))
+                ImageFingerprint.objects.bulk_create(
+                    fingerprints,
+                    update_conflicts=True,
+                    unique_fields=["problem", "field"],
+                    update_fields=["name", "dhash", "block0", "block1", "block2", "block3", "size"],
+                )
+                hashed += len(fingerprints)
+                self.stdout.write(f"{min(start + batch_size, len(pending))}/{len(pending)} image(s) processed")
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} image(s), {failed} unreadable"))
+
+    @staticmethod
+    def _source(name):
+        """ローカルのストレージならパスを、それ以外はファイルの中身をワーカーに渡す"""
+        try:
+            return default_storage.path(name)
+        except NotImplementedError:
+            with default_storage.open(name, "rb") as file:
+                return file.read()
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from math_app.snapshots import find_snapshot_drift, refresh_tag_snapshots
+
+
+class Command(BaseCommand):
+    help = "Detect Problem.tag_snapshot values that drifted from Problem.tags and optionally repair them in bulk."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Rebuild the snapshots of drifted problems.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of problems read and written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        drift = find_snapshot_drift(batch_size=batch_size)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All tag snapshots are consistent."))
+            return
+
+        for problem_id, stored, expected in drift[:20]:
+            self.stdout.write(f"Problem {problem_id}: stored={stored} expected={expected}")
+        if len(drift) > 20:
+            self.stdout.write(f"... and {len(drift) - 20} more")
+
+        if not options["repair"]:
+            self.stdout.write(
+                self.style.WARNING(f"{len(drift)} drifted snapshot(s). Run with --repair to fix them.")
+            )
+            return
+
+        refresh_tag_snapshots([problem_id for problem_id, _, _ in drift], batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} snapshot(s)."))
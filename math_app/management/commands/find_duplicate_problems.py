@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from math_app.dedup import DUPLICATE_THRESHOLD, index_problem, similarity, unpack_signature
+from math_app.models import Problem, ProblemLSHBucket, ProblemSignature
+
+
+class Command(BaseCommand):
+    help = "Report clusters of near-duplicate problems across the whole database using the MinHash/LSH index."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=DUPLICATE_THRESHOLD,
+            help="Minimum estimated Jaccard similarity for two problems to be clustered.",
+        )
+        parser.add_argument(
+            "--reindex",
+            action="store_true",
+            help="Build signatures for problems that do not have one yet (e.g. rows created before the index existed).",
+        )
+
+    def handle(self, *args, **options):
+        if options["reindex"]:
+            missing = Problem.objects.filter(signature__isnull=True).order_by("pk")
+            count = 0
+            for problem in missing.iterator(chunk_size=500):
+                index_problem(problem)
+                count += 1
+            self.stdout.write(f"Indexed {count} problem(s).")
+
+        # 同じバケットに入った問題の組を候補にする（ユーザー・バケット順に流し読み）
+        pairs = set()
+        current_key = None
+        members = []
+        rows = (
+            ProblemLSHBucket.objects
+            .order_by("user_id", "bucket", "problem_id")
+            .values_list("user_id", "bucket", "problem_id")
+            .iterator(chunk_size=5000)
+        )
+        for user_id, bucket, problem_id in rows:
+            if (user_id, bucket) != current_key:
+                self._add_pairs(members, pairs)
+                current_key = (user_id, bucket)
+                members = []
+            members.append(problem_id)
+        self._add_pairs(members, pairs)
+
+        # 署名の一致率で確かめ、Union-Find でクラスタにまとめる
+        signature_ids = {problem_id for pair in pairs for problem_id in pair}
+        signatures = {
+            problem_id: unpack_signature(data)
+            for problem_id, data in ProblemSignature.objects.filter(pk__in=signature_ids).values_list("pk", "minhash")
+        }
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in pairs:
+            if a in signatures and b in signatures and similarity(signatures[a], signatures[b]) >= options["threshold"]:
+                parent[find(a)] = find(b)
+
+        clusters = defaultdict(list)
+        for problem_id in parent:
+            clusters[find(problem_id)].append(problem_id)
+        clusters = [sorted(ids) for ids in clusters.values() if len(ids) > 1]
+
+        titles = dict(
+            Problem.objects
+            .filter(pk__in=[pk for ids in clusters for pk in ids])
+            .values_list("pk", "title")
+        )
+        for ids in sorted(clusters, key=len, reverse=True):
+            self.stdout.write(f"Cluster of {len(ids)}:")
+            for pk in ids:
+                self.stdout.write(f"  #{pk} {titles.get(pk, '')}")
+
+        duplicates = sum(len(ids) - 1 for ids in clusters)
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(clusters)} cluster(s), {duplicates} likely duplicate problem(s).")
+        )
+
+    @staticmethod
+    def _add_pairs(members, pairs):
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pairs.add((a, b))
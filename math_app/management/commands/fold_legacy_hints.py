@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
+from math_app.dedup import index_problem
+from math_app.legacy_hints import LAST_STATE_WITH_HINT, fold_hints
+
+
+class Command(BaseCommand):
+    help = "Fold legacy Hint rows into Problem.hint_* in resumable batches (run before migrating past 0018)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of problems whose hints are folded per batch.",
+        )
+
+    def handle(self, *args, **options):
+        if "math_app_hint" not in connection.introspection.table_names():
+            self.stdout.write(self.style.SUCCESS("The legacy hint table is already gone; nothing to do."))
+            return
+
+        # Hint はコードから削除済みなので、テーブルが残っている時点のマイグレーション状態からモデルを作る
+        apps = MigrationLoader(connection).project_state(LAST_STATE_WITH_HINT).apps
+        Hint = apps.get_model("math_app", "Hint")
+        Problem = apps.get_model("math_app", "Problem")
+
+        total = Hint.objects.count()
+        progress = {"hints": 0, "problems": 0}
+
+        def on_batch(count, updated):
+            # 似た問題の検出用の署名もヒントの内容から作っているため作り直す
+            refreshed = Problem.objects.filter(pk__in=[problem.pk for problem in updated]).only(
+                "pk", "user_id", "title", "hint_approach", "hint_formula", "hint_technique"
+            )
+            for problem in refreshed:
+                index_problem(problem)
+            progress["hints"] += count
+            progress["problems"] += len(updated)
+            self.stdout.write(f"{progress['hints']}/{total} hint(s) folded")
+
+        fold_hints(Hint, Problem, batch_size=options["batch_size"], on_batch=on_batch)
+        self.stdout.write(
+            self.style.SUCCESS(f"Folded {progress['hints']} hint(s) into {progress['problems']} problem(s)")
+        )
@@ -0,0 +1,84 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from math_app.imagehash import DUPLICATE_DISTANCE, hamming
+from math_app.models import ImageFingerprint
+
+
+def format_bytes(size):
+    if size < 1024:
+        return f"{size} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+
+
+class Command(BaseCommand):
+    help = "Report visually identical uploaded images per user and how much storage removing the copies would reclaim."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--distance",
+            type=int,
+            default=DUPLICATE_DISTANCE,
+            help="Maximum Hamming distance between hashes treated as the same image (at most 3).",
+        )
+        parser.add_argument(
+            "--list",
+            action="store_true",
+            help="Print the files in each duplicate group.",
+        )
+
+    def handle(self, *args, **options):
+        max_distance = min(options["distance"], DUPLICATE_DISTANCE)
+        rows = list(
+            ImageFingerprint.objects
+            .order_by("pk")
+            .values_list("pk", "user_id", "dhash", "size", "name", "block0", "block1", "block2", "block3")
+        )
+        info = {row[0]: row for row in rows}
+
+        # ブロックの値が一致する行同士だけを比べる（ユーザーごと）
+        buckets = defaultdict(list)
+        for pk, user_id, _, _, _, *block_values in rows:
+            for position, value in enumerate(block_values):
+                buckets[(user_id, position, value)].append(pk)
+
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for members in buckets.values():
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    if find(a) != find(b) and hamming(info[a][2], info[b][2]) <= max_distance:
+                        parent[find(a)] = find(b)
+
+        groups = defaultdict(list)
+        for pk in parent:
+            groups[find(pk)].append(pk)
+        groups = [members for members in groups.values() if len(members) > 1]
+
+        # 1 グループにつき最も大きいファイルを残すとして、残りの合計を回収できる容量とする
+        total = sum(row[3] for row in rows)
+        reclaimable = 0
+        for members in sorted(groups, key=len, reverse=True):
+            sizes = sorted((info[pk][3] for pk in members), reverse=True)
+            reclaimable += sum(sizes[1:])
+            if options["list"]:
+                self.stdout.write(f"{len(members)} copies, {format_bytes(sum(sizes[1:]))} reclaimable:")
+                for pk in members:
+                    self.stdout.write(f"  {info[pk][4]} ({format_bytes(info[pk][3])})")
+
+        copies = sum(len(members) - 1 for members in groups)
+        self.stdout.write(f"Images: {len(rows)} ({format_bytes(total)})")
+        self.stdout.write(f"Duplicate groups: {len(groups)} ({copies} extra copies)")
+        self.stdout.write(self.style.SUCCESS(f"Reclaimable: {format_bytes(reclaimable)}"))
@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from math_app.models import Grade, Problem, ProblemTombstone, Question, Subject, Tag
+
+
+# 実行計画の中でインデックス不足を示す語（DB ごと）
+# SQLite: "SCAN <table>"（USING INDEX なし）= 全件走査 / "USE TEMP B-TREE" = 一時ソート
+# PostgreSQL: "Seq Scan" = 全件走査 / "Sort" = 一時ソート
+def find_problems(vendor, plan):
+    issues = []
+    for line in plan.splitlines():
+        text = line.strip()
+        if vendor == 'sqlite':
+            if 'SCAN ' in text and 'USING' not in text:
+                issues.append(f"sequential scan: {text}")
+            if 'USE TEMP B-TREE' in text:
+                issues.append(f"temp b-tree: {text}")
+        elif vendor == 'postgresql':
+            if 'Seq Scan' in text:
+                issues.append(f"sequential scan: {text}")
+            if text.startswith('Sort ') or '->  Sort ' in text:
+                issues.append(f"sort: {text}")
+    return issues
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the query shapes issued by the views and admin, flagging sequential scans and temp sorts."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sql",
+            action="store_true",
+            help="Print the SQL of each query shape as well.",
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        flagged = 0
+
+        for label, queryset in self._query_shapes():
+            plan = queryset.explain()
+            issues = find_problems(vendor, plan)
+
+            style = self.style.WARNING if issues else self.style.SUCCESS
+            self.stdout.write(style(f"== {label}"))
+            if options["sql"]:
+                self.stdout.write(f"   SQL: {queryset.query}")
+            for line in plan.splitlines():
+                self.stdout.write(f"   {line}")
+            for issue in issues:
+                self.stdout.write(self.style.WARNING(f"   ! {issue}"))
+            if issues:
+                flagged += 1
+
+        summary = f"{flagged} query shape(s) flagged on {vendor}"
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
+
+    def _query_shapes(self):
+        """views.py / admin.py が発行するクエリの形（値は既存データから代表値を拾う）"""
+        problem = Problem.objects.order_by('pk').first()
+        user_id = problem.user_id if problem else (User.objects.values_list('pk', flat=True).first() or 0)
+        tag_id = Tag.objects.values_list('pk', flat=True).first() or 0
+        grade_id = Grade.objects.values_list('pk', flat=True).first() or 0
+        subject_id = Subject.objects.values_list('pk', flat=True).first() or 0
+
+        problems = Problem.objects.filter(user_id=user_id).order_by('-created_at')
+        return [
+            # ProblemListView
+            ("problem_list", problems[:12]),
+            ("problem_list ?tag=", problems.filter(tags__id=tag_id)[:12]),
+            ("problem_list sidebar tags", Tag.objects.filter(problems__user_id=user_id).distinct()),
+            # TagArchiveView
+            ("tag_archive", problems.filter(tags=tag_id)[:12]),
+            # quiz_view（quiz.py）
+            ("quiz pick", problems.filter(random_key__gte=0.5).order_by('random_key')[:1]),
+            # ProblemDetailView
+            ("problem_detail tags", Tag.objects.filter(problems__id=problem.pk if problem else 0)),
+            # ProblemCreateView / ProblemUpdateView
+            ("problem_form tags_for_grade", Tag.objects.filter(grade_id=grade_id).order_by('name')),
+            # 学年・科目・単元 API
+            ("api tags_by_grade", Tag.objects.filter(grade_id=grade_id).order_by('subject', 'order', 'name')),
+            ("api tags_by_subject", Tag.objects.filter(subject_id=subject_id).order_by('order', 'name')),
+            ("api subjects_by_grade", Subject.objects.filter(grade_id=grade_id).order_by('order', 'name')),
+            # 問題 API の差分同期（api.problem_sync）
+            ("api problem_sync changed", Problem.objects.filter(user_id=user_id, updated_at__gt=timezone.now()).order_by('updated_at', 'id')[:101]),
+            ("api problem_sync deleted", ProblemTombstone.objects.filter(user_id=user_id, deleted_at__gt=timezone.now()).order_by('deleted_at', 'id')[:101]),
+            # signup_view（CustomUserCreationForm.clean_email）
+            ("signup email check", User.objects.filter(email='advisor@example.com')),
+            # QuestionAdmin
+            ("admin question list", Question.objects.order_by('-created_at')[:100]),
+            ("admin question triage", Question.objects.inbox().order_by('-created_at', '-id')[:51]),
+            # ProblemAdmin
+            ("admin problem list", Problem.objects.order_by('-created_at')[:25]),
+        ]
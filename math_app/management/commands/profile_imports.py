@@ -0,0 +1,133 @@
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# サブプロセスで実行する計測対象のスクリプト
+# wsgi: ワーカー起動時の読み込み / それ以外: 管理コマンド起動時の読み込み（handle は実行しない）
+WSGI_SCRIPT = "import math_project.wsgi"
+
+COMMAND_SCRIPT = """
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'math_project.settings')
+import django
+django.setup()
+from django.core import checks
+from django.core.management import get_commands, load_command_class
+name = {name!r}
+command = load_command_class(get_commands()[name], name)
+if command.requires_system_checks:
+    checks.run_checks(include_deployment_checks=False)
+"""
+
+
+class ImportNode:
+    def __init__(self, name, self_us, cumulative_us):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children = []
+
+
+def parse_importtime(output):
+    """-X importtime の出力（子 → 親の順）を木構造に組み立てる"""
+    pending = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_part, cumulative_part, raw_name = line[len("import time:"):].split("|", 2)
+        if not self_part.strip().isdigit():
+            continue  # ヘッダー行
+        # 名前の前の空白（区切りの 1 つを除く）が 2 つ増えるごとに一段深い
+        depth = (len(raw_name) - len(raw_name.lstrip(" ")) - 1) // 2
+        node = ImportNode(raw_name.strip(), int(self_part), int(cumulative_part))
+
+        # 直前に出力された一段深いノードがこのモジュールの子
+        while pending and pending[-1][0] > depth:
+            node.children.append(pending.pop()[1])
+        node.children.reverse()
+        pending.append((depth, node))
+    return [node for _, node in pending]
+
+
+class Command(BaseCommand):
+    help = "Report a per-module import-time tree for worker boot or a management command's startup."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "target",
+            nargs="?",
+            default="wsgi",
+            help="'wsgi' (worker boot, default) or the name of a management command to profile.",
+        )
+        parser.add_argument(
+            "--min-ms",
+            type=float,
+            default=1.0,
+            help="Hide modules whose cumulative import time is below this threshold.",
+        )
+        parser.add_argument(
+            "--depth",
+            type=int,
+            default=3,
+            help="Maximum depth of the tree to print.",
+        )
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        if target == "wsgi":
+            script = WSGI_SCRIPT
+        else:
+            script = COMMAND_SCRIPT.format(name=target)
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Profiling '{target}' failed:\n{result.stderr[-2000:]}")
+
+        roots = parse_importtime(result.stderr)
+        min_us = options["min_ms"] * 1000
+        total_us = sum(node.cumulative_us for node in roots)
+
+        self.stdout.write(f"Import tree for '{target}' (cumulative / self, >= {options['min_ms']} ms)")
+        for node in sorted(roots, key=lambda n: n.cumulative_us, reverse=True):
+            self._write_node(node, 0, options["depth"], min_us)
+
+        # 自身の読み込み時間をトップレベルのパッケージ別に集計（どの依存が起動時間を占めているか）
+        packages = defaultdict(int)
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            packages[node.name.split(".")[0]] += node.self_us
+            stack.extend(node.children)
+
+        self.stdout.write("")
+        self.stdout.write("Self time by top-level package:")
+        for package, micros in sorted(packages.items(), key=lambda item: item[1], reverse=True):
+            if micros < min_us:
+                continue
+            share = micros / total_us * 100 if total_us else 0
+            self.stdout.write(f"  {package:<30} {micros / 1000:8.1f} ms  {share:5.1f}%")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Total import time: {total_us / 1000:.1f} ms")
+        )
+
+    def _write_node(self, node, depth, max_depth, min_us):
+        if depth >= max_depth or node.cumulative_us < min_us:
+            return
+        indent = "  " * depth
+        self.stdout.write(
+            f"{indent}{node.name:<{50 - len(indent)}} "
+            f"{node.cumulative_us / 1000:8.1f} ms {node.self_us / 1000:8.1f} ms"
+        )
+        for child in sorted(node.children, key=lambda n: n.cumulative_us, reverse=True):
+            self._write_node(child, depth + 1, max_depth, min_us)
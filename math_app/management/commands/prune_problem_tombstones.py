@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from math_app.api import TOMBSTONE_RETENTION_DAYS
+from math_app.models import ProblemTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete problem tombstones older than the sync retention period (run periodically from cron)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones newer than this many days (clients with older cursors must resync).",
+        )
+
+    def handle(self, *args, **options):
+        # api.TOMBSTONE_RETENTION_DAYS より短くすると、期限内の cursor でも削除を取りこぼす
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted, _ = ProblemTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstone(s) older than {cutoff:%Y-%m-%d}"))
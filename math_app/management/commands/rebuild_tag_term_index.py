@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from math_app.tag_suggest import rebuild_term_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the term/tag co-occurrence index used for tag suggestions on the problem form."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of problems read per batch.",
+        )
+
+    def handle(self, *args, **options):
+        processed = rebuild_term_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {processed} problem(s)"))
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from math_app.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user statistics rollups (UserStat) from problems and their tags."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            default=[],
+            help="Username to rebuild (repeatable). Defaults to every user.",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username__in=options["user"])
+
+        # 1 ユーザーずつ置き換えるので、途中で止めても作り直したユーザーの分は正しい
+        rebuilt = 0
+        for user_id in users.values_list("pk", flat=True).iterator():
+            rebuild_user_stats([user_id])
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics for {rebuilt} user(s)"))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from math_app.markup import make_excerpt, render_hint
+from math_app.models import Problem
+from math_app.watermarks import bump_all_watermarks
+
+
+class Command(BaseCommand):
+    help = "Pre-render the HTML and list excerpt of hint texts for existing problems (hint_*_html, hint_excerpt)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every problem (e.g. after changing the markup rules), not only missing HTML.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of problems rendered and written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        fields = Problem.HINT_HTML_FIELDS
+        problems = Problem.objects.order_by("pk")
+        if not options["all"]:
+            # 本文があるのに HTML がないものだけ
+            missing = Q()
+            for source, target in fields.items():
+                missing |= ~Q(**{source: ""}) & Q(**{target: ""})
+            problems = problems.filter(missing)
+
+        # bulk_update で書き込むので、updated_at やシグナルには影響しない（ページの ETag は最後にまとめて変える）
+        batch = []
+        rendered = 0
+        update_fields = [*fields.values(), "hint_excerpt"]
+        for problem in problems.only("pk", *fields.keys(), *update_fields).iterator(chunk_size=options["batch_size"]):
+            for source, target in fields.items():
+                setattr(problem, target, render_hint(getattr(problem, source)))
+            problem.hint_excerpt = make_excerpt(*(getattr(problem, source) for source in fields))
+            batch.append(problem)
+            if len(batch) >= options["batch_size"]:
+                Problem.objects.bulk_update(batch, update_fields)
+                rendered += len(batch)
+                batch = []
+        if batch:
+            Problem.objects.bulk_update(batch, update_fields)
+            rendered += len(batch)
+        if rendered:
+            bump_all_watermarks()
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered hint HTML for {rendered} problem(s)"))
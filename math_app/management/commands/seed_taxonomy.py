@@ -9,6 +9,8 @@ from math_app.models import Grade, Subject, Tag
 
 class Command(BaseCommand):
     help = "Seed Grade/Subject/Tag data from a fixture JSON using get_or_create."
+    # cron から短時間で呼ばれるため、URLconf・admin・views を読み込むシステムチェックは省く
+    requires_system_checks = []
 
     def add_arguments(self, parser):
         parser.add_argument(
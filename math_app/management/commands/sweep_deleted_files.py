@@ -0,0 +1,46 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from math_app.models import PendingFileDeletion
+
+
+class Command(BaseCommand):
+    help = "Delete files queued by bulk deletions (e.g. question attachments) from storage (run periodically from cron)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of queued files removed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        removed = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                PendingFileDeletion.objects
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "name")[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            done = []
+            for pk, name in batch:
+                try:
+                    default_storage.delete(name)
+                except OSError as e:
+                    # 残しておき、次回の実行で再試行する
+                    failed += 1
+                    self.stderr.write(f"Could not delete {name}: {e}")
+                    continue
+                done.append(pk)
+            PendingFileDeletion.objects.filter(pk__in=done).delete()
+            removed += len(done)
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {removed} file(s), {failed} failed"))
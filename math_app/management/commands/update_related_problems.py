@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from math_app.models import Problem
+from math_app.related import update_related
+
+
+class Command(BaseCommand):
+    help = "Recompute the top-k related problems for problems whose tags changed (run periodically from cron)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Mark every problem for recomputation first (full rebuild).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of pending problems processed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            Problem.objects.update(related_dirty=True)
+
+        processed, updated = update_related(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Related problems updated: {processed} pending, {updated} ranking(s) rewritten"
+            )
+        )
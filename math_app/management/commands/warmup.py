@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from math_app.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "Import views, compile templates, resolve URLs and open DB connections and read the taxonomy tables once, reporting per-step timings."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--skip-db",
+            action="store_true",
+            help="Skip the steps that open database connections.",
+        )
+
+    def handle(self, *args, **options):
+        timings = warm_up(include_db=not options["skip_db"])
+
+        total = 0.0
+        for name, elapsed, detail in timings:
+            total += elapsed
+            self.stdout.write(f"{name:<10} {elapsed * 1000:8.1f} ms  {detail}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Warm-up complete: {total * 1000:.1f} ms")
+        )
@@ -0,0 +1,88 @@
+# ヒントの軽量マークアップ → HTML（保存時に 1 回だけ変換し、Problem.hint_*_html に保存する）
+#
+# - 空行で段落（<p>）、段落内の改行は <br>
+# - 行頭の「- 」「* 」「・」は箇条書き（<ul>）、「1. 」「1) 」は番号付き（<ol>）
+# - 数式（$...$、$$...$$、\(...\)、\[...\]）は中身をエスケープするだけで残し、
+#   表示時に MathJax が組版する（数式の中の改行・行頭記号はマークアップとして扱わない）
+# 入力はすべてエスケープするので、出力に含まれるタグはここで作ったものだけ。
+import re
+
+from django.utils.html import escape
+
+_MATH = re.compile(r'\$\$.+?\$\$|\\\[.+?\\\]|\\\(.+?\\\)|\$[^$\n]+?\$', re.DOTALL)
+# 退避した数式の目印（私用領域の文字。入力に含まれていれば先に取り除く）
+_PLACEHOLDER = re.compile(r'\ue000(\d+)\ue001')
+_PLACEHOLDER_CHARS = re.compile('[\ue000\ue001]')
+_BULLET = re.compile(r'^\s*(?:[-*]|・)\s+(.*)$')
+_NUMBERED = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+
+
+def _restore(text, math):
+    return _PLACEHOLDER.sub(lambda match: math[int(match.group(1))], text)
+
+
+def render_hint(text):
+    """ヒントの本文を HTML に変換する（空なら空文字列）"""
+    if not text or not text.strip():
+        return ''
+
+    # 数式を退避してからマークアップを解釈する
+    math = []
+
+    def stash(match):
+        math.append(escape(match.group(0)))
+        return f'\ue000{len(math) - 1}\ue001'
+
+    text = _PLACEHOLDER_CHARS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    source = _MATH.sub(stash, text)
+
+    html = []
+    for block in re.split(r'\n\s*\n', source.strip()):
+        html.extend(_render_block(block.split('\n')))
+    return _restore(''.join(html), math)
+
+
+def _render_block(lines):
+    """段落 1 つ分。箇条書きの行と普通の行が混ざっていれば、まとまりごとに分ける"""
+    parts = []
+    kind = None
+    items = []
+
+    def flush():
+        if not items:
+            return
+        if kind == 'p':
+            parts.append('<p>' + '<br>'.join(items) + '</p>')
+        else:
+            parts.append(f'<{kind}>' + ''.join(f'<li>{item}</li>' for item in items) + f'</{kind}>')
+
+    for line in lines:
+        bullet = _BULLET.match(line)
+        numbered = None if bullet else _NUMBERED.match(line)
+        if bullet:
+            line_kind, content = 'ul', bullet.group(1)
+        elif numbered:
+            line_kind, content = 'ol', numbered.group(1)
+        else:
+            line_kind, content = 'p', line.strip()
+        if line_kind != kind:
+            flush()
+            kind, items = line_kind, []
+        items.append(escape(content))
+    flush()
+    return parts
+
+
+# 一覧カードに出すヒントの抜粋の長さ（Problem.hint_excerpt）
+EXCERPT_LENGTH = 80
+
+
+def make_excerpt(*texts):
+    """最初の空でないヒントを 1 行にまとめ、EXCERPT_LENGTH 文字に切り詰める"""
+    for text in texts:
+        line = ' '.join((text or '').split())
+        if line:
+            if len(line) > EXCERPT_LENGTH:
+                return line[:EXCERPT_LENGTH - 1] + '…'
+            return line
+    return ''
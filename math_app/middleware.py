@@ -0,0 +1,115 @@
+# ミドルウェア
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.http import HttpResponse
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+
+from .db import activate_replica_reads, deactivate_replica_reads
+from .watermarks import has_pending_messages
+
+# 書き込み直後の読み取りをプライマリに固定するための Cookie
+REPLICA_PIN_COOKIE = 'db_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    レプリカ読み取り可のビューでは、安全なリクエストの間だけレプリカを有効にする。
+    書き込み（POST など）の後は REPLICA_PIN_SECONDS の間プライマリに固定する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        token = getattr(request, '_replica_token', None)
+        if token is not None:
+            deactivate_replica_reads(token)
+
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Strict',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.REPLICA_DATABASES or request.method not in SAFE_METHODS:
+            return None
+        if REPLICA_PIN_COOKIE in request.COOKIES:
+            return None
+
+        view = getattr(view_func, 'view_class', view_func)
+        if getattr(view, 'use_replica', False):
+            request._replica_token = activate_replica_reads()
+        return None
+
+
+def is_prefetch(request):
+    """
+    ブラウザの先読み（speculation rules・<link rel="prefetch">）によるリクエストか
+    Chromium は Sec-Purpose: prefetch（prerender なら prefetch;prerender）、Firefox は Purpose / X-Moz を送る
+    """
+    if 'prefetch' in request.headers.get('Sec-Purpose', ''):
+        return True
+    return 'prefetch' in (request.headers.get('Purpose', ''), request.headers.get('X-Moz', ''))
+
+
+class PrefetchSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware の代わりに使う。先読みではセッションを保存しない
+    （SESSION_SAVE_EVERY_REQUEST でも、開かれないかもしれないページのために UPDATE しない）
+    """
+
+    def process_response(self, request, response):
+        if is_prefetch(request):
+            return response
+        return super().process_response(request, response)
+
+
+class PrefetchMiddleware:
+    """
+    先読みで表示待ちのメッセージを読んでしまわないよう、そのときは 425 Too Early で断る
+    （2xx 以外ならブラウザは先読みを捨て、実際に開いたときに普通に読み込む。5xx はエラーとして記録されるので使わない）
+    MessageMiddleware より後に置く
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS or not is_prefetch(request):
+            return None
+        if has_pending_messages(request):
+            response = HttpResponse(status=425)
+            add_never_cache_headers(response)
+            return response
+        return None
+
+
+class MessageCacheMiddleware:
+    """
+    フラッシュメッセージを表示したページは Cache-Control: no-store にする
+    （Service Worker やブラウザが保存した版から「削除しました」などがもう一度出ないように）
+    MessageMiddleware より後に置く
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        storage = getattr(request, '_messages', None)
+        if storage is not None and storage.used:
+            patch_cache_control(response, no_store=True)
+        return response
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0009_question'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['-created_at'], name='problem_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at'], name='question_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['is_replied', '-created_at'], name='question_replied_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['grade', 'order', 'name'], name='subject_grade_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['grade', 'subject', 'order', 'name'], name='tag_grade_subject_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['subject', 'order', 'name'], name='tag_subject_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['grade', 'name'], name='tag_grade_name_idx'),
+        ),
+        # Problem.tags の中間テーブル：単元 → 問題の向きで引くための複合インデックス
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS math_app_problem_tags_tag_problem_idx ON math_app_problem_tags (tag_id, problem_id)',
+            reverse_sql='DROP INDEX IF EXISTS math_app_problem_tags_tag_problem_idx',
+        ),
+        # サインアップ時のメールアドレス重複チェック（auth_user.email）
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS math_app_auth_user_email_idx ON auth_user (email)',
+            reverse_sql='DROP INDEX IF EXISTS math_app_auth_user_email_idx',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:52
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_tag_snapshots(apps, schema_editor):
+    """既存の問題のスナップショットを中間テーブルから作る"""
+    Problem = apps.get_model('math_app', 'Problem')
+    through = Problem.tags.through
+
+    snapshots = defaultdict(list)
+    rows = (
+        through.objects
+        .order_by('tag__grade__order', 'tag__order', 'tag__name')
+        .values_list('problem_id', 'tag_id', 'tag__name')
+        .iterator()
+    )
+    for problem_id, tag_id, tag_name in rows:
+        snapshots[problem_id].append({'id': tag_id, 'name': tag_name})
+
+    problems = [Problem(pk=pk, tag_snapshot=snapshot) for pk, snapshot in snapshots.items()]
+    Problem.objects.bulk_update(problems, ['tag_snapshot'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0010_indexes_for_query_shapes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='tag_snapshot',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='単元タグ（表示用）'),
+        ),
+        migrations.RunPython(fill_tag_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:52
+
+import random
+
+import math_app.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_random_keys(apps, schema_editor):
+    """AddField では既存行がすべて同じ値になるため、1 行ずつ振り直す"""
+    Problem = apps.get_model('math_app', 'Problem')
+    problems = list(Problem.objects.only('pk'))
+    for problem in problems:
+        problem.random_key = random.random()
+    Problem.objects.bulk_update(problems, ['random_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0011_problem_tag_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='random_key',
+            field=models.FloatField(default=math_app.models.generate_random_key, editable=False, verbose_name='出題用の乱数キー'),
+        ),
+        migrations.RunPython(assign_random_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['user', 'random_key'], name='problem_user_random_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0012_problem_random_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProblem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='類似度')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='順位')),
+            ],
+            options={
+                'verbose_name': '関連する問題',
+                'verbose_name_plural': '関連する問題',
+                'ordering': ['problem_id', 'rank'],
+            },
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='related_dirty',
+            field=models.BooleanField(default=True, editable=False, verbose_name='関連問題の再計算待ち'),
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(condition=models.Q(('related_dirty', True)), fields=['user'], name='problem_related_dirty_idx'),
+        ),
+        migrations.AddField(
+            model_name='relatedproblem',
+            name='problem',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='math_app.problem', verbose_name='問題'),
+        ),
+        migrations.AddField(
+            model_name='relatedproblem',
+            name='related',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='math_app.problem', verbose_name='関連する問題'),
+        ),
+        migrations.AddConstraint(
+            model_name='relatedproblem',
+            constraint=models.UniqueConstraint(fields=('problem', 'rank'), name='related_problem_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0013_related_problems'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemSignature',
+            fields=[
+                ('problem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='math_app.problem', verbose_name='問題')),
+                ('minhash', models.BinaryField(verbose_name='MinHash 署名')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '問題の署名',
+                'verbose_name_plural': '問題の署名',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProblemLSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='バケット')),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='math_app.problem', verbose_name='問題')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'LSH バケット',
+                'verbose_name_plural': 'LSH バケット',
+                'indexes': [models.Index(fields=['user', 'bucket'], name='lsh_user_bucket_idx')],
+            },
+        ),
+    ]
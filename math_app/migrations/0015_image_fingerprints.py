@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0014_problem_signatures'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=30, verbose_name='フィールド')),
+                ('name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('dhash', models.BigIntegerField(verbose_name='dHash')),
+                ('block0', models.IntegerField(verbose_name='ブロック0')),
+                ('block1', models.IntegerField(verbose_name='ブロック1')),
+                ('block2', models.IntegerField(verbose_name='ブロック2')),
+                ('block3', models.IntegerField(verbose_name='ブロック3')),
+                ('size', models.BigIntegerField(default=0, verbose_name='ファイルサイズ（バイト）')),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_fingerprints', to='math_app.problem', verbose_name='問題')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '画像の指紋',
+                'verbose_name_plural': '画像の指紋',
+                'indexes': [models.Index(fields=['user', 'block0'], name='image_fp_block0_idx'), models.Index(fields=['user', 'block1'], name='image_fp_block1_idx'), models.Index(fields=['user', 'block2'], name='image_fp_block2_idx'), models.Index(fields=['user', 'block3'], name='image_fp_block3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('problem', 'field'), name='image_fingerprint_field_uniq')],
+            },
+        ),
+    ]
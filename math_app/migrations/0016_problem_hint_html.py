@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0015_image_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='hint_approach_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='方針（HTML）'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='hint_formula_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='公式（HTML）'),
+        ),
+        migrations.AddField(
+            model_name='problem',
+            name='hint_technique_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='コツ（HTML）'),
+        ),
+    ]
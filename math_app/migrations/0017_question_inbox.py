@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0016_problem_hint_html'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFileDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+            ],
+            options={
+                'verbose_name': '削除待ちのファイル',
+                'verbose_name_plural': '削除待ちのファイル',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_replied_created_idx',
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='is_archived',
+            field=models.BooleanField(default=False, verbose_name='アーカイブ済み'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('is_archived', False), ('is_replied', False)), fields=['-created_at', '-id'], name='question_inbox_idx'),
+        ),
+    ]
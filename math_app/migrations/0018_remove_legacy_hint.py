@@ -0,0 +1,145 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:02
+
+import re
+
+from django.db import migrations
+from django.utils import timezone
+from django.utils.html import escape
+
+# このマイグレーションの処理はアプリのモジュールに依存させず、ここに固定する
+# （markup.py / legacy_hints.py を後から変えても、過去のマイグレーションの結果は変わらない）
+
+# Hint.stage_type → Problem のフィールド
+STAGE_FIELDS = {
+    0: 'hint_approach',
+    1: 'hint_formula',
+    2: 'hint_technique',
+}
+BATCH_SIZE = 500
+
+_MATH = re.compile(r'\$\$.+?\$\$|\\\[.+?\\\]|\\\(.+?\\\)|\$[^$\n]+?\$', re.DOTALL)
+_PLACEHOLDER = re.compile(r'\ue000(\d+)\ue001')
+_PLACEHOLDER_CHARS = re.compile('[\ue000\ue001]')
+_BULLET = re.compile(r'^\s*(?:[-*]|・)\s+(.*)$')
+_NUMBERED = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+
+
+def render_hint(text):
+    """ヒントの本文を HTML に変換する（0018 の時点の markup.render_hint）"""
+    if not text or not text.strip():
+        return ''
+
+    math = []
+
+    def stash(match):
+        math.append(escape(match.group(0)))
+        return f'\ue000{len(math) - 1}\ue001'
+
+    text = _PLACEHOLDER_CHARS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    source = _MATH.sub(stash, text)
+
+    html = []
+    for block in re.split(r'\n\s*\n', source.strip()):
+        parts = []
+        kind = None
+        items = []
+
+        def flush():
+            if not items:
+                return
+            if kind == 'p':
+                parts.append('<p>' + '<br>'.join(items) + '</p>')
+            else:
+                parts.append(f'<{kind}>' + ''.join(f'<li>{item}</li>' for item in items) + f'</{kind}>')
+
+        for line in block.split('\n'):
+            bullet = _BULLET.match(line)
+            numbered = None if bullet else _NUMBERED.match(line)
+            if bullet:
+                line_kind, content = 'ul', bullet.group(1)
+            elif numbered:
+                line_kind, content = 'ol', numbered.group(1)
+            else:
+                line_kind, content = 'p', line.strip()
+            if line_kind != kind:
+                flush()
+                kind, items = line_kind, []
+            items.append(escape(content))
+        flush()
+        html.extend(parts)
+    return _PLACEHOLDER.sub(lambda match: math[int(match.group(1))], ''.join(html))
+
+
+def merge_text(current, addition):
+    """既存のヒントに追記する（同じ内容がすでにあれば何もしない）"""
+    addition = addition.strip()
+    if not addition or addition in current:
+        return current
+    if not current.strip():
+        return addition
+    return f"{current.rstrip()}\n\n{addition}"
+
+
+def fold_remaining_hints(apps, schema_editor):
+    """
+    fold_legacy_hints コマンドで移し終えていない Hint を Problem.hint_* に畳み込む
+    （件数が多い場合は、先にコマンドで少しずつ移しておくとこの処理は一瞬で終わる）
+    書き換えた問題は updated_at も進める（API の ETag・差分同期が変更として扱う）
+    """
+    Hint = apps.get_model('math_app', 'Hint')
+    Problem = apps.get_model('math_app', 'Problem')
+    fields = list(STAGE_FIELDS.values())
+    update_fields = fields + [f'{field}_html' for field in fields] + ['updated_at']
+
+    while True:
+        problem_ids = list(
+            Hint.objects
+            .order_by('problem_id')
+            .values_list('problem_id', flat=True)
+            .distinct()[:BATCH_SIZE]
+        )
+        if not problem_ids:
+            break
+        problems = {
+            problem.pk: problem
+            for problem in Problem.objects.filter(pk__in=problem_ids).only('pk', *fields)
+        }
+        hints = (
+            Hint.objects
+            .filter(problem_id__in=problem_ids)
+            .order_by('problem_id', 'stage_type', 'created_at', 'pk')
+            .values_list('problem_id', 'stage_type', 'content')
+        )
+        changed = set()
+        for problem_id, stage_type, content in hints:
+            field = STAGE_FIELDS.get(stage_type)
+            problem = problems.get(problem_id)
+            if field is None or problem is None:
+                continue
+            merged = merge_text(getattr(problem, field), content)
+            if merged != getattr(problem, field):
+                setattr(problem, field, merged)
+                changed.add(problem_id)
+
+        now = timezone.now()
+        updated = [problems[problem_id] for problem_id in sorted(changed)]
+        for problem in updated:
+            for field in fields:
+                setattr(problem, f'{field}_html', render_hint(getattr(problem, field)))
+            problem.updated_at = now
+        Problem.objects.bulk_update(updated, update_fields)
+        Hint.objects.filter(problem_id__in=problem_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0017_question_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_remaining_hints, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='Hint',
+        ),
+    ]
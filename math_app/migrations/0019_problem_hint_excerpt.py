@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:03
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# 抜粋の作り方はアプリのモジュールに依存させず、ここに固定する（0019 の時点の markup.make_excerpt）
+EXCERPT_LENGTH = 80
+
+
+def make_excerpt(*texts):
+    """最初の空でないヒントを 1 行にまとめ、EXCERPT_LENGTH 文字に切り詰める"""
+    for text in texts:
+        line = ' '.join((text or '').split())
+        if line:
+            if len(line) > EXCERPT_LENGTH:
+                return line[:EXCERPT_LENGTH - 1] + '…'
+            return line
+    return ''
+
+
+def fill_hint_excerpts(apps, schema_editor):
+    """
+    既存の問題の抜粋をヒント本文から作る
+    抜粋を入れた問題は updated_at も進める（API の ETag・差分同期が変更として扱う）
+    """
+    Problem = apps.get_model('math_app', 'Problem')
+    now = timezone.now()
+    batch = []
+    rows = Problem.objects.only('pk', 'hint_approach', 'hint_formula', 'hint_technique').iterator(chunk_size=500)
+    for problem in rows:
+        problem.hint_excerpt = make_excerpt(problem.hint_approach, problem.hint_formula, problem.hint_technique)
+        if problem.hint_excerpt:
+            problem.updated_at = now
+            batch.append(problem)
+        if len(batch) >= 500:
+            Problem.objects.bulk_update(batch, ['hint_excerpt', 'updated_at'])
+            batch = []
+    if batch:
+        Problem.objects.bulk_update(batch, ['hint_excerpt', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0018_remove_legacy_hint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='hint_excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='ヒントの抜粋'),
+        ),
+        migrations.RunPython(fill_hint_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0019_problem_hint_excerpt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('problem_id', models.BigIntegerField(verbose_name='問題ID')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='削除日時')),
+            ],
+            options={
+                'verbose_name': '削除された問題',
+                'verbose_name_plural': '削除された問題',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='problem',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='problem_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='problemtombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='problem_tombstones', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー'),
+        ),
+        migrations.AddIndex(
+            model_name='problemtombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('math_app', '0020_problem_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserWatermark',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='watermark', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('version', models.BigIntegerField(default=0, verbose_name='バージョン')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最終変更日時')),
+            ],
+            options={
+                'verbose_name': '変更の目印',
+                'verbose_name_plural': '変更の目印',
+            },
+        ),
+    ]
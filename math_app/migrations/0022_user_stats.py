@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:12
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# 集計の仕方はアプリのモジュールに依存させず、ここに固定する（0022 の時点の stats.compute_user_stats）
+HINT_FIELDS = ('hint_approach', 'hint_formula', 'hint_technique')
+NO_GRADE = 'none'
+
+
+def compute_user_stats(user_id, Problem, Tag):
+    """1 ユーザー分の {(観点, キー): 問題数}"""
+    counts = Counter()
+    problem_ids = []
+    problems = (
+        Problem.objects
+        .filter(user_id=user_id)
+        .values_list('pk', 'grade_id', 'created_at', *HINT_FIELDS)
+        .iterator(chunk_size=500)
+    )
+    for pk, grade_id, created_at, *hints in problems:
+        problem_ids.append(pk)
+        day = timezone.localtime(created_at).date()
+        counts[('total', '')] += 1
+        counts[('grade', str(grade_id) if grade_id else NO_GRADE)] += 1
+        counts[('week', (day - timedelta(days=day.weekday())).isoformat())] += 1
+        for field, text in zip(HINT_FIELDS, hints):
+            if not (text or '').strip():
+                counts[('missing_hint', field)] += 1
+
+    tags = {problem_id: set() for problem_id in problem_ids}
+    rows = Problem.tags.through.objects.filter(problem_id__in=problem_ids).values_list('problem_id', 'tag_id')
+    for problem_id, tag_id in rows:
+        tags[problem_id].add(tag_id)
+    subject_of = dict(Tag.objects.filter(pk__in=set().union(set(), *tags.values())).values_list('pk', 'subject_id'))
+    for tag_ids in tags.values():
+        counts.update(('tag', str(tag_id)) for tag_id in tag_ids)
+        # 科目は同じ科目の単元がいくつあっても 1 問と数える
+        subjects = {subject_of[tag_id] for tag_id in tag_ids if subject_of.get(tag_id)}
+        counts.update(('subject', str(subject_id)) for subject_id in subjects)
+    return counts
+
+
+def fill_user_stats(apps, schema_editor):
+    """既存の問題から全ユーザー分の統計を作る"""
+    Problem = apps.get_model('math_app', 'Problem')
+    Tag = apps.get_model('math_app', 'Tag')
+    UserStat = apps.get_model('math_app', 'UserStat')
+    user_ids = Problem.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    for user_id in user_ids:
+        counts = compute_user_stats(user_id, Problem, Tag)
+        UserStat.objects.bulk_create([
+            UserStat(user_id=user_id, dimension=dimension, key=key, count=count)
+            for (dimension, key), count in counts.items() if count > 0
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0021_user_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', '総数'), ('grade', '学年'), ('subject', '科目'), ('tag', '単元'), ('week', '登録週'), ('missing_hint', '未記入のヒント')], max_length=20, verbose_name='観点')),
+                ('key', models.CharField(blank=True, max_length=50, verbose_name='キー')),
+                ('count', models.IntegerField(default=0, verbose_name='問題数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '学習統計',
+                'verbose_name_plural': '学習統計',
+                'constraints': [models.UniqueConstraint(fields=('user', 'dimension', 'key'), name='user_stat_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
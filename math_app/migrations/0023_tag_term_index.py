@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:15
+
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+
+# 語の取り出し方はアプリのモジュールに依存させず、ここに固定する（0023 の時点の tag_suggest）
+TEXT_FIELDS = ('title', 'hint_approach', 'hint_formula', 'hint_technique')
+GLOBAL_SCOPE = 0
+TOTAL_TAG = 0
+PRIOR_TERM = ''
+MAX_TEXT_LENGTH = 400
+BATCH_SIZE = 500
+
+_IGNORED = re.compile(r'[\s\W_]+')
+_MATH = re.compile(r'\$[^$]*\$|\\\(.*?\\\)|\\\[.*?\\\]', re.DOTALL)
+
+
+def problem_terms(*texts):
+    """タイトル・ヒントから語（文字 bigram）の集合を作る。数式と記号は除く"""
+    text = ' '.join(text or '' for text in texts)
+    text = _MATH.sub(' ', unicodedata.normalize('NFKC', text).casefold())[:MAX_TEXT_LENGTH]
+    terms = set()
+    for chunk in _IGNORED.split(text):
+        if len(chunk) == 1:
+            terms.add(chunk)
+        terms.update(chunk[i:i + 2] for i in range(len(chunk) - 1))
+    return terms
+
+
+def fill_tag_term_index(apps, schema_editor):
+    """既存の問題から索引を作る"""
+    Problem = apps.get_model('math_app', 'Problem')
+    TagTermIndex = apps.get_model('math_app', 'TagTermIndex')
+    counts = Counter()
+    batch = []
+
+    def flush():
+        tags = defaultdict(set)
+        rows = Problem.tags.through.objects.filter(problem_id__in=[row['pk'] for row in batch])
+        for problem_id, tag_id in rows.values_list('problem_id', 'tag_id'):
+            tags[problem_id].add(tag_id)
+        for row in batch:
+            terms = problem_terms(*(row[field] for field in TEXT_FIELDS)) | {PRIOR_TERM}
+            for term in terms:
+                for tag_id in tags[row['pk']] | {TOTAL_TAG}:
+                    counts[(row['user_id'], term, tag_id)] += 1
+                    counts[(GLOBAL_SCOPE, term, tag_id)] += 1
+
+    rows = Problem.objects.order_by('pk').values('pk', 'user_id', *TEXT_FIELDS).iterator(chunk_size=BATCH_SIZE)
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    TagTermIndex.objects.bulk_create(
+        (TagTermIndex(scope=scope, term=term, tag_id=tag_id, count=count)
+         for (scope, term, tag_id), count in counts.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('math_app', '0022_user_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagTermIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.IntegerField(verbose_name='範囲（ユーザーID、0 は全体）')),
+                ('term', models.CharField(blank=True, max_length=2, verbose_name='語')),
+                ('tag_id', models.IntegerField(verbose_name='単元ID（0 は合計）')),
+                ('count', models.IntegerField(default=0, verbose_name='問題数')),
+            ],
+            options={
+                'verbose_name': '単元タグ候補の索引',
+                'verbose_name_plural': '単元タグ候補の索引',
+                'constraints': [models.UniqueConstraint(fields=('scope', 'term', 'tag_id'), name='tag_term_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_tag_term_index, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+import random
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .markup import make_excerpt, render_hint
+
 # 学年モデル（中1〜高3）
 class Grade(models.Model):
     
@@ -109,6 +113,10 @@ class Subject(models.Model):
         verbose_name = '科目'
         verbose_name_plural = '科目'
         ordering = ['grade', 'order', 'name']
+        indexes = [
+            # subjects_by_grade・既定の並び順
+            models.Index(fields=['grade', 'order', 'name'], name='subject_grade_order_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name}"
@@ -167,11 +175,34 @@ class Tag(models.Model):
         verbose_name_plural = '単元タグ'
         ordering = ['grade', 'order', 'name']
         unique_together = ('name', 'grade')  # 同じ学年内では単元名は一意
+        indexes = [
+            # tags_by_grade
+            models.Index(fields=['grade', 'subject', 'order', 'name'], name='tag_grade_subject_order_idx'),
+            # tags_by_subject
+            models.Index(fields=['subject', 'order', 'name'], name='tag_subject_order_idx'),
+            # 問題フォームの学年別単元一覧（名前順）
+            models.Index(fields=['grade', 'name'], name='tag_grade_name_idx'),
+        ]
     
     def __str__(self):
         return f"{self.grade} - {self.name}"
 
 
+# ランダム出題用キーの既定値（マイグレーションで参照するためモジュール関数にする）
+def generate_random_key():
+    return random.random()
+
+
+class ProblemQuerySet(models.QuerySet):
+    
+    # 一覧カードの表示に使う列（ヒント本文・ヒント画像・HTML は読まない）
+    CARD_FIELDS = ('id', 'user_id', 'title', 'image', 'tag_snapshot', 'hint_excerpt', 'created_at')
+    
+    def for_cards(self):
+        """一覧・単元別アーカイブのカード表示用に、必要な列だけを取得する"""
+        return self.only(*self.CARD_FIELDS)
+
+
 # 問題モデル（メイン）
 class Problem(models.Model):
     
@@ -215,6 +246,13 @@ class Problem(models.Model):
         help_text='問題を解くための方針や方向性を記入してください'
     )
     
+    # 方針を HTML に変換したもの（保存時に markup.py で作る、詳細画面はこれをそのまま出す）
+    hint_approach_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='方針（HTML）'
+    )
+    
     # ヒント1: 指針画像
     hint_approach_image = models.ImageField(
         upload_to='hints/approach/',
@@ -231,6 +269,13 @@ class Problem(models.Model):
         help_text='使用すべき公式や定理を記入してください'
     )
     
+    # 公式を HTML に変換したもの（保存時に markup.py で作る、詳細画面はこれをそのまま出す）
+    hint_formula_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='公式（HTML）'
+    )
+    
     # ヒント2: 公式画像
     hint_formula_image = models.ImageField(
         upload_to='hints/formula/',
@@ -247,6 +292,21 @@ class Problem(models.Model):
         help_text='計算や考え方のコツを記入してください'
     )
     
+    # コツを HTML に変換したもの（保存時に markup.py で作る、詳細画面はこれをそのまま出す）
+    hint_technique_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='コツ（HTML）'
+    )
+    
+    # 一覧カード用のヒントの抜粋（保存時に作る。一覧はヒント本文を読まずにこれだけを読む）
+    hint_excerpt = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='ヒントの抜粋'
+    )
+    
     # ヒント3: 注意点画像
     hint_technique_image = models.ImageField(
         upload_to='hints/technique/',
@@ -264,6 +324,29 @@ class Problem(models.Model):
         help_text='該当する単元タグを選択してください'
     )
     
+    # 単元タグの非正規化スナップショット（一覧・管理画面の表示用、[{"id": 1, "name": "二次関数"}, ...]）
+    # 絞り込みは tags（中間テーブル）を使う。更新は signals.py が行う
+    tag_snapshot = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name='単元タグ（表示用）'
+    )
+    
+    # ランダム出題用のキー（(user, random_key) の索引で ORDER BY RANDOM() を避ける）
+    random_key = models.FloatField(
+        default=generate_random_key,
+        editable=False,
+        verbose_name='出題用の乱数キー'
+    )
+    
+    # 関連する問題（RelatedProblem）の再計算が必要か（related.py のバッチが処理する）
+    related_dirty = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='関連問題の再計算待ち'
+    )
+    
     # 作成日時（自動記録）
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -278,68 +361,277 @@ class Problem(models.Model):
         help_text='問題が最後に更新された日時（自動で更新される）'
     )
     
+    objects = ProblemQuerySet.as_manager()
+    
     class Meta:
         verbose_name = '数学の問題'
         verbose_name_plural = '数学の問題'
         ordering = ['-created_at']  # 最新順
         indexes = [
             models.Index(fields=['user', '-created_at']),
+            # 管理画面の一覧（全ユーザーの最新順）
+            models.Index(fields=['-created_at'], name='problem_created_idx'),
+            # ランダム出題（quiz.py）
+            models.Index(fields=['user', 'random_key'], name='problem_user_random_idx'),
+            # 関連問題の再計算待ち（件数が少ないので部分インデックス）
+            models.Index(
+                fields=['user'],
+                condition=models.Q(related_dirty=True),
+                name='problem_related_dirty_idx',
+            ),
+            # 差分同期（api.problem_sync）：ユーザーごとに (updated_at, id) の順で読む
+            models.Index(fields=['user', 'updated_at', 'id'], name='problem_user_updated_idx'),
         ]
     
+    # 保存時に HTML を作り直すヒント本文 → 変換先のフィールド
+    HINT_HTML_FIELDS = {
+        'hint_approach': 'hint_approach_html',
+        'hint_formula': 'hint_formula_html',
+        'hint_technique': 'hint_technique_html',
+    }
+    
     def __str__(self):
         return f"{self.user.username} - {self.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 保存時に変更されたかを判定するため、読み込んだ時点の値を控えておく
+        instance._original = dict(zip(field_names, values))
+        return instance
+    
+    def render_hint_html(self, fields=None):
+        """本文が変わったヒントだけ HTML（と抜粋）を作り直し、更新したフィールド名を返す"""
+        original = getattr(self, '_original', {})
+        deferred = self.get_deferred_fields()
+        changed = set()
+        for source, target in self.HINT_HTML_FIELDS.items():
+            if source in deferred or (fields is not None and source not in fields):
+                continue
+            text = getattr(self, source)
+            if source in original and original[source] == text and target not in deferred:
+                continue
+            setattr(self, target, render_hint(text))
+            changed.add(target)
+        
+        # 抜粋はヒント 3 つから作るので、どれかが変わったとき（3 つとも読み込み済みのとき）だけ作り直す
+        sources = self.HINT_HTML_FIELDS.keys()
+        if changed and not deferred.intersection(sources):
+            self.hint_excerpt = make_excerpt(*(getattr(self, source) for source in sources))
+            changed.add('hint_excerpt')
+        return changed
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        changed = self.render_hint_html(update_fields)
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | changed
+        super().save(*args, **kwargs)
+        self._original = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in self.get_deferred_fields()
+        }
 
 
-# ヒントモデル（レガシー互換、現在は Problem 内に統合）
-class Hint(models.Model):
+# 関連する問題（単元タグの類似度による上位 k 件、related.py が計算）
+class RelatedProblem(models.Model):
     
-    STAGE_CHOICES = (
-        (0, '方針'),
-        (1, '公式'),
-        (2, 'コツ'),
+    problem = models.ForeignKey(
+        Problem,
+        on_delete=models.CASCADE,
+        related_name='related_entries',
+        verbose_name='問題'
     )
     
-    problem = models.ForeignKey(
+    related = models.ForeignKey(
         Problem,
         on_delete=models.CASCADE,
-        related_name='hints',
+        related_name='+',
         verbose_name='関連する問題'
     )
     
-    stage_type = models.IntegerField(
-        choices=STAGE_CHOICES,
-        default=0,
-        verbose_name='ヒントの種類'
+    score = models.FloatField(
+        verbose_name='類似度'
     )
     
-    content = models.TextField(
-        verbose_name='ヒントの内容'
+    rank = models.PositiveSmallIntegerField(
+        verbose_name='順位'
     )
     
-    created_at = models.DateTimeField(
-        auto_now_add=True,
-        verbose_name='作成日時'
+    class Meta:
+        verbose_name = '関連する問題'
+        verbose_name_plural = '関連する問題'
+        ordering = ['problem_id', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'rank'], name='related_problem_rank_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.problem_id} → {self.related_id} ({self.score:.2f})"
+
+
+# 似た問題の検出用 MinHash 署名（dedup.py）
+class ProblemSignature(models.Model):
+    
+    problem = models.OneToOneField(
+        Problem,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='問題'
+    )
+    
+    # バケット検索をユーザー単位に絞るための非正規化
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ユーザー'
+    )
+    
+    minhash = models.BinaryField(
+        verbose_name='MinHash 署名'
+    )
+    
+    class Meta:
+        verbose_name = '問題の署名'
+        verbose_name_plural = '問題の署名'
+    
+    def __str__(self):
+        return f"Signature of {self.problem_id}"
+
+
+# LSH のバケット（問題ごとにバンド数だけ行がある）
+class ProblemLSHBucket(models.Model):
+    
+    problem = models.ForeignKey(
+        Problem,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='問題'
+    )
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ユーザー'
+    )
+    
+    bucket = models.BigIntegerField(
+        verbose_name='バケット'
     )
     
-    # =========================================================================
-    # メタクラス：モデルの設定
-    # =========================================================================
     class Meta:
-        verbose_name = 'ヒント'
-        verbose_name_plural = 'ヒント'
-        ordering = ['problem', 'stage_type', 'created_at']
+        verbose_name = 'LSH バケット'
+        verbose_name_plural = 'LSH バケット'
+        indexes = [
+            models.Index(fields=['user', 'bucket'], name='lsh_user_bucket_idx'),
+        ]
     
     def __str__(self):
-        stage_name = dict(self.STAGE_CHOICES)[self.stage_type]
-        return f"{self.problem.title} - {stage_name}"
+        return f"{self.problem_id}: {self.bucket}"
+
+
+# 画像の知覚ハッシュ（imagehash.py、問題・ヒント画像 1 枚につき 1 行）
+class ImageFingerprint(models.Model):
+    
+    problem = models.ForeignKey(
+        Problem,
+        on_delete=models.CASCADE,
+        related_name='image_fingerprints',
+        verbose_name='問題'
+    )
+    
+    # 検索をユーザー単位に絞るための非正規化
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ユーザー'
+    )
+    
+    # 画像フィールド名（image, hint_approach_image など）
+    field = models.CharField(
+        max_length=30,
+        verbose_name='フィールド'
+    )
+    
+    # ストレージ上のファイル名（変わっていなければ計算し直さない）
+    name = models.CharField(
+        max_length=255,
+        verbose_name='ファイル名'
+    )
+    
+    # 64bit の dHash（符号付きで保存）
+    dhash = models.BigIntegerField(
+        verbose_name='dHash'
+    )
+    
+    # dHash を 16bit ずつに分けた値（ハミング距離 3 以下なら、どれか 1 つは必ず一致する）
+    block0 = models.IntegerField(verbose_name='ブロック0')
+    block1 = models.IntegerField(verbose_name='ブロック1')
+    block2 = models.IntegerField(verbose_name='ブロック2')
+    block3 = models.IntegerField(verbose_name='ブロック3')
+    
+    size = models.BigIntegerField(
+        default=0,
+        verbose_name='ファイルサイズ（バイト）'
+    )
     
-    def get_stage_type_display_ja(self):
-        return dict(self.STAGE_CHOICES).get(self.stage_type, '不明')
+    class Meta:
+        verbose_name = '画像の指紋'
+        verbose_name_plural = '画像の指紋'
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'field'], name='image_fingerprint_field_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'block0'], name='image_fp_block0_idx'),
+            models.Index(fields=['user', 'block1'], name='image_fp_block1_idx'),
+            models.Index(fields=['user', 'block2'], name='image_fp_block2_idx'),
+            models.Index(fields=['user', 'block3'], name='image_fp_block3_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.dhash & 0xFFFFFFFFFFFFFFFF:016x})"
 
 
 # ==============================================================================
 # 質問モデル
 # ==============================================================================
+class QuestionQuerySet(models.QuerySet):
+    """管理画面の一括操作（いずれも 1 本の UPDATE / DELETE で済ませる）"""
+    
+    def inbox(self):
+        """未返信・未アーカイブ（部分インデックス question_inbox_idx の条件と同じ）"""
+        return self.filter(is_replied=False, is_archived=False)
+    
+    def mark_replied(self):
+        return self.update(is_replied=True)
+    
+    def archive(self):
+        return self.update(is_archived=True)
+    
+    def delete_with_attachments(self):
+        """
+        質問を削除し、添付画像は PendingFileDeletion に積む
+        ファイルの削除は sweep_deleted_files コマンドが後からまとめて行う
+        """
+        with transaction.atomic():
+            names = list(
+                self.exclude(problem_image='')
+                .exclude(problem_image__isnull=True)
+                .values_list('problem_image', flat=True)
+            )
+            PendingFileDeletion.objects.bulk_create(
+                [PendingFileDeletion(name=name) for name in names],
+                batch_size=500,
+            )
+            deleted, _ = self.delete()
+        return deleted
+
+
 class Question(models.Model):
     """
     ユーザーから開発者への質問を管理
@@ -388,10 +680,197 @@ class Question(models.Model):
         verbose_name='返信済み'
     )
     
+    # 対応不要（スパムなど）。未返信の受信箱から外す
+    is_archived = models.BooleanField(
+        default=False,
+        verbose_name='アーカイブ済み'
+    )
+    
+    objects = QuestionQuerySet.as_manager()
+    
     class Meta:
         verbose_name = '質問'
         verbose_name_plural = '質問'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='question_created_idx'),
+            # 未返信の受信箱（管理画面の振り分けビュー）。対象の行だけを持つ部分インデックス
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_replied=False, is_archived=False),
+                name='question_inbox_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.subject}"
+
+
+# 削除待ちのファイル（sweep_deleted_files コマンドがストレージから消す）
+class PendingFileDeletion(models.Model):
+    
+    name = models.CharField(
+        max_length=255,
+        verbose_name='ファイル名'
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='登録日時'
+    )
+    
+    class Meta:
+        verbose_name = '削除待ちのファイル'
+        verbose_name_plural = '削除待ちのファイル'
+    
+    def __str__(self):
+        return self.name
+
+
+# 削除された問題の記録（差分同期でクライアントに削除を伝える。prune_problem_tombstones で古いものを消す）
+class ProblemTombstone(models.Model):
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='problem_tombstones',
+        verbose_name='ユーザー'
+    )
+    
+    # 問題の行はもうないので外部キーにはしない
+    problem_id = models.BigIntegerField(
+        verbose_name='問題ID'
+    )
+    
+    deleted_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='削除日時'
+    )
+    
+    class Meta:
+        verbose_name = '削除された問題'
+        verbose_name_plural = '削除された問題'
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.problem_id}"
+
+
+# ユーザーごとの変更の目印（watermarks.py）。問題・単元タグが変わるたびに version を進め、
+# 問題一覧・詳細ページの ETag に使う
+class UserWatermark(models.Model):
+    
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='watermark',
+        verbose_name='ユーザー'
+    )
+    
+    version = models.BigIntegerField(
+        default=0,
+        verbose_name='バージョン'
+    )
+    
+    changed_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='最終変更日時'
+    )
+    
+    class Meta:
+        verbose_name = '変更の目印'
+        verbose_name_plural = '変更の目印'
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.version}"
+
+
+# 学習統計のロールアップ（stats.py）。(ユーザー, 観点, キー) ごとの問題数を差分で更新する
+class UserStat(models.Model):
+    
+    TOTAL = 'total'
+    GRADE = 'grade'
+    SUBJECT = 'subject'
+    TAG = 'tag'
+    WEEK = 'week'
+    MISSING_HINT = 'missing_hint'
+    DIMENSION_CHOICES = [
+        (TOTAL, '総数'),
+        (GRADE, '学年'),
+        (SUBJECT, '科目'),
+        (TAG, '単元'),
+        (WEEK, '登録週'),
+        (MISSING_HINT, '未記入のヒント'),
+    ]
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='ユーザー'
+    )
+    
+    dimension = models.CharField(
+        max_length=20,
+        choices=DIMENSION_CHOICES,
+        verbose_name='観点'
+    )
+    
+    # 学年・科目・単元の ID、週の月曜日の日付、ヒントのフィールド名など（総数は空文字）
+    key = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name='キー'
+    )
+    
+    count = models.IntegerField(
+        default=0,
+        verbose_name='問題数'
+    )
+    
+    class Meta:
+        verbose_name = '学習統計'
+        verbose_name_plural = '学習統計'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dimension', 'key'], name='user_stat_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.dimension}:{self.key} = {self.count}"
+
+
+# 単元タグ候補の索引（tag_suggest.py）。(範囲, 語, 単元) ごとの問題数
+# 行数が多くなるので外部キーは持たず、ID だけを入れる（範囲 0 = 全ユーザー、単元 0 = 語を含む問題の総数）
+class TagTermIndex(models.Model):
+    
+    scope = models.IntegerField(
+        verbose_name='範囲（ユーザーID、0 は全体）'
+    )
+    
+    term = models.CharField(
+        max_length=2,
+        blank=True,
+        verbose_name='語'
+    )
+    
+    tag_id = models.IntegerField(
+        verbose_name='単元ID（0 は合計）'
+    )
+    
+    count = models.IntegerField(
+        default=0,
+        verbose_name='問題数'
+    )
+    
+    class Meta:
+        verbose_name = '単元タグ候補の索引'
+        verbose_name_plural = '単元タグ候補の索引'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'term', 'tag_id'], name='tag_term_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope}:{self.term} → {self.tag_id} ({self.count})"
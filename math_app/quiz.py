@@ -0,0 +1,43 @@
+# ランダム出題（クイズモード）
+#
+# order_by('?') はユーザーの問題を毎回すべて並べ替えるため使わない。
+# Problem.random_key（(user, random_key) に索引あり）から乱数以上の最初の 1 件を取り、
+# 見つからなければ先頭側に折り返す。どちらも索引の範囲走査 1 回で済む。
+import random
+
+# セッションに保存する出題済み問題 ID のキーと上限
+QUIZ_SEEN_SESSION_KEY = 'quiz_seen_ids'
+QUIZ_SEEN_LIMIT = 200
+
+
+def pick_random_problem(queryset, exclude_ids=()):
+    """queryset から 1 件をランダムに選ぶ（なければ None）"""
+    if exclude_ids:
+        queryset = queryset.exclude(pk__in=exclude_ids)
+    queryset = queryset.order_by('random_key')
+
+    pivot = random.random()
+    problem = queryset.filter(random_key__gte=pivot).first()
+    if problem is None:
+        problem = queryset.filter(random_key__lt=pivot).first()
+    return problem
+
+
+def pick_quiz_problem(request, queryset):
+    """
+    セッション内でまだ出していない問題を選ぶ
+    一巡したら履歴をリセットして最初から出題する（戻り値: (問題, 一巡したか)）
+    """
+    seen_ids = request.session.get(QUIZ_SEEN_SESSION_KEY, [])
+    problem = pick_random_problem(queryset, seen_ids)
+
+    restarted = False
+    if problem is None and seen_ids:
+        seen_ids = []
+        restarted = True
+        problem = pick_random_problem(queryset)
+
+    if problem is not None:
+        seen_ids = (seen_ids + [problem.pk])[-QUIZ_SEEN_LIMIT:]
+    request.session[QUIZ_SEEN_SESSION_KEY] = seen_ids
+    return problem, restarted
@@ -0,0 +1,96 @@
+# トークンバケットによるレート制限（GCRA、状態はキャッシュに保存）
+#
+# キー（スコープ + ユーザー ID または IP）ごとに「理論上の到着時刻」（TAT、ミリ秒）を 1 件だけ持つ。
+# 1 回受け付けるたびに TAT を補充間隔（秒数 / 回数）だけ進め、TAT が今から秒数より先になる
+# リクエストは受け付けない。連続で受け付けるのは「回数」まで、その後は補充間隔ごとに 1 回。
+# 更新は比較して置き換える（CAS）形にする：TAT は増える一方なので、「この TAT から進める」権利を
+# cache.add（Redis でも LocMem でもアトミック）で取れたリクエストだけが書き込む。同時に来たリクエストが
+# 同じ状態から進めて上限を超えることはない。受け付けないリクエストは読むだけで状態を変えない。
+# 上限を超えたリクエストは、フォームの検証・DB・画像保存・メール送信より前に 429 で返す。
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# 同時に更新が競合したときに読み直す回数（超えたら受け付けない）
+MAX_ATTEMPTS = 5
+# 「この TAT から進める」権利の保持秒数（同時に読んだリクエストが書き込むまでの間だけあればよい）
+CLAIM_TIMEOUT = 10
+
+
+def parse_rate(rate):
+    """'5/600' → (容量 5, 補充間隔 120 秒)"""
+    count, _, seconds = rate.partition('/')
+    capacity = int(count)
+    return capacity, float(seconds) / capacity
+
+
+def client_ip(request):
+    if getattr(settings, 'RATE_LIMIT_USE_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def rate_limit_key(scope, request):
+    if request.user.is_authenticated:
+        return f'ratelimit:{scope}:user:{request.user.pk}'
+    return f'ratelimit:{scope}:ip:{client_ip(request)}'
+
+
+def take_token(key, capacity, interval, now=None):
+    """
+    トークンを 1 つ消費する
+    戻り値: (受け付けたか, 受け付けない場合に次のトークンが貯まるまでの秒数)
+    """
+    now_ms = int((time.time() if now is None else now) * 1000)
+    interval_ms = max(1, int(interval * 1000))
+    horizon_ms = capacity * interval_ms
+    for _ in range(MAX_ATTEMPTS):
+        tat = cache.get(key)
+        new_tat = max(tat or 0, now_ms) + interval_ms
+        if new_tat - now_ms > horizon_ms:
+            return False, max(1, math.ceil((new_tat - horizon_ms - now_ms) / 1000))
+        # TAT を過ぎればバケットは満杯なので、それまで保持すれば十分
+        timeout = math.ceil((new_tat - now_ms) / 1000) + 1
+        if tat is None:
+            if cache.add(key, new_tat, timeout):
+                return True, 0
+        elif cache.add(f'{key}:{tat}', 1, CLAIM_TIMEOUT):
+            cache.set(key, new_tat, timeout)
+            return True, 0
+        # 他のリクエストが先に進めた（読み直す）
+    return False, max(1, math.ceil(interval))
+
+
+def rate_limit(scope, methods=('POST',)):
+    """
+    ビューのデコレータ。settings.RATE_LIMITS[scope] の上限を超えたら 429 を返す
+    methods 以外のリクエスト（フォームの表示など）は数えない
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            rate = settings.RATE_LIMITS.get(scope)
+            if not settings.RATE_LIMIT_ENABLED or not rate or request.method not in methods:
+                return view_func(request, *args, **kwargs)
+
+            capacity, interval = parse_rate(rate)
+            key = rate_limit_key(scope, request)
+            allowed, retry_after = take_token(key, capacity, interval)
+            if allowed:
+                return view_func(request, *args, **kwargs)
+
+            logger.debug("rate limited: %s (retry after %ds)", key, retry_after)
+            response = render(request, 'math_app/rate_limited.html', {'retry_after': retry_after}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,136 @@
+# 関連する問題（単元タグの共起による類似度）
+#
+# 問題 × 単元タグの疎行列 A について、A・Aᵀ の行（共通タグ数）を
+# 単元タグ → 問題 の転置リスト（中間テーブルの行）から求め、Jaccard 係数で順位付けする。
+# 再計算するのは related_dirty の問題と、その問題と単元を共有する（または共有していた）問題だけ。
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import Problem, RelatedProblem
+from .watermarks import bump_watermarks
+
+# 1 問あたりに保存する関連問題の件数
+RELATED_TOP_K = 5
+
+
+def mark_related_dirty(problem_ids):
+    Problem.objects.filter(pk__in=problem_ids, related_dirty=False).update(related_dirty=True)
+
+
+def _tags_by_problem(problem_ids):
+    tags = defaultdict(set)
+    rows = (
+        Problem.tags.through.objects
+        .filter(problem_id__in=problem_ids)
+        .values_list('problem_id', 'tag_id')
+    )
+    for problem_id, tag_id in rows:
+        tags[problem_id].add(tag_id)
+    return tags
+
+
+def _postings(user_id, tag_ids):
+    """単元タグ → そのユーザーの問題 ID の集合（転置リスト）"""
+    postings = defaultdict(set)
+    rows = (
+        Problem.tags.through.objects
+        .filter(tag_id__in=tag_ids, problem__user_id=user_id)
+        .values_list('tag_id', 'problem_id')
+    )
+    for tag_id, problem_id in rows:
+        postings[tag_id].add(problem_id)
+    return postings
+
+
+def top_related(problem_id, problem_tags, postings, tag_counts, k=RELATED_TOP_K):
+    """Jaccard 係数の高い順に [(関連問題 ID, スコア), ...] を k 件返す"""
+    overlaps = Counter()
+    for tag_id in problem_tags:
+        overlaps.update(postings.get(tag_id, ()))
+    overlaps.pop(problem_id, None)
+
+    size = len(problem_tags)
+    scored = [
+        (other_id, shared / (size + tag_counts[other_id] - shared))
+        for other_id, shared in overlaps.items()
+    ]
+    # 同点は新しい問題（ID が大きい方）を優先
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored[:k]
+
+
+def update_related_for_user(user_id, dirty_ids):
+    """1 ユーザー分の再計算。更新した問題の数を返す"""
+    dirty_ids = set(dirty_ids)
+    # 計算より前にフラグを下ろす。計算中に単元が変わった問題はフラグが立ち直り、次の回に再計算される
+    # （計算の後で下ろすと、その間に立ったフラグまで消してしまう）
+    Problem.objects.filter(pk__in=dirty_ids).update(related_dirty=False)
+    try:
+        return _recompute(user_id, dirty_ids)
+    except Exception:
+        mark_related_dirty(dirty_ids)
+        raise
+
+
+def _recompute(user_id, dirty_ids):
+    dirty_tags = _tags_by_problem(dirty_ids)
+
+    # 影響を受ける問題：現在単元を共有している問題 + これまで関連として持っていた問題
+    touched_tags = set().union(*dirty_tags.values()) if dirty_tags else set()
+    postings = _postings(user_id, touched_tags)
+    targets = set(dirty_ids)
+    for problem_ids in postings.values():
+        targets |= problem_ids
+    targets |= set(
+        RelatedProblem.objects
+        .filter(related_id__in=dirty_ids)
+        .values_list('problem_id', flat=True)
+    )
+
+    # 対象すべての単元タグと、その単元の転置リストを揃える
+    target_tags = _tags_by_problem(targets)
+    all_tags = set().union(*target_tags.values()) if target_tags else set()
+    postings = _postings(user_id, all_tags)
+    tag_counts = _tags_by_problem(set().union(*postings.values()) if postings else set())
+    tag_counts = {problem_id: len(tags) for problem_id, tags in tag_counts.items()}
+
+    rows = []
+    for problem_id in targets:
+        ranked = top_related(problem_id, target_tags.get(problem_id, set()), postings, tag_counts)
+        rows.extend(
+            RelatedProblem(problem_id=problem_id, related_id=related_id, score=score, rank=rank)
+            for rank, (related_id, score) in enumerate(ranked, start=1)
+        )
+
+    with transaction.atomic():
+        RelatedProblem.objects.filter(problem_id__in=targets).delete()
+        RelatedProblem.objects.bulk_create(rows, batch_size=500)
+        # 詳細ページの「関連する問題」が変わる
+        bump_watermarks([user_id])
+    return len(targets)
+
+
+def update_related(batch_size=200):
+    """
+    再計算待ちの問題をユーザーごとに処理する
+    戻り値: (処理した再計算待ちの問題数, 順位を更新した問題数)
+    """
+    processed = updated = 0
+    while True:
+        batch = list(
+            Problem.objects
+            .filter(related_dirty=True)
+            .order_by('user_id', 'pk')
+            .values_list('user_id', 'pk')[:batch_size]
+        )
+        if not batch:
+            break
+
+        by_user = defaultdict(list)
+        for user_id, problem_id in batch:
+            by_user[user_id].append(problem_id)
+        for user_id, problem_ids in by_user.items():
+            updated += update_related_for_user(user_id, problem_ids)
+        processed += len(batch)
+    return processed, updated
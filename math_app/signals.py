@@ -0,0 +1,385 @@
+# モデルのシグナルハンドラ（apps.py の ready() で読み込む）
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .dedup import index_problem, signature_changed
+from .imagehash import index_problem_images
+from .models import Grade, Problem, ProblemTombstone, RelatedProblem, Tag, TagTermIndex
+from .related import mark_related_dirty
+from .snapshots import problem_ids_for_tag, refresh_tag_snapshots
+from .stats import (
+    apply_deltas, diff, rebuild_user_stats, scalar_contributions, subjects_for_tags,
+    tag_contributions, tags_by_problem,
+)
+from .tag_suggest import TEXT_FIELDS, apply_term_deltas, contributions, hint_texts, problem_terms
+from .watermarks import bump_watermarks
+
+
+def deleting_user(origin):
+    """削除がユーザーの削除から連鎖したものか"""
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+
+def changed_problem_ids(instance, action, reverse, pk_set):
+    """Problem.tags の変更で紐付けが変わった問題の ID"""
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, '_tag_problem_ids', [])
+    return list(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Problem.tags.through)
+def remember_problems_before_clear(sender, instance, action, reverse, **kwargs):
+    # tag.problems.clear() の場合、消える前に対象の問題を控えておく
+    if reverse and action == 'pre_clear':
+        instance._tag_problem_ids = problem_ids_for_tag(instance.pk)
+
+
+@receiver(pre_delete, sender=Problem)
+def remember_tags_before_problem_delete(sender, instance, **kwargs):
+    """
+    post_delete の時点では中間テーブルの行が消えているので、先に単元を控えておく
+    統計・索引から引く値も、手元のインスタンスが古い場合に備えて DB から読み直す
+    """
+    instance._tag_ids_before_delete = tags_by_problem([instance.pk])[instance.pk]
+    instance._values_before_delete = (
+        Problem.objects
+        .filter(pk=instance.pk)
+        .values('user_id', 'grade_id', 'created_at', *TEXT_FIELDS)
+        .first()
+    )
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_problems_before_tag_delete(sender, instance, **kwargs):
+    # 削除で中間テーブルの行も消えるため、先に対象の問題を控えておく
+    instance._tag_problem_ids = problem_ids_for_tag(instance.pk)
+
+
+# ==============================================================================
+# 単元タグのスナップショット（Problem.tag_snapshot）
+# ==============================================================================
+@receiver(m2m_changed, sender=Problem.tags.through)
+def update_tag_snapshot_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """問題と単元タグの紐付けが変わったらスナップショットを作り直す"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        refresh_tag_snapshots(changed_problem_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_save, sender=Tag)
+def update_tag_snapshot_on_tag_save(sender, instance, created, **kwargs):
+    """単元名・並び順の変更をスナップショットに反映する"""
+    if created:
+        return
+    refresh_tag_snapshots(problem_ids_for_tag(instance.pk))
+
+
+@receiver(post_delete, sender=Tag)
+def update_tag_snapshot_on_tag_delete(sender, instance, **kwargs):
+    refresh_tag_snapshots(getattr(instance, '_tag_problem_ids', []))
+
+
+# ==============================================================================
+# 関連する問題（RelatedProblem）
+# ==============================================================================
+@receiver(m2m_changed, sender=Problem.tags.through)
+def mark_related_dirty_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """単元タグが変わった問題を関連問題の再計算待ちにする"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        mark_related_dirty(changed_problem_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_delete, sender=Tag)
+def mark_related_dirty_on_tag_delete(sender, instance, **kwargs):
+    mark_related_dirty(getattr(instance, '_tag_problem_ids', []))
+
+
+@receiver(pre_delete, sender=Problem)
+def mark_related_dirty_on_problem_delete(sender, instance, **kwargs):
+    """削除される問題を関連に持っていた問題は、空いた枠を埋め直す"""
+    mark_related_dirty(
+        RelatedProblem.objects
+        .filter(related=instance)
+        .values_list('problem_id', flat=True)
+    )
+
+
+# ==============================================================================
+# 似た問題の検出（MinHash 署名と LSH バケット）
+# ==============================================================================
+@receiver(post_save, sender=Problem)
+def index_problem_signature(sender, instance, created, raw=False, **kwargs):
+    """タイトル・ヒントが変わったときだけ署名を作り直す（単元・画像だけの編集では計算しない）"""
+    if raw or not (created or signature_changed(instance)):
+        return
+    index_problem(instance)
+
+
+# ==============================================================================
+# 画像の重複アップロード検出（dHash）
+# ==============================================================================
+@receiver(post_save, sender=Problem)
+def index_problem_image_hashes(sender, instance, raw=False, **kwargs):
+    """変わった画像だけ dHash を作り直す"""
+    if raw:
+        return
+    index_problem_images(instance)
+
+
+# ==============================================================================
+# 差分同期の削除記録（ProblemTombstone）
+# ==============================================================================
+@receiver(post_delete, sender=Problem)
+def record_problem_tombstone(sender, instance, origin=None, **kwargs):
+    """削除ビュー・管理画面・QuerySet.delete() のどれで消えても記録する"""
+    # ユーザーごと消える場合は記録も一緒に消えるので不要
+    if deleting_user(origin):
+        return
+    ProblemTombstone.objects.create(user_id=instance.user_id, problem_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Grade)
+def touch_problems_on_grade_delete(sender, instance, **kwargs):
+    """
+    学年の削除で grade が NULL になる問題を「更新あり」にする（SET_NULL は updated_at を進めずシグナルも出さない）
+    一覧・詳細に学年が出るので、その利用者のページの目印も進める
+    """
+    problems = Problem.objects.filter(grade=instance)
+    user_ids = list(problems.values_list('user_id', flat=True).distinct())
+    problems.update(updated_at=timezone.now())
+    bump_watermarks(user_ids)
+
+
+# ==============================================================================
+# ページの変更検知（UserWatermark、問題一覧・詳細の条件付き GET）
+# ==============================================================================
+def user_ids_for_problems(problem_ids):
+    return Problem.objects.filter(pk__in=problem_ids).values_list('user_id', flat=True).distinct()
+
+
+@receiver(post_save, sender=Problem)
+def bump_watermark_on_problem_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_watermarks([instance.user_id])
+
+
+@receiver(post_delete, sender=Problem)
+def bump_watermark_on_problem_delete(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin):
+        return
+    bump_watermarks([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Problem.tags.through)
+def bump_watermark_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        bump_watermarks(user_ids_for_problems(changed_problem_ids(instance, action, reverse, pk_set)))
+    else:
+        bump_watermarks([instance.user_id])
+
+
+@receiver(post_save, sender=Tag)
+def bump_watermark_on_tag_save(sender, instance, created, raw=False, **kwargs):
+    """単元名はその単元を使っている利用者の一覧（絞り込み）と詳細に出る"""
+    if created or raw:
+        return
+    bump_watermarks(user_ids_for_problems(problem_ids_for_tag(instance.pk)))
+
+
+@receiver(post_delete, sender=Tag)
+def bump_watermark_on_tag_delete(sender, instance, **kwargs):
+    bump_watermarks(user_ids_for_problems(getattr(instance, '_tag_problem_ids', [])))
+
+
+# ==============================================================================
+# 学習統計（UserStat）
+# ==============================================================================
+def problem_scalar_contributions(problem, values=None):
+    """values（読み込み時の値 _original など）になければ、いまの値を使う"""
+    values = values or {}
+
+    def value(attname):
+        return values[attname] if attname in values else getattr(problem, attname)
+
+    return scalar_contributions(
+        value('grade_id'),
+        value('created_at'),
+        {field: value(field) for field in ('hint_approach', 'hint_formula', 'hint_technique')},
+    )
+
+
+@receiver(post_save, sender=Problem)
+def update_stats_on_problem_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_deltas(instance.user_id, problem_scalar_contributions(instance))
+        return
+    original = getattr(instance, '_original', None)
+    if original is None or original.get('user_id', instance.user_id) != instance.user_id:
+        # 読み込み時の値がない・所有者が変わった：差分を出せないので作り直す
+        rebuild_user_stats([instance.user_id, (original or {}).get('user_id')])
+        return
+    apply_deltas(instance.user_id, diff(
+        problem_scalar_contributions(instance, original),
+        problem_scalar_contributions(instance),
+    ))
+
+
+@receiver(post_delete, sender=Problem)
+def update_stats_on_problem_delete(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin):
+        return
+    tag_ids = getattr(instance, '_tag_ids_before_delete', set())
+    values = getattr(instance, '_values_before_delete', None)
+    removed = problem_scalar_contributions(instance, values) + tag_contributions(tag_ids, subjects_for_tags(tag_ids))
+    apply_deltas(instance.user_id, diff(removed, {}))
+
+
+def stat_problem_ids(instance, action, reverse, pk_set):
+    """単元タグの付け替えで統計が変わりうる問題の ID"""
+    if not reverse:
+        return [instance.pk]
+    if action in ('pre_clear', 'post_clear'):
+        return getattr(instance, '_tag_problem_ids', [])
+    return list(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Problem.tags.through)
+def update_stats_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """変更前後の単元タグを比べて、単元・科目の寄与の差分を足し込む"""
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._tags_before = tags_by_problem(stat_problem_ids(instance, action, reverse, pk_set))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    before = getattr(instance, '_tags_before', {})
+    after = tags_by_problem(before.keys())
+    if reverse:
+        owners = dict(Problem.objects.filter(pk__in=before.keys()).values_list('pk', 'user_id'))
+    else:
+        owners = {instance.pk: instance.user_id}
+    subject_of = subjects_for_tags(set().union(set(), *before.values(), *after.values()))
+
+    deltas = {}
+    for problem_id, old_tags in before.items():
+        user_deltas = deltas.setdefault(owners[problem_id], Counter())
+        user_deltas.update(diff(
+            tag_contributions(old_tags, subject_of),
+            tag_contributions(after[problem_id], subject_of),
+        ))
+    for user_id, user_deltas in deltas.items():
+        apply_deltas(user_id, user_deltas)
+
+
+@receiver(pre_save, sender=Tag)
+def remember_tag_subject(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    previous = Tag.objects.filter(pk=instance.pk).values_list('subject_id', flat=True).first()
+    instance._subject_changed = previous != instance.subject_id
+
+
+@receiver(post_save, sender=Tag)
+def update_stats_on_tag_save(sender, instance, created, raw=False, **kwargs):
+    """単元の科目が変わったら、その単元を使っている利用者の統計を作り直す"""
+    if created or raw or not getattr(instance, '_subject_changed', False):
+        return
+    rebuild_user_stats(user_ids_for_problems(problem_ids_for_tag(instance.pk)))
+
+
+@receiver(post_delete, sender=Tag)
+def update_stats_on_tag_delete(sender, instance, **kwargs):
+    # 中間テーブルの行は m2m_changed を出さずに消える
+    rebuild_user_stats(user_ids_for_problems(getattr(instance, '_tag_problem_ids', [])))
+
+
+@receiver(pre_delete, sender=Grade)
+def remember_users_before_grade_delete(sender, instance, **kwargs):
+    instance._stat_user_ids = list(Problem.objects.filter(grade=instance).values_list('user_id', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Grade)
+def update_stats_on_grade_delete(sender, instance, **kwargs):
+    """学年の削除で問題の grade が NULL になる（SET_NULL はシグナルを出さない）"""
+    rebuild_user_stats(getattr(instance, '_stat_user_ids', []))
+
+
+# ==============================================================================
+# 単元タグ候補の索引（TagTermIndex）
+# ==============================================================================
+def problem_text_values(instance):
+    """タイトル・ヒントの値（only() で読み込まなかったものは DB から読む）"""
+    deferred = instance.get_deferred_fields().intersection(TEXT_FIELDS)
+    values = {field: getattr(instance, field) for field in TEXT_FIELDS if field not in deferred}
+    if deferred:
+        values.update(Problem.objects.filter(pk=instance.pk).values(*deferred).first() or {})
+    return values
+
+
+@receiver(post_save, sender=Problem)
+def update_term_index_on_problem_save(sender, instance, created, raw=False, **kwargs):
+    """タイトル・ヒントの語が変わったら、その問題の (語, 単元) の組を入れ替える"""
+    if raw:
+        return
+    values = problem_text_values(instance)
+    terms = problem_terms(*hint_texts(values))
+    if created:
+        # 単元タグはこの後の m2m_changed で加わる
+        apply_term_deltas(instance.user_id, set(), contributions(terms, ()))
+        return
+    original = getattr(instance, '_original', None)
+    if original is None or original.get('user_id', instance.user_id) != instance.user_id:
+        return  # 差分を出せない（rebuild_tag_term_index で作り直す）
+    old_terms = problem_terms(*hint_texts({**values, **original}))
+    if old_terms == terms:
+        return
+    tag_ids = tags_by_problem([instance.pk])[instance.pk]
+    apply_term_deltas(instance.user_id, contributions(old_terms, tag_ids), contributions(terms, tag_ids))
+
+
+@receiver(post_delete, sender=Problem)
+def update_term_index_on_problem_delete(sender, instance, **kwargs):
+    # ユーザーごと消える場合も、全体の範囲から引くために処理する
+    terms = problem_terms(*hint_texts(getattr(instance, '_values_before_delete', None) or instance.__dict__))
+    tag_ids = getattr(instance, '_tag_ids_before_delete', set())
+    apply_term_deltas(instance.user_id, contributions(terms, tag_ids), set())
+
+
+@receiver(m2m_changed, sender=Problem.tags.through)
+def update_term_index_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """付け替え前後の単元タグの差分だけ、その問題の語との組を増減する"""
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._term_tags_before = tags_by_problem(stat_problem_ids(instance, action, reverse, pk_set))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    before = getattr(instance, '_term_tags_before', {})
+    after = tags_by_problem(before.keys())
+    if reverse:
+        problems = Problem.objects.filter(pk__in=before.keys()).values('pk', 'user_id', *TEXT_FIELDS)
+    else:
+        problems = [{'pk': instance.pk, 'user_id': instance.user_id, **problem_text_values(instance)}]
+    for row in problems:
+        terms = problem_terms(*hint_texts(row))
+        apply_term_deltas(
+            row['user_id'],
+            contributions(terms, before[row['pk']]),
+            contributions(terms, after[row['pk']]),
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def update_term_index_on_tag_delete(sender, instance, **kwargs):
+    # 中間テーブルの行は m2m_changed を出さずに消えるので、その単元の組をまとめて消す（単元 0 の件数は変わらない）
+    TagTermIndex.objects.filter(tag_id=instance.pk).delete()
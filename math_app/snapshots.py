@@ -0,0 +1,69 @@
+# Problem.tag_snapshot（単元タグの非正規化コピー）の組み立てと更新
+from django.utils import timezone
+
+from .models import Problem
+
+# 単元タグの並び順（Tag.Meta.ordering と同じ）
+TAG_ORDERING = ('tag__grade__order', 'tag__order', 'tag__name')
+
+
+def build_tag_snapshots(problem_ids):
+    """中間テーブルから {problem_id: スナップショット} を 1 クエリで組み立てる"""
+    snapshots = {problem_id: [] for problem_id in problem_ids}
+    rows = (
+        Problem.tags.through.objects
+        .filter(problem_id__in=snapshots.keys())
+        .order_by(*TAG_ORDERING)
+        .values_list('problem_id', 'tag_id', 'tag__name')
+    )
+    for problem_id, tag_id, tag_name in rows:
+        snapshots[problem_id].append({'id': tag_id, 'name': tag_name})
+    return snapshots
+
+
+def refresh_tag_snapshots(problem_ids, batch_size=500):
+    """
+    指定した問題のスナップショットを作り直して一括保存する
+    表示される内容が変わるので updated_at も進める（差分同期・ETag が変更に気付けるように）
+    """
+    problem_ids = list(problem_ids)
+    for start in range(0, len(problem_ids), batch_size):
+        snapshots = build_tag_snapshots(problem_ids[start:start + batch_size])
+        now = timezone.now()
+        problems = [
+            Problem(pk=problem_id, tag_snapshot=snapshot, updated_at=now)
+            for problem_id, snapshot in snapshots.items()
+        ]
+        Problem.objects.bulk_update(problems, ['tag_snapshot', 'updated_at'])
+
+
+def find_snapshot_drift(batch_size=500):
+    """
+    スナップショットが中間テーブルとずれている問題を探す
+    問題 ID をキーセットで区切って読み、[(problem_id, 保存値, 正しい値), ...] を返す
+    """
+    drift = []
+    last_id = 0
+    while True:
+        batch = list(
+            Problem.objects
+            .filter(pk__gt=last_id)
+            .order_by('pk')
+            .values_list('pk', 'tag_snapshot')[:batch_size]
+        )
+        if not batch:
+            break
+        expected = build_tag_snapshots(pk for pk, _ in batch)
+        for pk, stored in batch:
+            if stored != expected[pk]:
+                drift.append((pk, stored, expected[pk]))
+        last_id = batch[-1][0]
+    return drift
+
+
+def problem_ids_for_tag(tag_id):
+    return list(
+        Problem.tags.through.objects
+        .filter(tag_id=tag_id)
+        .values_list('problem_id', flat=True)
+    )
@@ -0,0 +1,93 @@
+// 問題一覧の無限スクロール（.grid[data-cards-url]）
+//
+// 一覧の末尾に目印を置き、画面に近づいたら続きのカード（サーバーで描画した HTML 断片）を追加する。
+// 続きの 1 回分は先に読んでおき、目印が見えたときにはすぐ追加できるようにする。
+// 次の位置は断片の X-Next-Cursor ヘッダーで受け取り、無ければ最後まで読んだとみなす。
+(function () {
+  'use strict';
+
+  // 目印が画面の下端からこの距離に入ったら追加する
+  const ROOT_MARGIN = '0px 0px 1200px 0px';
+
+  function bindInfiniteScroll(grid) {
+    let cursor = grid.dataset.nextCursor;
+    if (!cursor || !('IntersectionObserver' in window)) {
+      return;
+    }
+
+    // 検索語・単元の絞り込みは今のページの URL から引き継ぐ
+    const params = new URLSearchParams(window.location.search);
+    params.delete('page');
+
+    const sentinel = document.createElement('div');
+    sentinel.className = 'scroll-sentinel';
+    sentinel.setAttribute('aria-hidden', 'true');
+    grid.after(sentinel);
+
+    const pagination = document.querySelector('.pagination');
+    if (pagination) {
+      pagination.hidden = true;
+    }
+
+    let pending = null;
+    let visible = false;
+
+    function prefetch() {
+      params.set('cursor', cursor);
+      pending = fetch(`${grid.dataset.cardsUrl}?${params}`, { credentials: 'same-origin' })
+        .then(async (response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+          }
+          return { html: await response.text(), next: response.headers.get('X-Next-Cursor') };
+        });
+    }
+
+    function finish() {
+      observer.disconnect();
+      sentinel.remove();
+    }
+
+    async function append() {
+      const current = pending;
+      pending = null;
+      let batch;
+      try {
+        batch = await current;
+      } catch (err) {
+        // 読めなかったときはページ送りに戻す
+        console.log('Infinite scroll error:', err);
+        finish();
+        if (pagination) {
+          pagination.hidden = false;
+        }
+        return;
+      }
+      grid.insertAdjacentHTML('beforeend', batch.html);
+      cursor = batch.next;
+      if (!cursor) {
+        finish();
+        return;
+      }
+      prefetch();
+      // 追加しても目印が画面内に残るときは続けて追加する
+      if (visible) {
+        append();
+      }
+    }
+
+    const observer = new IntersectionObserver((entries) => {
+      visible = entries.some((entry) => entry.isIntersecting);
+      if (visible && pending) {
+        append();
+      }
+    }, { rootMargin: ROOT_MARGIN });
+
+    prefetch();
+    observer.observe(sentinel);
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('.grid[data-cards-url]').forEach(bindInfiniteScroll);
+  });
+})();
@@ -0,0 +1,54 @@
+// 次に開きそうなページの先読み（a[data-prefetch]）
+//
+// speculation rules（_prefetch_head.html）に対応したブラウザでは何もしない。
+// それ以外では、リンクにマウスを少し乗せたとき・触れたときに <link rel="prefetch"> を足す。
+// 先読みのリクエストはサーバーで見分け、セッションの保存やメッセージの読み出しをしない（middleware.py）。
+(function () {
+  'use strict';
+
+  const HOVER_DELAY = 100;
+
+  if (HTMLScriptElement.supports && HTMLScriptElement.supports('speculationrules')) {
+    return;
+  }
+
+  const done = new Set();
+  let timer = null;
+
+  function prefetch(link) {
+    const url = link.href;
+    if (done.has(url) || link.origin !== window.location.origin) {
+      return;
+    }
+    done.add(url);
+    const hint = document.createElement('link');
+    hint.rel = 'prefetch';
+    hint.href = url;
+    document.head.append(hint);
+  }
+
+  function target(event) {
+    return event.target instanceof Element ? event.target.closest('a[data-prefetch]') : null;
+  }
+
+  document.addEventListener('mouseover', (event) => {
+    const link = target(event);
+    if (link) {
+      clearTimeout(timer);
+      timer = setTimeout(() => prefetch(link), HOVER_DELAY);
+    }
+  });
+
+  document.addEventListener('mouseout', (event) => {
+    if (target(event)) {
+      clearTimeout(timer);
+    }
+  });
+
+  document.addEventListener('touchstart', (event) => {
+    const link = target(event);
+    if (link) {
+      prefetch(link);
+    }
+  }, { passive: true });
+})();
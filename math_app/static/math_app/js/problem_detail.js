@@ -0,0 +1,49 @@
+// 問題詳細ページ（problem_detail.html）
+//
+// ヒントの表示・非表示（ボタンの onclick から呼ぶので、関数はグローバルに置く）と数式の描画。
+
+// MathJax の初期化
+if (window.MathJax) {
+  MathJax.typesetPromise().catch(err => console.log('MathJax error:', err));
+}
+
+// ヒント表示機能
+function revealHint(button) {
+  const hintBox = button.closest('.hint-box');
+  const hintContent = hintBox.querySelector('.hint-content');
+  const hideBtn = hintBox.querySelector('.hide-btn');
+  
+  // 表示ボタンを非表示にする
+  button.style.display = 'none';
+  
+  // 隠すボタンを表示
+  hideBtn.style.display = 'inline-block';
+  
+  // コンテンツを表示（アニメーション付き）
+  hintContent.style.display = 'block';
+  hintContent.classList.remove('hide-animation');
+  hintContent.classList.add('reveal-animation');
+  
+  // MathJaxの再レンダリング
+  if (window.MathJax) {
+    MathJax.typesetPromise([hintContent]).catch(err => console.log('MathJax error:', err));
+  }
+}
+
+// ヒント非表示機能
+function hideHint(button) {
+  const hintBox = button.closest('.hint-box');
+  const hintContent = hintBox.querySelector('.hint-content');
+  const revealBtn = hintBox.querySelector('.reveal-btn');
+  
+  // アニメーションを追加
+  hintContent.classList.remove('reveal-animation');
+  hintContent.classList.add('hide-animation');
+  
+  // アニメーション終了後に非表示
+  setTimeout(() => {
+    hintContent.style.display = 'none';
+    button.style.display = 'none';
+    revealBtn.style.display = 'inline-block';
+  }, 600);
+}
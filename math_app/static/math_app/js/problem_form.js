@@ -0,0 +1,343 @@
+// 問題登録・編集フォーム（problem_form.html）
+//
+// 学年 → 科目 → 単元の選択肢の絞り込み、手書き入力（Canvas）、画像のプレビュー。
+// 選択肢を読む API の URL はテンプレートで form の data-* 属性に埋め込む。
+(function () {
+  'use strict';
+
+  // Canvas と描画機能
+  const canvas = document.getElementById('drawingCanvas');
+  const ctx = canvas.getContext('2d');
+  const imageDataInput = document.getElementById('id_image_data');
+  const gradeSelect = document.getElementById('id_grade');
+  const subjectGroup = document.getElementById('subject-group');
+  const subjectSelect = document.getElementById('id_subject');
+  const tagsSelect = document.getElementById('id_tags');
+  const selectedTagIdsInput = document.getElementById('selected-tag-ids');
+  const problemForm = document.getElementById('problemForm');
+  const tagsApiTemplate = problemForm.dataset.tagsUrl;
+  const subjectsApiTemplate = problemForm.dataset.subjectsUrl;
+  const tagsBySubjectApiTemplate = problemForm.dataset.tagsBySubjectUrl;
+
+  // 高校の学年ID（中学は 1-3, 高校は 4-6 と仮定）
+  const HIGH_SCHOOL_GRADES = [4, 5, 6]; // 高1, 高2, 高3のID
+
+  // 入力方法の選択
+  const methodKeyboard = document.getElementById('method-keyboard');
+  const methodHandwriting = document.getElementById('method-handwriting');
+  const keyboardSection = document.getElementById('keyboard-section');
+  const handwritingSection = document.getElementById('handwriting-section');
+
+  const titleInput = document.getElementById('id_title');
+
+  // ツールボタン
+  const btnPen = document.getElementById('btn-pen');
+  const btnEraser = document.getElementById('btn-eraser');
+  const btnClear = document.getElementById('btn-clear');
+  const btnDone = document.getElementById('btn-done');
+  const brushSize = document.getElementById('brush-size');
+  const colorOptions = document.querySelectorAll('.color-option');
+
+  function getSelectedTagIds() {
+    if (!selectedTagIdsInput || !selectedTagIdsInput.value) return [];
+    return selectedTagIdsInput.value.split(',').filter(Boolean);
+  }
+
+  function setTagsOptions(tags) {
+    if (!tagsSelect) return;
+    const selectedIds = new Set(getSelectedTagIds());
+    tagsSelect.innerHTML = '';
+
+    tags.forEach(tag => {
+      const option = document.createElement('option');
+      option.value = tag.id;
+      option.textContent = tag.name;
+      if (selectedIds.has(String(tag.id))) {
+        option.selected = true;
+      }
+      tagsSelect.appendChild(option);
+    });
+
+    tagsSelect.disabled = tags.length === 0;
+  }
+
+  function setSubjectsOptions(subjects) {
+    if (!subjectSelect) return;
+    subjectSelect.innerHTML = '<option value="">選択してください</option>';
+
+    subjects.forEach(subject => {
+      const option = document.createElement('option');
+      option.value = subject.id;
+      option.textContent = subject.name;
+      subjectSelect.appendChild(option);
+    });
+
+    if (subjects.length > 0) {
+      subjectGroup.style.display = 'block';
+    } else {
+      subjectGroup.style.display = 'none';
+      subjectSelect.value = '';
+    }
+  }
+
+  async function fetchSubjectsForGrade(gradeId) {
+    if (!gradeId || !subjectSelect) {
+      setSubjectsOptions([]);
+      return;
+    }
+
+    const url = subjectsApiTemplate.replace('/0/', `/${gradeId}/`);
+    try {
+      const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+      if (!response.ok) throw new Error('科目取得に失敗しました');
+      const data = await response.json();
+      setSubjectsOptions(data.subjects || []);
+    } catch (error) {
+      console.error(error);
+      setSubjectsOptions([]);
+    }
+  }
+
+  async function fetchTagsForGrade(gradeId) {
+    if (!gradeId || !tagsSelect) {
+      if (tagsSelect) {
+        tagsSelect.innerHTML = '';
+        tagsSelect.disabled = true;
+      }
+      return;
+    }
+
+    const url = tagsApiTemplate.replace('/0/', `/${gradeId}/`);
+    try {
+      const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+      if (!response.ok) throw new Error('タグ取得に失敗しました');
+      const data = await response.json();
+      setTagsOptions(data.tags || []);
+    } catch (error) {
+      console.error(error);
+      tagsSelect.innerHTML = '';
+      tagsSelect.disabled = true;
+    }
+  }
+
+  async function fetchTagsForSubject(subjectId) {
+    if (!subjectId || !tagsSelect) {
+      if (tagsSelect) {
+        tagsSelect.innerHTML = '';
+        tagsSelect.disabled = true;
+      }
+      return;
+    }
+
+    const url = tagsBySubjectApiTemplate.replace('/0/', `/${subjectId}/`);
+    try {
+      const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+      if (!response.ok) throw new Error('タグ取得に失敗しました');
+      const data = await response.json();
+      setTagsOptions(data.tags || []);
+    } catch (error) {
+      console.error(error);
+      tagsSelect.innerHTML = '';
+      tagsSelect.disabled = true;
+    }
+  }
+
+  if (gradeSelect) {
+    gradeSelect.addEventListener('change', () => {
+      if (selectedTagIdsInput) selectedTagIdsInput.value = '';
+      const gradeId = gradeSelect.value;
+
+      // 高校の場合は科目を表示
+      if (gradeId && HIGH_SCHOOL_GRADES.includes(parseInt(gradeId))) {
+        fetchSubjectsForGrade(gradeId);
+      } else {
+        setSubjectsOptions([]);
+        fetchTagsForGrade(gradeId);
+      }
+    });
+
+    if (gradeSelect.value && tagsSelect && tagsSelect.options.length === 0) {
+      fetchTagsForGrade(gradeSelect.value);
+    }
+  }
+
+  if (subjectSelect) {
+    subjectSelect.addEventListener('change', () => {
+      if (selectedTagIdsInput) selectedTagIdsInput.value = '';
+      const subjectId = subjectSelect.value;
+      if (subjectId) {
+        fetchTagsForSubject(subjectId);
+      } else {
+        // 科目が未選択の場合は、学年全体のタグを表示
+        fetchTagsForGrade(gradeSelect.value);
+      }
+    });
+  }
+
+  // 描画状態
+  let isDrawing = false;
+  let currentTool = 'pen'; // 'pen' or 'eraser'
+  let currentColor = '#000000';
+  let currentSize = 3;
+
+  // Canvas のサイズをレスポンシブに調整
+  function resizeCanvas() {
+    const rect = canvas.getBoundingClientRect();
+    const width = Math.min(600, rect.width);
+    canvas.width = width;
+    canvas.height = width * 2 / 3; // 3:2 アスペクト比
+  }
+
+  resizeCanvas();
+  window.addEventListener('resize', resizeCanvas);
+
+  // 入力方法の切り替え
+  methodKeyboard.addEventListener('change', () => {
+    keyboardSection.classList.add('active');
+    handwritingSection.classList.remove('active');
+    titleInput.focus();
+  });
+
+  methodHandwriting.addEventListener('change', () => {
+    keyboardSection.classList.remove('active');
+    handwritingSection.classList.add('active');
+    resizeCanvas();
+  });
+
+  // ツール切り替え
+  btnPen.addEventListener('click', (e) => {
+    e.preventDefault();
+    currentTool = 'pen';
+    btnPen.classList.add('active');
+    btnEraser.classList.remove('active');
+  });
+
+  btnEraser.addEventListener('click', (e) => {
+    e.preventDefault();
+    currentTool = 'eraser';
+    btnEraser.classList.add('active');
+    btnPen.classList.remove('active');
+  });
+
+  // キャンバスリセット
+  btnClear.addEventListener('click', (e) => {
+    e.preventDefault();
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+  });
+
+  // ブラシサイズ
+  brushSize.addEventListener('change', (e) => {
+    currentSize = parseInt(e.target.value);
+  });
+
+  // 色選択
+  colorOptions.forEach(option => {
+    option.addEventListener('click', (e) => {
+      colorOptions.forEach(o => o.classList.remove('active'));
+      option.classList.add('active');
+      currentColor = option.dataset.color;
+    });
+  });
+
+  // マウスイベント
+  canvas.addEventListener('mousedown', startDrawing);
+  canvas.addEventListener('mousemove', draw);
+  canvas.addEventListener('mouseup', stopDrawing);
+  canvas.addEventListener('mouseout', stopDrawing);
+
+  // タッチイベント（モバイル対応）
+  canvas.addEventListener('touchstart', handleTouch);
+  canvas.addEventListener('touchmove', handleTouch);
+  canvas.addEventListener('touchend', stopDrawing);
+
+  function startDrawing(e) {
+    isDrawing = true;
+    const rect = canvas.getBoundingClientRect();
+    const x = e.clientX - rect.left;
+    const y = e.clientY - rect.top;
+    ctx.beginPath();
+    ctx.moveTo(x, y);
+  }
+
+  function draw(e) {
+    if (!isDrawing) return;
+
+    const rect = canvas.getBoundingClientRect();
+    const x = e.clientX - rect.left;
+    const y = e.clientY - rect.top;
+
+    ctx.lineWidth = currentSize;
+    ctx.lineCap = 'round';
+    ctx.lineJoin = 'round';
+
+    if (currentTool === 'pen') {
+      ctx.globalCompositeOperation = 'source-over';
+      ctx.strokeStyle = currentColor;
+    } else if (currentTool === 'eraser') {
+      ctx.globalCompositeOperation = 'destination-out';
+      ctx.strokeStyle = 'rgba(0,0,0,1)';
+    }
+
+    ctx.lineTo(x, y);
+    ctx.stroke();
+  }
+
+  function stopDrawing() {
+    isDrawing = false;
+    ctx.closePath();
+  }
+
+  // タッチ対応
+  function handleTouch(e) {
+    const touch = e.touches[0];
+    const mouseEvent = new MouseEvent(e.type === 'touchstart' ? 'mousedown' : 'mousemove', {
+      clientX: touch.clientX,
+      clientY: touch.clientY
+    });
+    canvas.dispatchEvent(mouseEvent);
+  }
+
+  // 完了ボタン - Canvas を画像に変換
+  btnDone.addEventListener('click', (e) => {
+    e.preventDefault();
+
+    canvas.toBlob(blob => {
+      // Blob を File に変換
+      const file = new File([blob], 'handwriting.png', { type: 'image/png' });
+
+      // DataTransfer を使ってファイルを input に設定
+      const dataTransfer = new DataTransfer();
+      dataTransfer.items.add(file);
+      document.getElementById('id_image').files = dataTransfer.files;
+
+      // プレビューを表示
+      const reader = new FileReader();
+      reader.onload = (event) => {
+        const previewContainer = document.getElementById('image-preview-container');
+        const previewImg = document.getElementById('image-preview');
+        previewImg.src = event.target.result;
+        previewContainer.style.display = 'block';
+      };
+      reader.readAsDataURL(blob);
+
+      // ビジュアルフィードバック
+      alert('手書きを画像として保存しました！');
+
+      // キーボード入力に戻す
+      methodKeyboard.checked = true;
+      keyboardSection.classList.add('active');
+      handwritingSection.classList.remove('active');
+    }, 'image/png');
+  });
+
+  // フォーム送信時
+  document.getElementById('problemForm').addEventListener('submit', (e) => {
+    const inputMethod = document.querySelector('input[name="input-method"]:checked').value;
+
+    if (inputMethod === 'keyboard' && !titleInput.value.trim()) {
+      e.preventDefault();
+      alert('キーボード入力を選択した場合、問題の概要を入力してください');
+      titleInput.focus();
+    }
+  });
+})();
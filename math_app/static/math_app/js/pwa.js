@@ -0,0 +1,198 @@
+// PWA：Service Worker の登録と、オフライン中のヒント編集の保存待ちキュー
+//
+// ヒントの保存（update_hint）が通信できずに失敗したら IndexedDB に積み、
+// 接続が戻ったとき（online イベント・次のページ表示時）に古い順に送り直す。
+(function () {
+  'use strict';
+
+  const script = document.currentScript;
+  const DB_NAME = 'mathhint';
+  const STORE = 'hint-queue';
+
+  if ('serviceWorker' in navigator && script && script.dataset.swUrl) {
+    window.addEventListener('load', () => {
+      navigator.serviceWorker.register(script.dataset.swUrl).catch((err) => {
+        console.log('Service Worker registration failed:', err);
+      });
+    });
+  }
+
+  // ==========================================================================
+  // IndexedDB の保存待ちキュー
+  // ==========================================================================
+  function openQueue() {
+    return new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, 1);
+      request.onupgradeneeded = () => {
+        request.result.createObjectStore(STORE, { keyPath: 'id', autoIncrement: true });
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  function withStore(mode, callback) {
+    return openQueue().then((db) => new Promise((resolve, reject) => {
+      const transaction = db.transaction(STORE, mode);
+      const result = callback(transaction.objectStore(STORE));
+      transaction.oncomplete = () => resolve(result && result.result);
+      transaction.onerror = () => reject(transaction.error);
+    }));
+  }
+
+  function enqueue(item) {
+    return withStore('readwrite', (store) => store.add(item));
+  }
+
+  function queuedItems() {
+    return withStore('readonly', (store) => store.getAll());
+  }
+
+  function dequeue(id) {
+    return withStore('readwrite', (store) => store.delete(id));
+  }
+
+  function csrfToken() {
+    const meta = document.querySelector('meta[name="csrf-token"]');
+    return meta ? meta.content : '';
+  }
+
+  function postHint(url, payload, token) {
+    return fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-CSRFToken': token,
+      },
+      credentials: 'same-origin',
+      body: JSON.stringify(payload),
+    });
+  }
+
+  // 戻り値: { status: 'saved', data } / { status: 'queued' } / { status: 'error', message }
+  async function saveHint(url, payload) {
+    let response = null;
+    if (navigator.onLine) {
+      try {
+        response = await postHint(url, payload, csrfToken());
+      } catch (err) {
+        // 通信できなかった：キューに積む
+      }
+    }
+    if (!response) {
+      await enqueue({ url, payload, token: csrfToken(), queuedAt: Date.now() });
+      return { status: 'queued' };
+    }
+
+    const data = await response.json().catch(() => ({}));
+    if (response.ok && data.success) {
+      return { status: 'saved', data };
+    }
+    return { status: 'error', message: data.message || '保存に失敗しました' };
+  }
+
+  let replaying = false;
+
+  async function replayQueue() {
+    if (replaying || !navigator.onLine || !('indexedDB' in window)) {
+      return;
+    }
+    replaying = true;
+    let loginRequired = false;
+    try {
+      const items = await queuedItems();
+      for (const item of items) {
+        let response;
+        try {
+          response = await postHint(item.url, item.payload, csrfToken() || item.token);
+        } catch (err) {
+          break;  // まだつながらない：残りは次の機会に
+        }
+        // ログインページへの転送や CSRF エラーの画面など JSON 以外が返った：ログインし直した後に送り直す
+        const isJson = (response.headers.get('Content-Type') || '').includes('application/json');
+        const data = !response.redirected && isJson ? await response.json().catch(() => null) : null;
+        if (!data) {
+          loginRequired = true;
+          break;
+        }
+        // 外すのは保存できたとき、または送り直しても通らない内容（形式・権限のエラー、問題の削除）のときだけ
+        const rejected = response.status >= 400 && response.status < 500;
+        if (!(response.ok && data.success) && !rejected) {
+          break;
+        }
+        await dequeue(item.id);
+      }
+      document.dispatchEvent(new CustomEvent('mathhint:queue-replayed', { detail: { loginRequired } }));
+    } finally {
+      replaying = false;
+    }
+  }
+
+  window.addEventListener('online', replayQueue);
+  window.addEventListener('load', replayQueue);
+
+  // ==========================================================================
+  // 問題詳細ページのヒント編集（data-hint-editor）
+  // ==========================================================================
+  function bindHintEditor(editor) {
+    const box = editor.closest('.hint-content');
+    const text = box.querySelector('.hint-text');
+    const form = editor.querySelector('.hint-edit-form');
+    const textarea = editor.querySelector('textarea');
+    const status = editor.querySelector('.hint-edit-status');
+    const editButton = editor.querySelector('[data-hint-edit]');
+
+    editButton.addEventListener('click', () => {
+      form.hidden = false;
+      editButton.hidden = true;
+      textarea.focus();
+    });
+
+    editor.querySelector('[data-hint-cancel]').addEventListener('click', () => {
+      form.hidden = true;
+      editButton.hidden = false;
+    });
+
+    editor.querySelector('[data-hint-save]').addEventListener('click', async () => {
+      const content = textarea.value.trim();
+      status.textContent = '保存しています…';
+      const result = await saveHint(editor.dataset.url, {
+        hint_type: editor.dataset.hintType,
+        content,
+      });
+
+      if (result.status === 'error') {
+        status.textContent = result.message;
+        return;
+      }
+      if (result.status === 'saved') {
+        text.innerHTML = result.data.html || '<span class="hint-empty">まだ記録されていません</span>';
+        text.classList.remove('hint-pending');
+        status.textContent = result.data.message;
+        if (window.MathJax) {
+          MathJax.typesetPromise([text]).catch((err) => console.log('MathJax error:', err));
+        }
+      } else {
+        text.textContent = content;
+        text.classList.add('hint-pending');
+        status.textContent = 'オフラインのため、接続が戻ったら保存します';
+      }
+      form.hidden = true;
+      editButton.hidden = false;
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-hint-editor]').forEach(bindHintEditor);
+  });
+
+  document.addEventListener('mathhint:queue-replayed', (event) => {
+    if (event.detail.loginRequired) {
+      document.querySelectorAll('.hint-edit-status').forEach((status) => {
+        status.textContent = 'ログインの有効期限が切れています。ログインし直すと、保存待ちのヒントを送信します';
+      });
+    }
+  });
+
+  window.MathHintPWA = { saveHint, replayQueue };
+})();
@@ -0,0 +1,87 @@
+// 問題登録フォームの単元タグ候補（.tag-suggestions）
+//
+// タイトル・ヒントの入力が止まったら候補 API に問い合わせ、選べる単元（#id_tags にあるもの）だけを
+// チップとして並べる。チップを押すとその単元の選択を切り替える。
+(function () {
+  'use strict';
+
+  const DELAY = 400;
+  const TEXT_FIELDS = ['id_title', 'id_hint_approach', 'id_hint_formula', 'id_hint_technique'];
+
+  document.addEventListener('DOMContentLoaded', () => {
+    const box = document.querySelector('.tag-suggestions');
+    const tagsSelect = document.getElementById('id_tags');
+    const gradeSelect = document.getElementById('id_grade');
+    if (!box || !tagsSelect) {
+      return;
+    }
+    const chips = box.querySelector('.tag-suggestions-chips');
+    const fields = TEXT_FIELDS.map((id) => document.getElementById(id)).filter(Boolean);
+    let timer = null;
+    let controller = null;
+    let suggestions = [];
+
+    function optionFor(tagId) {
+      return Array.from(tagsSelect.options).find((option) => option.value === String(tagId));
+    }
+
+    function render() {
+      const available = suggestions.filter((tag) => optionFor(tag.id));
+      chips.replaceChildren(...available.map((tag) => {
+        const option = optionFor(tag.id);
+        const chip = document.createElement('button');
+        chip.type = 'button';
+        chip.className = 'tag-chip';
+        chip.classList.toggle('selected', option.selected);
+        chip.textContent = tag.name;
+        chip.addEventListener('click', () => {
+          option.selected = !option.selected;
+          tagsSelect.dispatchEvent(new Event('change', { bubbles: true }));
+        });
+        return chip;
+      }));
+      box.hidden = available.length === 0;
+    }
+
+    async function refresh() {
+      const text = fields.map((field) => field.value).join('\n').trim();
+      if (!text) {
+        suggestions = [];
+        render();
+        return;
+      }
+      if (controller) {
+        controller.abort();
+      }
+      controller = new AbortController();
+      const params = new URLSearchParams({ text: text.slice(0, 1000), grade: gradeSelect ? gradeSelect.value : '' });
+      try {
+        const response = await fetch(`${box.dataset.url}?${params}`, {
+          credentials: 'same-origin',
+          signal: controller.signal,
+        });
+        if (response.ok) {
+          suggestions = (await response.json()).tags || [];
+          render();
+        }
+      } catch (err) {
+        if (err.name !== 'AbortError') {
+          console.log('Tag suggestion error:', err);
+        }
+      }
+    }
+
+    function schedule() {
+      clearTimeout(timer);
+      timer = setTimeout(refresh, DELAY);
+    }
+
+    fields.forEach((field) => field.addEventListener('input', schedule));
+    if (gradeSelect) {
+      gradeSelect.addEventListener('change', schedule);
+    }
+    // 学年・科目を変えると単元の選択肢が入れ替わるので、選べる候補を並べ直す（選択の変更も反映する）
+    new MutationObserver(render).observe(tagsSelect, { childList: true });
+    tagsSelect.addEventListener('change', render);
+  });
+})();
@@ -0,0 +1,102 @@
+// 検索欄の入力候補（input[data-suggest-url]）
+//
+// 入力が止まってから少し待って候補 API に問い合わせ、問題のタイトル・単元名を下に並べる。
+// 前の問い合わせが終わる前に次の入力があれば、前のものは中止する。
+(function () {
+  'use strict';
+
+  const DELAY = 120;
+  const LABELS = { tag: '単元', problem: '問題' };
+
+  function bindSuggest(input) {
+    const list = input.parentElement.querySelector('.suggest-list');
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function close() {
+      list.hidden = true;
+      list.replaceChildren();
+      active = -1;
+    }
+
+    function render(results) {
+      list.replaceChildren(...results.map((item) => {
+        const li = document.createElement('li');
+        const link = document.createElement('a');
+        const kind = document.createElement('span');
+        link.href = item.url;
+        kind.className = 'suggest-kind';
+        kind.textContent = LABELS[item.type] || item.type;
+        link.append(kind, document.createTextNode(item.label));
+        li.append(link);
+        return li;
+      }));
+      list.hidden = results.length === 0;
+      active = -1;
+    }
+
+    function highlight(index) {
+      const items = list.querySelectorAll('li');
+      if (!items.length) {
+        return;
+      }
+      active = (index + items.length) % items.length;
+      items.forEach((item, i) => item.classList.toggle('active', i === active));
+    }
+
+    async function fetchSuggestions(query) {
+      if (controller) {
+        controller.abort();
+      }
+      controller = new AbortController();
+      try {
+        const url = `${input.dataset.suggestUrl}?${new URLSearchParams({ q: query })}`;
+        const response = await fetch(url, { credentials: 'same-origin', signal: controller.signal });
+        if (response.ok) {
+          const data = await response.json();
+          if (input.value.trim() === query) {
+            render(data.results);
+          }
+        }
+      } catch (err) {
+        if (err.name !== 'AbortError') {
+          console.log('Suggest error:', err);
+        }
+      }
+    }
+
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const query = input.value.trim();
+      if (!query) {
+        close();
+        return;
+      }
+      timer = setTimeout(() => fetchSuggestions(query), DELAY);
+    });
+
+    input.addEventListener('keydown', (event) => {
+      if (list.hidden) {
+        return;
+      }
+      if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+        event.preventDefault();
+        highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+      } else if (event.key === 'Enter' && active >= 0) {
+        // 候補を選んでいるときは検索ではなく候補のページへ
+        event.preventDefault();
+        window.location.href = list.querySelectorAll('a')[active].href;
+      } else if (event.key === 'Escape') {
+        close();
+      }
+    });
+
+    // 候補のクリックが先に処理されるよう、閉じるのは少し遅らせる
+    input.addEventListener('blur', () => setTimeout(close, 150));
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('input[data-suggest-url]').forEach(bindSuggest);
+  });
+})();
@@ -0,0 +1,156 @@
+# 学習統計（UserStat）の集計
+#
+# 問題 1 問が統計に与える寄与（総数・学年・登録週・未記入のヒント・単元タグ・科目）を求め、
+# 保存・削除・単元タグの付け替えのたびに「変更前との差分」だけを UserStat に足し引きする（signals.py）。
+# 統計ページはユーザーの UserStat の行を読むだけで、Problem や中間テーブルを集計しない。
+# 差分で追えない変更（所有者の変更・単元の科目の変更・学年や単元の削除）は、そのユーザーの分を作り直す。
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Grade, Problem, Subject, Tag, UserStat
+
+HINT_FIELDS = ('hint_approach', 'hint_formula', 'hint_technique')
+NO_GRADE = 'none'
+
+
+def week_key(created_at):
+    """登録週（その週の月曜日の日付）"""
+    day = timezone.localtime(created_at).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def scalar_contributions(grade_id, created_at, hints):
+    """問題の列だけで決まる寄与。hints は {ヒントのフィールド名: 本文}"""
+    counts = Counter({
+        (UserStat.TOTAL, ''): 1,
+        (UserStat.GRADE, str(grade_id) if grade_id else NO_GRADE): 1,
+        (UserStat.WEEK, week_key(created_at)): 1,
+    })
+    for field in HINT_FIELDS:
+        if not (hints.get(field) or '').strip():
+            counts[(UserStat.MISSING_HINT, field)] += 1
+    return counts
+
+
+def tag_contributions(tag_ids, subject_of):
+    """単元タグで決まる寄与。科目は同じ科目の単元がいくつあっても 1 問と数える"""
+    counts = Counter((UserStat.TAG, str(tag_id)) for tag_id in tag_ids)
+    subjects = {subject_of[tag_id] for tag_id in tag_ids if subject_of.get(tag_id)}
+    counts.update((UserStat.SUBJECT, str(subject_id)) for subject_id in subjects)
+    return counts
+
+
+def subjects_for_tags(tag_ids):
+    return dict(Tag.objects.filter(pk__in=tag_ids).values_list('pk', 'subject_id'))
+
+
+def tags_by_problem(problem_ids):
+    """{problem_id: 単元タグ ID の集合}（中間テーブルから）"""
+    tags = {problem_id: set() for problem_id in problem_ids}
+    rows = Problem.tags.through.objects.filter(problem_id__in=tags.keys()).values_list('problem_id', 'tag_id')
+    for problem_id, tag_id in rows:
+        tags[problem_id].add(tag_id)
+    return tags
+
+
+def apply_deltas(user_id, deltas):
+    """{(dimension, key): 増減} を UserStat に足し込む。0 になった行は消す"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        UserStat.objects.bulk_create(
+            [UserStat(user_id=user_id, dimension=dimension, key=key, count=0) for dimension, key in deltas],
+            ignore_conflicts=True,
+        )
+        by_delta = {}
+        for (dimension, key), delta in deltas.items():
+            by_delta.setdefault(delta, Q())
+            by_delta[delta] |= Q(dimension=dimension, key=key)
+        for delta, condition in by_delta.items():
+            UserStat.objects.filter(condition, user_id=user_id).update(count=F('count') + delta)
+        UserStat.objects.filter(user_id=user_id, count__lte=0).delete()
+
+
+def diff(before, after):
+    deltas = Counter(after)
+    deltas.subtract(before)
+    return deltas
+
+
+def compute_user_stats(user_id):
+    """1 ユーザー分を Problem と中間テーブルから集計する（作り直し用）"""
+    counts = Counter()
+    problem_ids = []
+    problems = (
+        Problem.objects
+        .filter(user_id=user_id)
+        .values_list('pk', 'grade_id', 'created_at', *HINT_FIELDS)
+        .iterator(chunk_size=500)
+    )
+    for pk, grade_id, created_at, *hints in problems:
+        problem_ids.append(pk)
+        counts.update(scalar_contributions(grade_id, created_at, dict(zip(HINT_FIELDS, hints))))
+
+    tags = tags_by_problem(problem_ids)
+    subject_of = subjects_for_tags(set().union(*tags.values()) if tags else set())
+    for tag_ids in tags.values():
+        counts.update(tag_contributions(tag_ids, subject_of))
+    return counts
+
+
+def rebuild_user_stats(user_ids):
+    """指定したユーザーの UserStat を集計し直して置き換える"""
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        counts = compute_user_stats(user_id)
+        with transaction.atomic():
+            UserStat.objects.filter(user_id=user_id).delete()
+            UserStat.objects.bulk_create([
+                UserStat(user_id=user_id, dimension=dimension, key=key, count=count)
+                for (dimension, key), count in counts.items() if count > 0
+            ])
+
+
+def stats_for_user(user):
+    """統計ページ用に UserStat の行を並べ替え、学年・科目・単元の名前を付ける"""
+    rows = {}
+    for dimension, key, count in UserStat.objects.filter(user=user).values_list('dimension', 'key', 'count'):
+        rows.setdefault(dimension, {})[key] = count
+
+    def named(dimension, queryset, none_label=None):
+        counts = rows.get(dimension, {})
+        items = [
+            {'name': name, 'count': counts[str(pk)]}
+            for pk, name in queryset.filter(pk__in=[key for key in counts if key.isdigit()]).values_list('pk', 'name')
+        ]
+        if none_label and counts.get(NO_GRADE):
+            items.append({'name': none_label, 'count': counts[NO_GRADE]})
+        return items
+
+    total = rows.get(UserStat.TOTAL, {}).get('', 0)
+    missing = rows.get(UserStat.MISSING_HINT, {})
+    weeks = sorted(rows.get(UserStat.WEEK, {}).items(), reverse=True)
+    return {
+        'total': total,
+        'by_grade': named(UserStat.GRADE, Grade.objects.order_by('order'), none_label='学年なし'),
+        'by_subject': named(UserStat.SUBJECT, Subject.objects.order_by('grade__order', 'order', 'name')),
+        'by_tag': sorted(
+            named(UserStat.TAG, Tag.objects.order_by('grade__order', 'order', 'name')),
+            key=lambda item: -item['count'],
+        ),
+        'by_week': [{'week': week, 'count': count} for week, count in weeks],
+        'hint_completeness': [
+            {'field': field, 'label': label, 'missing': missing.get(field, 0), 'filled': total - missing.get(field, 0)}
+            for field, label in (
+                ('hint_approach', '方針'),
+                ('hint_formula', '公式'),
+                ('hint_technique', 'コツ'),
+            )
+        ],
+    }
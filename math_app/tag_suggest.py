@@ -0,0 +1,181 @@
+# 問題登録フォームの単元タグ候補（タイトル・ヒントの語 → 単元の共起）
+#
+# 語は正規化した文字 bigram（日本語は分かち書きしないため）。TagTermIndex に
+# (範囲, 語, 単元, 問題数) を持つ。範囲はユーザー ID（自分の履歴）と 0（全ユーザー）、
+# 単元 0 はその語を含む問題の総数、語 '' は問題数そのもの（単元ごとの件数・全体の件数）。
+# 問題の保存・削除・単元の付け替えのたびに、変わった (語, 単元) の組だけを足し引きする（signals.py）。
+#
+# 採点：入力の語のうち珍しい（idf の大きい）ものを MAX_QUERY_TERMS 個選び、
+#   score(単元) = Σ 範囲の重み × idf(語) × P(単元 | 語)
+# を求める。読むのは索引の 2 クエリ（語の総数 → 選んだ語の単元別件数）だけ。
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Problem, Tag, TagTermIndex
+
+# 語を取り出すフィールド
+TEXT_FIELDS = ('title', 'hint_approach', 'hint_formula', 'hint_technique')
+
+GLOBAL_SCOPE = 0
+TOTAL_TAG = 0
+PRIOR_TERM = ''
+
+# 1 問から取り出す語の上限（ヒントが長くても索引の更新量を一定にする）
+MAX_TEXT_LENGTH = 400
+# 採点に使う語の数
+MAX_QUERY_TERMS = 32
+# 自分の履歴の重み（全ユーザーの履歴は 1）
+USER_WEIGHT = 2.0
+MAX_SUGGESTIONS = 5
+MIN_SCORE = 0.1
+
+_IGNORED = re.compile(r'[\s\W_]+')
+_MATH = re.compile(r'\$[^$]*\$|\\\(.*?\\\)|\\\[.*?\\\]', re.DOTALL)
+
+
+def problem_terms(*texts):
+    """タイトル・ヒントから語（文字 bigram）の集合を作る。数式と記号は除く"""
+    text = ' '.join(text or '' for text in texts)
+    text = _MATH.sub(' ', unicodedata.normalize('NFKC', text).casefold())[:MAX_TEXT_LENGTH]
+    terms = set()
+    for chunk in _IGNORED.split(text):
+        if len(chunk) == 1:
+            terms.add(chunk)
+        terms.update(chunk[i:i + 2] for i in range(len(chunk) - 1))
+    return terms
+
+
+def contributions(terms, tag_ids):
+    """1 問が索引に与える (語, 単元) の組"""
+    terms = set(terms) | {PRIOR_TERM}
+    tag_ids = set(tag_ids) | {TOTAL_TAG}
+    return {(term, tag_id) for term in terms for tag_id in tag_ids}
+
+
+def apply_term_deltas(user_id, removed, added):
+    """(語, 単元) の組を、その利用者の範囲と全体の範囲の両方で増減する"""
+    removed, added = set(removed), set(added)
+    deltas = {pair: -1 for pair in removed - added}
+    deltas.update({pair: 1 for pair in added - removed})
+    if not deltas:
+        return
+    scopes = (user_id, GLOBAL_SCOPE)
+    with transaction.atomic():
+        TagTermIndex.objects.bulk_create(
+            [
+                TagTermIndex(scope=scope, term=term, tag_id=tag_id, count=0)
+                for scope in scopes for (term, tag_id), delta in deltas.items() if delta > 0
+            ],
+            ignore_conflicts=True,
+            batch_size=500,
+        )
+        for delta in (1, -1):
+            by_tag = defaultdict(list)
+            for (term, tag_id), value in deltas.items():
+                if value == delta:
+                    by_tag[tag_id].append(term)
+            for tag_id, terms in by_tag.items():
+                rows = TagTermIndex.objects.filter(scope__in=scopes, tag_id=tag_id, term__in=terms)
+                rows.update(count=F('count') + delta)
+                if delta < 0:
+                    rows.filter(count__lte=0).delete()
+
+
+def hint_texts(values):
+    return tuple(values.get(field) for field in TEXT_FIELDS)
+
+
+def rebuild_term_index(batch_size=500):
+    """全問題から索引を作り直す。戻り値は処理した問題数"""
+    counts = Counter()
+    processed = 0
+    problems = (
+        Problem.objects
+        .order_by('pk')
+        .values('pk', 'user_id', *TEXT_FIELDS)
+        .iterator(chunk_size=batch_size)
+    )
+    batch = []
+
+    def flush():
+        tags = defaultdict(set)
+        rows = Problem.tags.through.objects.filter(problem_id__in=[row['pk'] for row in batch])
+        for problem_id, tag_id in rows.values_list('problem_id', 'tag_id'):
+            tags[problem_id].add(tag_id)
+        for row in batch:
+            for term, tag_id in contributions(problem_terms(*hint_texts(row)), tags[row['pk']]):
+                counts[(row['user_id'], term, tag_id)] += 1
+                counts[(GLOBAL_SCOPE, term, tag_id)] += 1
+
+    for row in problems:
+        batch.append(row)
+        processed += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    with transaction.atomic():
+        TagTermIndex.objects.all().delete()
+        TagTermIndex.objects.bulk_create(
+            (TagTermIndex(scope=scope, term=term, tag_id=tag_id, count=count)
+             for (scope, term, tag_id), count in counts.items()),
+            batch_size=1000,
+        )
+    return processed
+
+
+def suggest_tags(user_id, text, grade_id=None, limit=MAX_SUGGESTIONS):
+    """[{'id', 'name', 'score'}, ...]（score の高い順）"""
+    terms = problem_terms(text)
+    if not terms:
+        return []
+    scopes = {user_id: USER_WEIGHT, GLOBAL_SCOPE: 1.0}
+
+    # 1. 語を含む問題の数（と各範囲の問題数）から idf を求め、珍しい語だけを残す
+    totals = {}
+    rows = TagTermIndex.objects.filter(
+        scope__in=scopes, tag_id=TOTAL_TAG, term__in=terms | {PRIOR_TERM}
+    ).values_list('scope', 'term', 'count')
+    for scope, term, count in rows:
+        totals[(scope, term)] = count
+    idf = {}
+    for (scope, term), count in totals.items():
+        if term != PRIOR_TERM:
+            size = totals.get((scope, PRIOR_TERM), count)
+            idf[(scope, term)] = math.log(1 + size / count)
+    chosen = sorted(idf, key=idf.get, reverse=True)[:MAX_QUERY_TERMS]
+    if not chosen:
+        return []
+
+    # 2. 選んだ語の単元別の件数
+    condition = Q()
+    for scope in scopes:
+        scope_terms = [term for term_scope, term in chosen if term_scope == scope]
+        if scope_terms:
+            condition |= Q(scope=scope, term__in=scope_terms)
+    # 語の重みの合計で割り、すべての語がいつもその単元と出てくるとき 1 になるようにする
+    weight = sum(scopes[scope] * idf[(scope, term)] for scope, term in chosen)
+    scores = Counter()
+    rows = TagTermIndex.objects.filter(condition).exclude(tag_id=TOTAL_TAG).values_list('scope', 'term', 'tag_id', 'count')
+    for scope, term, tag_id, count in rows:
+        scores[tag_id] += scopes[scope] * idf[(scope, term)] * count / totals[(scope, term)] / weight
+
+    tags = Tag.objects.filter(pk__in=scores.keys())
+    if grade_id:
+        tags = tags.filter(grade_id=grade_id)
+    names = dict(tags.values_list('pk', 'name'))
+    ranked = [
+        (tag_id, score) for tag_id, score in scores.most_common()
+        if tag_id in names and score >= MIN_SCORE
+    ]
+    return [
+        {'id': tag_id, 'name': names[tag_id], 'score': round(score, 3)}
+        for tag_id, score in ranked[:limit]
+    ]
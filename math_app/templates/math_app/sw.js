@@ -0,0 +1,147 @@
+// MathHint Collector の Service Worker（views.service_worker がテンプレートから生成する）
+//
+// - アプリの外枠（CSS・JS・アイコン）はインストール時に保存する
+// - 問題一覧・問題詳細・単元別ページは network-first：毎回取り直し（変わっていなければ 304）、
+//   オフラインのときだけ保存済みのものを返す。Cache-Control: no-store のページ（メッセージを出したもの）は保存しない
+// - 学年・科目・単元 API、問題画像は stale-while-revalidate：保存済みのものをすぐ返し、裏で取り直して保存し直す
+// - POST など GET 以外のリクエストの前にはページのキャッシュを消す（編集直後に古いページを出さない）
+// - ログアウト時は利用者ごとの内容（ページ・API・画像）を消す
+const VERSION = 'v{{ cache_version }}';
+const SHELL_CACHE = `mathhint-shell-${VERSION}`;
+const PAGE_CACHE = `mathhint-pages-${VERSION}`;
+const DATA_CACHE = `mathhint-data-${VERSION}`;
+const MEDIA_CACHE = `mathhint-media-${VERSION}`;
+const CURRENT_CACHES = [SHELL_CACHE, PAGE_CACHE, DATA_CACHE, MEDIA_CACHE];
+
+const APP_SHELL = {{ app_shell|safe }};
+
+// キャッシュに残す件数の上限（古いものから消す）
+const MAX_PAGES = 40;
+const MAX_MEDIA = 120;
+
+const PAGE_PATTERNS = [
+  /^\/problems\/$/,
+  /^\/problem\/\d+\/$/,
+  /^\/tag\/\d+\/$/,
+];
+// 学年・科目・単元 API だけ（問題 API は ETag で取り直すので保存しない）
+const DATA_PATTERNS = [
+  /^\/api\/(grades|subjects)\//,
+];
+const LIST_PATH = '{% url "problem_list" %}';
+const LOGOUT_PATH = '{% url "logout" %}';
+const MEDIA_PATH = '{{ media_url }}';
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then((cache) => cache.addAll(APP_SHELL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names
+          .filter((name) => name.startsWith('mathhint-') && !CURRENT_CACHES.includes(name))
+          .map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+async function trimCache(cacheName, maxEntries) {
+  const cache = await caches.open(cacheName);
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(0, keys.length - maxEntries)).map((key) => cache.delete(key)));
+}
+
+function isCacheable(response, allowOpaque) {
+  if (allowOpaque && response.type === 'opaque') {
+    return true;
+  }
+  // ログイン画面へのリダイレクトやエラー、保存を禁じられたものは保存しない
+  const cacheControl = response.headers.get('Cache-Control') || '';
+  return response.ok && !response.redirected && !/no-store/i.test(cacheControl);
+}
+
+async function store(cache, request, response, cacheName, maxEntries) {
+  await cache.delete(request);  // 入れ直して「最近見たもの」を後ろに回す
+  await cache.put(request, response);
+  if (maxEntries) {
+    await trimCache(cacheName, maxEntries);
+  }
+}
+
+async function staleWhileRevalidate(event, cacheName, maxEntries, allowOpaque = false) {
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(event.request);
+
+  const network = fetch(event.request).then(async (response) => {
+    if (isCacheable(response, allowOpaque)) {
+      await store(cache, event.request, response.clone(), cacheName, maxEntries);
+    }
+    return response;
+  });
+
+  if (cached) {
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+  }
+  return network;
+}
+
+async function offlinePage(event) {
+  const cache = await caches.open(PAGE_CACHE);
+  try {
+    const response = await fetch(event.request);
+    if (isCacheable(response, false)) {
+      event.waitUntil(store(cache, event.request, response.clone(), PAGE_CACHE, MAX_PAGES));
+    }
+    return response;
+  } catch (err) {
+    // オフライン：保存済みのページ、なければ保存済みの問題一覧を出す
+    const fallback = (await cache.match(event.request)) || (await cache.match(LIST_PATH));
+    return fallback || new Response('オフラインのため表示できません', {
+      status: 503,
+      headers: { 'Content-Type': 'text/plain; charset=utf-8' },
+    });
+  }
+}
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+
+  if (url.origin !== self.location.origin) {
+    // MathJax などの CDN
+    if (request.method === 'GET' && url.hostname === 'cdn.jsdelivr.net') {
+      event.respondWith(staleWhileRevalidate(event, SHELL_CACHE, 0, true));
+    }
+    return;
+  }
+
+  if (request.method !== 'GET') {
+    event.respondWith(caches.delete(PAGE_CACHE).then(() => fetch(request)));
+    return;
+  }
+
+  if (url.pathname === LOGOUT_PATH) {
+    event.respondWith(
+      Promise.all([PAGE_CACHE, DATA_CACHE, MEDIA_CACHE].map((name) => caches.delete(name))).then(() => fetch(request))
+    );
+    return;
+  }
+
+  if (request.mode === 'navigate' && PAGE_PATTERNS.some((pattern) => pattern.test(url.pathname))) {
+    event.respondWith(offlinePage(event));
+  } else if (DATA_PATTERNS.some((pattern) => pattern.test(url.pathname))) {
+    event.respondWith(staleWhileRevalidate(event, DATA_CACHE));
+  } else if (url.pathname.startsWith(MEDIA_PATH)) {
+    event.respondWith(staleWhileRevalidate(event, MEDIA_CACHE, MAX_MEDIA));
+  } else if (APP_SHELL.includes(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event, SHELL_CACHE));
+  }
+});
@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import m2m_changed
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import db as replica_db
+from . import typeahead
+from .api import decode_sync_cursor, encode_cursor, encode_sync_cursor
+from .views import ProblemCardsView, ProblemListView
+from .dedup import MAX_SIGNATURE_LENGTH, find_similar_to_problem
+from .dhash import dhash
+from .imagehash import find_duplicates_for_problem, hamming
+from .legacy_hints import LAST_STATE_WITH_HINT
+from .markup import EXCERPT_LENGTH, render_hint
+from .middleware import REPLICA_PIN_COOKIE
+from .models import Grade, ImageFingerprint, Problem, Question, RelatedProblem, Subject, Tag, TagTermIndex, UserStat
+from .quiz import QUIZ_SEEN_SESSION_KEY
+from .ratelimit import take_token
+from .related import update_related
+from .stats import compute_user_stats
+from .tag_suggest import rebuild_term_index, suggest_tags
+from .watermarks import get_watermark
+
+# テンプレートを描画するテストでは、collectstatic のマニフェストがなくても static を解決できるようにする
+plain_static = override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+# ==============================================================================
+# レート制限（ratelimit.py）
+# ==============================================================================
+@plain_static
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'question': '3/600', 'signup': '3/600'})
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_burst_then_refill(self):
+        now = 1_000_000.0
+        self.assertEqual([take_token('t', 3, 200, now)[0] for _ in range(3)], [True, True, True])
+        self.assertEqual(take_token('t', 3, 200, now), (False, 200))
+        # 補充間隔ごとに 1 回ずつ戻る
+        self.assertEqual(take_token('t', 3, 200, now + 199), (False, 1))
+        self.assertEqual(take_token('t', 3, 200, now + 200), (True, 0))
+        self.assertFalse(take_token('t', 3, 200, now + 200)[0])
+
+    def test_throttled_post_returns_429(self):
+        url = reverse('question')
+        for _ in range(3):
+            self.assertNotEqual(self.client.post(url, {}, secure=True).status_code, 429)
+        response = self.client.post(url, {}, secure=True)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 200)
+
+        # フォームの表示は数えない
+        self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+
+    def test_scopes_are_separate(self):
+        for _ in range(4):
+            self.client.post(reverse('question'), {}, secure=True)
+        self.assertNotEqual(self.client.post(reverse('signup'), {}, secure=True).status_code, 429)
+
+
+# ==============================================================================
+# 似た問題の検出（dedup.py、MinHash + LSH）
+# ==============================================================================
+class DuplicateProblemTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dedup-user', password='pass')
+        self.other = User.objects.create_user('dedup-other', password='pass')
+
+    def create(self, user, title, **hints):
+        return Problem.objects.create(user=user, title=title, **hints)
+
+    def test_finds_near_duplicates_of_the_same_user(self):
+        original = self.create(self.user, '二次関数 y=x^2-4x+3 の最小値を求めよ', hint_approach='平方完成して頂点を求める')
+        near = self.create(self.user, '二次関数 y=x^2-4x+5 の最小値を求めよ', hint_approach='平方完成して頂点を求める')
+        self.create(self.user, '三角形の外接円の半径', hint_approach='正弦定理を使う')
+        self.create(self.other, '二次関数 y=x^2-4x+3 の最小値を求めよ', hint_approach='平方完成して頂点を求める')
+
+        matches = find_similar_to_problem(near)
+        self.assertEqual([problem_id for problem_id, _ in matches], [original.pk])
+        self.assertGreater(matches[0][1], 0.6)
+
+    def test_signature_uses_a_bounded_prefix(self):
+        prefix = '整数の性質' * (MAX_SIGNATURE_LENGTH // 5)
+        first = self.create(self.user, prefix + '前半と同じ後半はこちら')
+        second = self.create(self.user, prefix + 'まったく違う末尾の文章')
+        self.assertEqual(find_similar_to_problem(second), [(first.pk, 1.0)])
+
+    def test_reindexes_only_when_text_changes(self):
+        problem = self.create(self.user, '数列の和', hint_formula='等差数列の和の公式')
+        problem = Problem.objects.get(pk=problem.pk)
+        with mock.patch('math_app.signals.index_problem') as index_problem:
+            problem.save()
+            problem.hint_technique = '階差をとる'
+            problem.save()
+        self.assertEqual(index_problem.call_count, 1)
+
+        # 一覧用に一部の列だけ読んだ問題の保存でも作り直さない
+        partial = Problem.objects.only('pk', 'user_id', 'title').get(pk=problem.pk)
+        with mock.patch('math_app.signals.index_problem') as index_problem:
+            partial.save()
+        index_problem.assert_not_called()
+
+
+# ==============================================================================
+# フラッシュメッセージを出したページのキャッシュ（MessageCacheMiddleware）
+# ==============================================================================
+@plain_static
+class MessageCacheTests(TestCase):
+
+    def test_page_showing_messages_is_not_stored(self):
+        User.objects.create_user('message-user', password='pass')
+        response = self.client.post(
+            reverse('login'), {'username': 'message-user', 'password': 'pass'}, secure=True, follow=True,
+        )
+        self.assertContains(response, 'ログインしました')
+        self.assertIn('no-store', response['Cache-Control'])
+
+        response = self.client.get(reverse('problem_list'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('no-store', response.get('Cache-Control', ''))
+
+
+
+# ==============================================================================
+# 旧 Hint の畳み込み（Hint テーブルが残っている 0017 の状態から始める）
+# ==============================================================================
+class FoldLegacyHintsTests(TransactionTestCase):
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([LAST_STATE_WITH_HINT])
+        self.apps = executor.loader.project_state(LAST_STATE_WITH_HINT).apps
+        LegacyProblem = self.apps.get_model('math_app', 'Problem')
+        Hint = self.apps.get_model('math_app', 'Hint')
+        user = User.objects.create_user('fold-user', password='pass')
+        self.problem = LegacyProblem.objects.create(user_id=user.pk, title='二次関数の最大値', hint_approach='軸で場合分け')
+        Hint.objects.create(problem_id=self.problem.pk, stage_type=0, content='軸で場合分け')
+        Hint.objects.create(problem_id=self.problem.pk, stage_type=1, content='平方完成 $a<b$')
+
+    def tearDown(self):
+        self.migrate_to_latest()
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def assertFolded(self):
+        problem = Problem.objects.get(pk=self.problem.pk)
+        self.assertEqual(problem.hint_approach, '軸で場合分け')
+        self.assertEqual(problem.hint_formula, '平方完成 $a<b$')
+        self.assertEqual(problem.hint_formula_html, '<p>平方完成 $a&lt;b$</p>')
+        self.assertEqual(problem.hint_excerpt, '軸で場合分け')
+        # API の ETag・差分同期が変更として扱う
+        self.assertGreater(problem.updated_at, self.problem.updated_at)
+
+    def test_command_then_migrate(self):
+        call_command('fold_legacy_hints', stdout=StringIO())
+        self.assertEqual(self.apps.get_model('math_app', 'Hint').objects.count(), 0)
+        self.migrate_to_latest()
+        self.assertFolded()
+
+    def test_migration_folds_remaining_hints(self):
+        self.migrate_to_latest()
+        self.assertNotIn('math_app_hint', connection.introspection.table_names())
+        self.assertFolded()
+
+
+# ==============================================================================
+# 学習統計（UserStat）の差分更新
+# ==============================================================================
+class TaxonomyMixin:
+    """学年・科目・単元と、2 人の利用者"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats-user', password='pass')
+        self.other = User.objects.create_user('other-user', password='pass')
+        self.grade = Grade.objects.create(code='high1', name='高1', order=4)
+        self.grade2 = Grade.objects.create(code='high2', name='高2', order=5)
+        self.algebra = Subject.objects.create(grade=self.grade, name='数学I', order=1)
+        self.geometry = Subject.objects.create(grade=self.grade, name='数学A', order=2)
+        self.quadratic = Tag.objects.create(grade=self.grade, subject=self.algebra, name='二次関数')
+        self.trig = Tag.objects.create(grade=self.grade, subject=self.algebra, name='三角比')
+        self.triangle = Tag.objects.create(grade=self.grade, subject=self.geometry, name='図形の性質')
+
+    def create_problem(self, user, tags, **fields):
+        problem = Problem.objects.create(user=user, grade=self.grade, **fields)
+        problem.tags.set(tags)
+        return problem
+
+    def stored_stats(self, user):
+        return {
+            (dimension, key): count
+            for dimension, key, count in UserStat.objects.filter(user=user).values_list('dimension', 'key', 'count')
+        }
+
+    def term_index(self):
+        return set(TagTermIndex.objects.filter(count__gt=0).values_list('scope', 'term', 'tag_id', 'count'))
+
+    def assertTermIndexMatchesRebuild(self):
+        incremental = self.term_index()
+        rebuild_term_index()
+        self.assertEqual(incremental, self.term_index())
+
+    def assertStatsMatchRebuild(self):
+        for user in (self.user, self.other):
+            expected = {key: count for key, count in compute_user_stats(user.pk).items() if count > 0}
+            self.assertEqual(self.stored_stats(user), expected)
+
+
+class UserStatSignalTests(TaxonomyMixin, TestCase):
+    """シグナルで足し引きした統計が、作り直した統計と一致する"""
+
+    def test_problem_lifecycle(self):
+        first = self.create_problem(
+            self.user, [self.quadratic], title='二次関数の最大値', hint_approach='軸の位置で場合分け',
+        )
+        self.create_problem(self.other, [self.quadratic, self.triangle], title='最大値と図形', hint_formula='平方完成')
+        self.assertStatsMatchRebuild()
+        self.assertEqual(self.stored_stats(self.user)[('total', '')], 1)
+
+        # ヒント・学年の書き換え
+        first.hint_formula = '頂点の座標 $(p, q)$'
+        first.hint_approach = ''
+        first.grade = self.grade2
+        first.save()
+        self.assertStatsMatchRebuild()
+
+        # 単元タグの付け替え
+        first.tags.add(self.trig, self.triangle)
+        self.assertStatsMatchRebuild()
+        first.tags.remove(self.quadratic)
+        self.assertStatsMatchRebuild()
+        first.tags.clear()
+        self.assertStatsMatchRebuild()
+        self.quadratic.problems.add(first)
+        self.assertStatsMatchRebuild()
+
+        # 保存済みの古いインスタンスからの削除
+        stale = Problem.objects.get(pk=first.pk)
+        first.hint_technique = '別のヒント'
+        first.save()
+        stale.delete()
+        self.assertStatsMatchRebuild()
+        self.assertEqual(self.stored_stats(self.user), {})
+
+    def test_taxonomy_changes(self):
+        self.create_problem(self.user, [self.quadratic, self.trig], title='三角比と二次関数', hint_technique='置き換え')
+        self.create_problem(self.user, [self.trig], title='正弦定理', hint_approach='外接円')
+
+        # 単元の科目を変える
+        self.trig.subject = self.geometry
+        self.trig.save()
+        self.assertStatsMatchRebuild()
+
+        self.trig.delete()
+        self.assertStatsMatchRebuild()
+
+        self.grade.delete()
+        self.assertStatsMatchRebuild()
+
+    def test_user_deletion(self):
+        self.create_problem(self.user, [self.quadratic], title='二次関数', hint_approach='グラフ')
+        self.create_problem(self.other, [self.quadratic], title='二次不等式', hint_approach='グラフ')
+        self.other.delete()
+        self.assertFalse(UserStat.objects.filter(user_id=self.other.pk).exists())
+        self.other = self.user
+        self.assertStatsMatchRebuild()
+
+
+# ==============================================================================
+# 単元タグ候補の索引（TagTermIndex）の差分更新
+# ==============================================================================
+class TagTermIndexSignalTests(TaxonomyMixin, TestCase):
+    """シグナルで足し引きした索引が、作り直した索引と一致する"""
+
+    def test_problem_lifecycle(self):
+        first = self.create_problem(
+            self.user, [self.quadratic], title='二次関数の最大値', hint_approach='軸の位置で場合分け',
+        )
+        self.create_problem(self.other, [self.quadratic, self.triangle], title='最大値と図形', hint_formula='平方完成')
+        self.assertTermIndexMatchesRebuild()
+
+        first.title = '二次関数の最小値'
+        first.hint_formula = '頂点の座標 $(p, q)$'
+        first.save()
+        self.assertTermIndexMatchesRebuild()
+
+        first.tags.add(self.trig, self.triangle)
+        self.assertTermIndexMatchesRebuild()
+        first.tags.remove(self.quadratic)
+        self.assertTermIndexMatchesRebuild()
+        first.tags.clear()
+        self.assertTermIndexMatchesRebuild()
+        self.trig.problems.add(first)
+        self.assertTermIndexMatchesRebuild()
+        self.trig.problems.clear()
+        self.assertTermIndexMatchesRebuild()
+
+        stale = Problem.objects.get(pk=first.pk)
+        first.title = '別の題名'
+        first.save()
+        stale.delete()
+        self.assertTermIndexMatchesRebuild()
+
+    def test_tag_and_user_deletion(self):
+        self.create_problem(self.user, [self.quadratic, self.trig], title='三角比と二次関数', hint_technique='置き換え')
+        self.create_problem(self.other, [self.trig], title='正弦定理', hint_approach='外接円')
+
+        self.trig.delete()
+        self.assertFalse(TagTermIndex.objects.filter(tag_id=self.trig.pk).exists())
+        self.assertTermIndexMatchesRebuild()
+
+        self.other.delete()
+        self.assertTermIndexMatchesRebuild()
+
+    def test_independent_of_the_stats_receiver(self):
+        # 統計の受信側がなくても、変更前の単元を自分で控える
+        from . import signals
+        m2m_changed.disconnect(signals.update_stats_on_m2m, sender=Problem.tags.through)
+        try:
+            problem = self.create_problem(self.user, [self.quadratic], title='二次関数の最大値')
+            problem.tags.set([self.trig])
+            self.trig.problems.clear()
+        finally:
+            m2m_changed.connect(signals.update_stats_on_m2m, sender=Problem.tags.through)
+        self.assertTermIndexMatchesRebuild()
+
+    def test_suggests_tags_from_history(self):
+        self.create_problem(self.user, [self.quadratic], title='二次関数の最大値', hint_approach='平方完成')
+        self.create_problem(self.user, [self.triangle], title='三角形の外接円', hint_approach='正弦定理')
+        suggestions = suggest_tags(self.user.pk, '二次関数の最小値を求める')
+        self.assertEqual(suggestions[0]['id'], self.quadratic.pk)
+
+
+# ==============================================================================
+# 集計表を作るマイグレーション（作り直した結果と一致する）
+# ==============================================================================
+class BackfillMigrationTests(TaxonomyMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_problem(self.user, [self.quadratic, self.trig], title='三角比と二次関数', hint_approach='置き換え')
+        self.create_problem(self.user, [], title='数列', hint_formula='漸化式 $a_{n+1}=2a_n$')
+        self.create_problem(self.other, [self.triangle], title='図形', hint_technique='補助線')
+
+    def remigrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_user_stats_backfill(self):
+        self.remigrate(('math_app', '0021_user_watermark'))
+        self.assertStatsMatchRebuild()
+        self.assertEqual(self.stored_stats(self.user)[('total', '')], 2)
+
+    def test_term_index_backfill(self):
+        expected = self.term_index()
+        TagTermIndex.objects.all().delete()
+        self.remigrate(('math_app', '0022_user_stats'))
+        self.assertEqual(self.term_index(), expected)
+        self.assertTermIndexMatchesRebuild()
+
+
+# ==============================================================================
+# 問題一覧・詳細の条件付き GET（UserWatermark）
+# ==============================================================================
+@plain_static
+class ConditionalPageTests(TaxonomyMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.problem = self.create_problem(self.user, [self.quadratic], title='二次関数の最大値')
+        # ETag には CSRF クッキーも入るので、フォームのあるページを先に 1 回開いてクッキーを受け取っておく
+        self.get(reverse('problem_detail', args=[self.problem.pk]))
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, secure=True, **headers)
+
+    def test_unchanged_pages_return_304(self):
+        for url in (reverse('problem_list'), reverse('problem_detail', args=[self.problem.pk])):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get(url, response['ETag']).status_code, 304)
+
+    def test_changes_invalidate_the_etag(self):
+        url = reverse('problem_list')
+        etag = self.get(url)['ETag']
+
+        self.problem.title = '二次関数の最小値'
+        self.problem.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '二次関数の最小値')
+
+        etag = response['ETag']
+        self.quadratic.name = '2次関数'
+        self.quadratic.save()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_other_users_changes_keep_the_etag(self):
+        url = reverse('problem_list')
+        etag = self.get(url)['ETag']
+        self.create_problem(self.other, [], title='別の利用者の問題')
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+    def test_grade_deletion_bumps_the_watermark(self):
+        # 単元のない学年（単元の削除による目印の更新に頼らない）
+        Problem.objects.create(user=self.other, grade=self.grade2, title='数と式')
+        before = get_watermark(self.other.pk), get_watermark(self.user.pk)
+        self.grade2.delete()
+        self.assertGreater(get_watermark(self.other.pk), before[0])
+        self.assertEqual(get_watermark(self.user.pk), before[1])
+
+
+# ==============================================================================
+# 質問の振り分け（管理画面）
+# ==============================================================================
+@plain_static
+class QuestionTriageTests(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create_superuser('triage-admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        self.questions = [
+            Question.objects.create(name=f'質問者{i}', email=f'q{i}@example.com', subject=f'件名{i}', message='本文')
+            for i in range(3)
+        ]
+        self.url = reverse('admin:math_app_question_triage')
+
+    def test_bulk_action_ignores_invalid_ids(self):
+        response = self.client.post(
+            self.url, {'action': 'mark_replied', 'ids': [str(self.questions[0].pk), 'abc', '']}, secure=True,
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(Question.objects.filter(is_replied=True).values_list('pk', flat=True)), [self.questions[0].pk],
+        )
+
+    def test_keyset_paging(self):
+        with mock.patch('math_app.admin.QuestionAdmin.triage_per_page', 2):
+            first = self.client.get(self.url, secure=True)
+            self.assertEqual([q.pk for q in first.context['questions']], [q.pk for q in self.questions[:0:-1]])
+            second = self.client.get(self.url, {'before': first.context['next_cursor']}, secure=True)
+        self.assertEqual([q.pk for q in second.context['questions']], [self.questions[0].pk])
+        self.assertIsNone(second.context['next_cursor'])
+
+
+# ==============================================================================
+# 画像の重複アップロード検出（dHash）
+# ==============================================================================
+def gradient_image(size=(320, 240), fmt='PNG', flip=False, quality=95):
+    """横方向に明るさが変わる画像のバイト列"""
+    from PIL import Image
+
+    width, height = size
+    image = Image.new('L', size)
+    image.putdata([
+        ((width - 1 - x if flip else x) * 255 // width + y * 40 // height) % 256
+        for y in range(height) for x in range(width)
+    ])
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, **({'quality': quality} if fmt == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+class DuplicateImageTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('image-user', password='pass')
+        self.other = User.objects.create_user('image-other', password='pass')
+
+    def create_problem(self, user, data, name='problem.png'):
+        return Problem.objects.create(user=user, title='図の問題', image=SimpleUploadedFile(name, data))
+
+    def test_resized_and_recompressed_images_hash_close(self):
+        original = dhash(BytesIO(gradient_image()))
+        recompressed = dhash(BytesIO(gradient_image(size=(160, 120), fmt='JPEG', quality=60)))
+        different = dhash(BytesIO(gradient_image(flip=True)))
+        self.assertLessEqual(hamming(original, recompressed), 3)
+        self.assertGreater(hamming(original, different), 3)
+
+    def test_duplicates_of_the_same_user_only(self):
+        first = self.create_problem(self.user, gradient_image())
+        copy = self.create_problem(self.user, gradient_image(size=(160, 120), fmt='JPEG'), 'copy.jpg')
+        other_users = self.create_problem(self.other, gradient_image())
+        unrelated = self.create_problem(self.user, gradient_image(flip=True))
+
+        self.assertEqual(find_duplicates_for_problem(copy), [first.pk])
+        self.assertEqual(find_duplicates_for_problem(other_users), [])
+        self.assertEqual(find_duplicates_for_problem(unrelated), [])
+
+    def test_fingerprints_follow_image_changes(self):
+        problem = self.create_problem(self.user, gradient_image())
+        fingerprint = ImageFingerprint.objects.get(problem=problem)
+        self.assertEqual(fingerprint.field, 'image')
+
+        # 画像以外の変更では作り直さない
+        problem.title = '題名だけ変更'
+        problem.save()
+        self.assertEqual(ImageFingerprint.objects.get(problem=problem).pk, fingerprint.pk)
+
+        problem.image = SimpleUploadedFile('flipped.png', gradient_image(flip=True))
+        problem.save()
+        self.assertNotEqual(ImageFingerprint.objects.get(problem=problem).dhash, fingerprint.dhash)
+
+        problem.image = None
+        problem.save()
+        self.assertFalse(ImageFingerprint.objects.filter(problem=problem).exists())
+
+    def test_unreadable_file_is_skipped(self):
+        problem = self.create_problem(self.user, b'not an image', 'broken.png')
+        self.assertFalse(ImageFingerprint.objects.filter(problem=problem).exists())
+
+
+# ==============================================================================
+# 読み取りレプリカへのルーティング（db.py・ReplicaRoutingMiddleware）
+# ==============================================================================
+@plain_static
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        self.router = replica_db.ReplicaRouter()
+        self.user = User.objects.create_user('replica-user', password='pass')
+        self.client.force_login(self.user)
+        self.grade = Grade.objects.create(code='high1', name='高1', order=4)
+        replica_db._unhealthy_until.clear()
+        self.addCleanup(replica_db._unhealthy_until.clear)
+
+    def test_router_uses_one_replica_per_request(self):
+        self.assertIsNone(self.router.db_for_read(Problem))
+
+        token = replica_db.activate_replica_reads()
+        try:
+            with mock.patch('math_app.db.pick_replica', return_value='replica1') as pick:
+                self.assertEqual(self.router.db_for_read(Problem), 'replica1')
+                self.assertEqual(self.router.db_for_read(Tag), 'replica1')
+                # 認証など他アプリのテーブルはプライマリ
+                self.assertIsNone(self.router.db_for_read(User))
+            pick.assert_called_once()
+            self.assertEqual(self.router.db_for_write(Problem), 'default')
+        finally:
+            replica_db.deactivate_replica_reads(token)
+        self.assertIsNone(self.router.db_for_read(Problem))
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch('math_app.db.connections') as connections:
+            replica = connections.__getitem__.return_value
+            replica.ensure_connection.side_effect = DatabaseError('down')
+            self.assertIsNone(replica_db.pick_replica())
+            # 失敗したレプリカは REPLICA_RETRY_SECONDS の間試さない
+            self.assertIsNone(replica_db.pick_replica())
+        replica.ensure_connection.assert_called_once()
+
+    def test_replica_views_activate_reads_until_pinned(self):
+        url = reverse('tags_by_grade', args=[self.grade.pk])
+        with mock.patch('math_app.middleware.activate_replica_reads', wraps=replica_db.activate_replica_reads) as activate:
+            self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+            self.assertEqual(activate.call_count, 1)
+
+            # レプリカ読み取りの印がないビューは対象外
+            self.client.get(reverse('problem_new'), secure=True)
+            self.assertEqual(activate.call_count, 1)
+
+            # 書き込みの後は Cookie が付き、その間はプライマリから読む
+            response = self.client.post(reverse('logout'), secure=True)
+            self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+            self.client.force_login(self.user)
+            self.client.get(url, secure=True)
+            self.assertEqual(activate.call_count, 1)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_pin_cookie_without_replicas(self):
+        response = self.client.post(reverse('logout'), secure=True)
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+
+# ==============================================================================
+# ランダム出題（quiz.py）
+# ==============================================================================
+class QuizTests(TaxonomyMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.algebra_ids = {
+            self.create_problem(self.user, [tag], title=f'代数{i}').pk
+            for i, tag in enumerate([self.quadratic, self.trig, self.quadratic])
+        }
+        self.create_problem(self.user, [self.triangle], title='図形')
+        self.create_problem(self.other, [self.quadratic], title='他の人の問題')
+
+    def draw(self, **params):
+        response = self.client.get(reverse('quiz'), params, secure=True)
+        self.assertEqual(response.status_code, 302)
+        path, query = response.url.split('?')
+        return resolve(path).kwargs['pk'], query
+
+    def test_no_repeats_within_a_round_and_subject_filter(self):
+        drawn = [self.draw(subject=self.algebra.pk) for _ in range(3)]
+        self.assertEqual({pk for pk, _ in drawn}, self.algebra_ids)
+        self.assertTrue(all(query == f'quiz=1&subject={self.algebra.pk}' for _, query in drawn))
+
+        # 一巡したら履歴をリセットして最初から
+        pk, _ = self.draw(subject=self.algebra.pk)
+        self.assertIn(pk, self.algebra_ids)
+        self.assertEqual(self.client.session[QUIZ_SEEN_SESSION_KEY], [pk])
+
+    def test_no_matching_problems(self):
+        response = self.client.get(reverse('quiz'), {'grade': self.grade2.pk}, secure=True)
+        self.assertRedirects(response, reverse('problem_list'), fetch_redirect_response=False)
+
+
+# ==============================================================================
+# 関連する問題（related.py）
+# ==============================================================================
+class RelatedProblemTests(TaxonomyMixin, TestCase):
+
+    def related(self, problem):
+        return list(
+            RelatedProblem.objects.filter(problem=problem).order_by('rank').values_list('related_id', 'score')
+        )
+
+    def test_ranking_follows_tag_changes(self):
+        first = self.create_problem(self.user, [self.quadratic, self.trig], title='1')
+        second = self.create_problem(self.user, [self.quadratic, self.trig], title='2')
+        third = self.create_problem(self.user, [self.quadratic], title='3')
+        self.create_problem(self.user, [self.triangle], title='単元が違う')
+        self.create_problem(self.other, [self.quadratic, self.trig], title='他の人の問題')
+
+        update_related()
+        self.assertFalse(Problem.objects.filter(related_dirty=True).exists())
+        self.assertEqual(self.related(first), [(second.pk, 1.0), (third.pk, 0.5)])
+
+        # 単元タグが変わった問題だけ再計算待ちになり、同点は新しい問題が先
+        third.tags.add(self.trig)
+        self.assertEqual(list(Problem.objects.filter(related_dirty=True).values_list('pk', flat=True)), [third.pk])
+        update_related()
+        self.assertEqual(self.related(first), [(third.pk, 1.0), (second.pk, 1.0)])
+
+        # 単元を外した問題は、他の問題の関連からも消える
+        second.tags.clear()
+        update_related()
+        self.assertEqual(self.related(first), [(third.pk, 1.0)])
+        self.assertEqual(self.related(second), [])
+
+        third.delete()
+        update_related()
+        self.assertEqual(self.related(first), [])
+
+
+# ==============================================================================
+# ヒントのマークアップ（markup.py）
+# ==============================================================================
+class RenderHintTests(TestCase):
+
+    def test_empty(self):
+        self.assertEqual(render_hint(''), '')
+        self.assertEqual(render_hint('  \n '), '')
+
+    def test_paragraphs_and_line_breaks(self):
+        self.assertEqual(render_hint('一行目\n二行目\n\n次の段落'), '<p>一行目<br>二行目</p><p>次の段落</p>')
+
+    def test_lists(self):
+        self.assertEqual(render_hint('- 平方完成\n・ 判別式'), '<ul><li>平方完成</li><li>判別式</li></ul>')
+        self.assertEqual(render_hint('1. 代入\n2) 整理'), '<ol><li>代入</li><li>整理</li></ol>')
+        self.assertEqual(render_hint('方針\n- 図を描く'), '<p>方針</p><ul><li>図を描く</li></ul>')
+
+    def test_escapes_html(self):
+        self.assertEqual(render_hint('<script>alert(1)</script>'), '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>')
+
+    def test_math_is_kept_and_escaped(self):
+        self.assertEqual(render_hint('条件は $a<b$ のとき'), '<p>条件は $a&lt;b$ のとき</p>')
+        # 数式の中の空行・行頭記号はマークアップとして扱わない
+        self.assertEqual(render_hint('$$x\n\n- 1$$'), '<p>$$x\n\n- 1$$</p>')
+        self.assertEqual(render_hint(r'- \(x^2\) を使う'), r'<ul><li>\(x^2\) を使う</li></ul>')
+
+    def test_placeholder_characters_in_input(self):
+        # 数式の退避に使う私用領域の文字が入力にあっても、例外にも数式の取り違えにもならない
+        self.assertEqual(render_hint('\ue0009\ue001'), '<p>9</p>')
+        self.assertEqual(render_hint('\ue0000\ue001 と $y$'), '<p>0 と $y$</p>')
+
+    def test_save_renders_hints_and_excerpt(self):
+        user = User.objects.create_user('hint-user', password='pass')
+        problem = Problem.objects.create(
+            user=user, title='t', hint_formula='- 平方完成 $a<b$', hint_technique='\ue0009\ue001 $x$',
+        )
+        self.assertEqual(problem.hint_approach_html, '')
+        self.assertEqual(problem.hint_formula_html, '<ul><li>平方完成 $a&lt;b$</li></ul>')
+        self.assertEqual(problem.hint_technique_html, '<p>9 $x$</p>')
+        self.assertEqual(problem.hint_excerpt, '- 平方完成 $a<b$')
+
+        problem.hint_approach = 'あ' * (EXCERPT_LENGTH + 10)
+        problem.save()
+        self.assertEqual(problem.hint_excerpt, 'あ' * (EXCERPT_LENGTH - 1) + '…')
+
+
+# ==============================================================================
+# 問題の JSON API（api.py）
+# ==============================================================================
+class ProblemAPITests(TaxonomyMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.problems = [
+            self.create_problem(self.user, [self.quadratic] if i % 2 else [], title=f'問題{i}')
+            for i in range(5)
+        ]
+        self.others = self.create_problem(self.other, [self.quadratic], title='他の人の問題')
+
+    def get(self, name, params=None, **kwargs):
+        return self.client.get(reverse(name, kwargs=kwargs), params or {}, secure=True)
+
+    def test_list_pages_only_own_problems(self):
+        seen = []
+        params = {'limit': 2, 'fields': 'id,title'}
+        while True:
+            data = self.get('api_problem_list', params).json()
+            self.assertTrue(all(set(row) == {'id', 'title'} for row in data['results']))
+            seen.extend(row['id'] for row in data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(seen, [problem.pk for problem in reversed(self.problems)])
+
+        tagged = self.get('api_problem_list', {'tag': self.quadratic.pk}).json()
+        self.assertEqual([row['id'] for row in tagged['results']], [self.problems[3].pk, self.problems[1].pk])
+        self.assertEqual(tagged['results'][0]['tags'], [{'id': self.quadratic.pk, 'name': '二次関数'}])
+
+    def test_list_not_modified(self):
+        response = self.get('api_problem_list')
+        again = self.client.get(
+            reverse('api_problem_list'), secure=True, HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(again.status_code, 304)
+
+        self.problems[0].title = '書き換えた'
+        self.problems[0].save()
+        changed = self.client.get(
+            reverse('api_problem_list'), secure=True, HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(changed.status_code, 200)
+
+    def test_detail_and_bulk_ownership(self):
+        detail = self.get('api_problem_detail', pk=self.problems[0].pk).json()
+        self.assertEqual(detail['title'], '問題0')
+        self.assertIn('hint_formula', detail)
+        self.assertEqual(self.get('api_problem_detail', pk=self.others.pk).status_code, 404)
+
+        ids = [self.problems[2].pk, self.others.pk, self.problems[0].pk, 999999, self.problems[2].pk]
+        bulk = self.get('api_problem_bulk', {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual([row['id'] for row in bulk['results']], [self.problems[2].pk, self.problems[0].pk])
+
+    def test_validation(self):
+        for name, params, message in [
+            ('api_problem_list', {'fields': 'id,password'}, 'unknown field(s): password'),
+            ('api_problem_list', {'limit': 'many'}, 'invalid limit'),
+            ('api_problem_list', {'cursor': 'not-a-cursor'}, 'invalid cursor'),
+            ('api_problem_list', {'tag': 'x'}, 'invalid tag'),
+            ('api_problem_bulk', {'ids': '1,x'}, 'invalid ids'),
+            ('api_problem_bulk', {}, 'ids is required'),
+            ('api_problem_bulk', {'ids': ','.join(map(str, range(1, 102)))}, 'at most 100 ids'),
+        ]:
+            with self.subTest(name=name, params=params):
+                response = self.get(name, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': message})
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.get('api_problem_list')
+        self.assertEqual(response.status_code, 302)
+
+
+# ==============================================================================
+# 差分同期（api.problem_sync）
+# ==============================================================================
+@mock.patch('math_app.api.SYNC_SETTLE_SECONDS', 0)
+class ProblemSyncTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('sync-user', password='pass')
+        self.client.force_login(self.user)
+        self.problems = [Problem.objects.create(user=self.user, title=f'問題{i}') for i in range(3)]
+
+    def sync(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        return self.client.get(reverse('api_problem_sync'), params, secure=True)
+
+    def test_initial_sync_then_no_changes(self):
+        data = self.sync().json()
+        self.assertEqual(sorted(row['id'] for row in data['changed']), sorted(p.pk for p in self.problems))
+        self.assertEqual(data['deleted'], [])
+        self.assertFalse(data['has_more'])
+
+        again = self.sync(data['cursor']).json()
+        self.assertEqual(again['changed'], [])
+        self.assertEqual(again['deleted'], [])
+
+    def test_paging(self):
+        seen = []
+        cursor = None
+        while True:
+            data = self.sync(cursor, limit=1).json()
+            seen.extend(row['id'] for row in data['changed'])
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(p.pk for p in self.problems))
+
+    def test_changes_and_deletions(self):
+        cursor = self.sync().json()['cursor']
+        edited, deleted = self.problems[0], self.problems[1]
+        edited.title = '書き換えた'
+        edited.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        data = self.sync(cursor).json()
+        self.assertEqual([row['id'] for row in data['changed']], [edited.pk])
+        self.assertEqual(data['deleted'], [deleted_id])
+
+        data = self.sync(data['cursor']).json()
+        self.assertEqual(data['changed'], [])
+        self.assertEqual(data['deleted'], [])
+
+    def test_deletion_position_advances_without_tombstones(self):
+        # 削除がなくても、削除の位置は確定済みの時刻まで進む（保持期間を過ぎて 410 にならない）
+        changed_position = decode_sync_cursor(self.sync().json()['cursor'])[0]
+        old = encode_sync_cursor(changed_position, (timezone.now() - timedelta(days=80), 0))
+        data = self.sync(old).json()
+        deleted_at = decode_sync_cursor(data['cursor'])[1][0]
+        self.assertGreater(deleted_at, timezone.now() - timedelta(minutes=1))
+
+    def test_expired_cursor(self):
+        expired = encode_sync_cursor((None, 0), (timezone.now() - timedelta(days=91), 0))
+        self.assertEqual(self.sync(expired).status_code, 410)
+
+    def test_other_users_changes_are_not_synced(self):
+        cursor = self.sync().json()['cursor']
+        other = User.objects.create_user('sync-other', password='pass')
+        Problem.objects.create(user=other, title='他の人の問題').delete()
+        Problem.objects.create(user=other, title='他の人の問題')
+
+        data = self.sync(cursor).json()
+        self.assertEqual(data['changed'], [])
+        self.assertEqual(data['deleted'], [])
+
+
+# ==============================================================================
+# 検索欄の入力候補（typeahead.py）
+# ==============================================================================
+@mock.patch('math_app.typeahead.REVALIDATE_SECONDS', 0)
+class TypeaheadTests(TaxonomyMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        typeahead._indexes.clear()
+        self.addCleanup(typeahead._indexes.clear)
+        self.client.force_login(self.user)
+        self.problem = self.create_problem(self.user, [self.quadratic], title='二次不等式の解法')
+        self.create_problem(self.user, [], title='最大値・二次関数のグラフ')
+        self.create_problem(self.user, [], title='ＡＢＣ予想')
+        self.create_problem(self.other, [self.trig], title='二次方程式（他の人）')
+
+    def labels(self, query):
+        response = self.client.get(reverse('suggest'), {'q': query}, secure=True)
+        return [(row['type'], row['label']) for row in response.json()['results']]
+
+    def test_prefix_and_word_matches(self):
+        # 単元が先、同じ種類の中では短いものから。他の人の問題・単元は出ない
+        self.assertEqual(self.labels('二次'), [
+            ('tag', '二次関数'), ('problem', '二次不等式の解法'), ('problem', '最大値・二次関数のグラフ'),
+        ])
+        self.assertEqual(self.labels('abc'), [('problem', 'ＡＢＣ予想')])
+        self.assertEqual(self.labels('三角'), [])
+        self.assertEqual(self.labels(' '), [])
+
+    def test_results_link_to_the_list_or_detail(self):
+        results = self.client.get(reverse('suggest'), {'q': '二次'}, secure=True).json()['results']
+        self.assertEqual(results[0]['url'], f"{reverse('problem_list')}?tag={self.quadratic.pk}")
+        self.assertEqual(results[1]['url'], reverse('problem_detail', kwargs={'pk': self.problem.pk}))
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.labels('積分'), [])
+        self.problem.title = '積分の計算'
+        self.problem.save()
+        self.assertEqual(self.labels('積分'), [('problem', '積分の計算')])
+
+    def test_least_recently_used_indexes_are_dropped(self):
+        with mock.patch('math_app.typeahead.MAX_USERS', 1):
+            typeahead.suggest(self.user.pk, '二次')
+            typeahead.suggest(self.other.pk, '二次')
+        self.assertEqual(list(typeahead._indexes), [self.other.pk])
+
+
+# ==============================================================================
+# 問題一覧の無限スクロール（ProblemCardsView）
+# ==============================================================================
+@plain_static
+@mock.patch.object(ProblemListView, 'paginate_by', 2)
+@mock.patch.object(ProblemCardsView, 'paginate_by', 2)
+class ProblemCardsTests(TaxonomyMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.problems = [
+            self.create_problem(self.user, [self.quadratic] if i != 2 else [], title=f'問題{i}')
+            for i in range(6)
+        ]
+        self.create_problem(self.other, [self.quadratic], title='他の人の問題')
+
+    def cards(self, cursor, **params):
+        return self.client.get(reverse('problem_cards'), {'cursor': cursor, **params}, secure=True)
+
+    def scroll(self, **params):
+        response = self.client.get(reverse('problem_list'), params, secure=True)
+        seen = [problem.pk for problem in response.context['problems']]
+        cursor = response.context.get('next_cursor')
+        while cursor:
+            response = self.cards(cursor, **params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('<html', response.content.decode())
+            seen.extend(problem.pk for problem in response.context['problems'])
+            cursor = response.get('X-Next-Cursor')
+        return seen
+
+    def test_cursor_walks_all_cards_in_order(self):
+        self.assertEqual(self.scroll(), [problem.pk for problem in reversed(self.problems)])
+
+    def test_cursor_keeps_the_tag_filter(self):
+        expected = [problem.pk for problem in reversed(self.problems) if problem.title != '問題2']
+        self.assertEqual(self.scroll(tag=self.quadratic.pk), expected)
+
+    def test_last_page_has_no_next_cursor(self):
+        last_but_two = self.problems[2]
+        response = self.cards(encode_cursor(last_but_two.created_at, last_but_two.pk))
+        self.assertEqual([problem.pk for problem in response.context['problems']],
+                         [self.problems[1].pk, self.problems[0].pk])
+        self.assertNotIn('X-Next-Cursor', response)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.cards('not-a-cursor').status_code, 400)
+
+
+# ==============================================================================
+# speculation rules による先読み（PrefetchMiddleware・PrefetchSessionMiddleware）
+# ==============================================================================
+@plain_static
+class PrefetchTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('prefetch-user', password='pass')
+        self.url = reverse('problem_list')
+
+    def login(self):
+        # ログイン後のリダイレクト先は開かず、「ログインしました」を表示待ちのまま残す
+        self.client.post(reverse('login'), {'username': 'prefetch-user', 'password': 'pass'}, secure=True)
+
+    def prefetch(self, **headers):
+        return self.client.get(self.url, secure=True, headers=headers or {'Sec-Purpose': 'prefetch'})
+
+    def test_prefetch_is_refused_while_messages_are_pending(self):
+        self.login()
+        for headers in ({'Sec-Purpose': 'prefetch'}, {'Sec-Purpose': 'prefetch;prerender'}, {'Purpose': 'prefetch'}):
+            with self.subTest(headers=headers):
+                response = self.prefetch(**headers)
+                self.assertEqual(response.status_code, 425)
+                self.assertIn('no-store', response['Cache-Control'])
+
+        # 実際に開いたときはメッセージが表示され、その後の先読みは通る
+        self.assertContains(self.client.get(self.url, secure=True), 'ログインしました')
+        response = self.prefetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'type="speculationrules"')
+
+    def test_prefetch_does_not_save_the_session(self):
+        self.login()
+        self.client.get(self.url, secure=True)
+        with mock.patch('django.contrib.sessions.backends.db.SessionStore.save') as save:
+            self.assertEqual(self.prefetch().status_code, 200)
+            save.assert_not_called()
+            self.client.get(self.url, secure=True)
+            save.assert_called()
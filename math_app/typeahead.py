@@ -0,0 +1,128 @@
+# 検索欄の入力候補（問題のタイトル・単元名の前方一致）
+#
+# ユーザーごとに「正規化した語 → 候補」をソート済みの配列で持ち、bisect で前方一致の範囲を探す。
+# 索引はワーカープロセスのメモリに、最初に使われたときに作り、最近使われていないユーザーから捨てる（LRU）。
+# 問題・単元が変わったかは UserWatermark の version で判定し、確認は REVALIDATE_SECONDS に 1 回だけ
+# （それ以外のキー入力では DB を読まない）。
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.urls import reverse
+
+from .models import Problem, Tag
+from .watermarks import get_watermark
+
+# メモリに置くユーザー数の上限（ワーカーごと）
+MAX_USERS = 200
+# UserWatermark を読み直す間隔（秒）。この間の変更は候補に出ないことがある
+REVALIDATE_SECONDS = 5
+MAX_RESULTS = 8
+# 前方一致した候補のうち、並べ替えの対象にする件数（短い接頭辞で全件を見ないように）
+MAX_SCAN = 200
+
+# タイトルを語に区切る文字（語の先頭からも一致させる）
+_SEPARATORS = re.compile(r'[\s、。，．・/／()（）「」\[\]【】,.:：;；!?！？]+')
+
+
+def normalize(text):
+    """全角英数字・半角カナをそろえ、大文字小文字を区別しない"""
+    return unicodedata.normalize('NFKC', text).casefold().strip()
+
+
+class PrefixIndex:
+    """ソート済みの (語, 候補番号) の配列。候補は (種類, ID, 表示名) のタプル"""
+
+    __slots__ = ('keys', 'refs', 'entries')
+
+    def __init__(self, entries):
+        self.entries = entries
+        pairs = set()
+        for number, (_, _, label) in enumerate(entries):
+            text = normalize(label)
+            pairs.add((text, number))
+            for word in _SEPARATORS.split(text)[1:]:
+                if word:
+                    pairs.add((word, number))
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.refs = [number for _, number in pairs]
+
+    def search(self, prefix, limit=MAX_RESULTS):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        start = bisect_left(self.keys, prefix)
+        for position in range(start, len(self.keys)):
+            if not self.keys[position].startswith(prefix):
+                break
+            number = self.refs[position]
+            if number not in seen:
+                seen.add(number)
+                found.append(number)
+                if len(found) >= MAX_SCAN:
+                    break
+        # 単元を先に、同じ種類の中では短い（完全一致に近い）ものから
+        best = heapq.nsmallest(
+            limit, found,
+            key=lambda number: (self.entries[number][0] != 'tag', len(self.entries[number][2])),
+        )
+        return [self.entries[number] for number in best]
+
+
+def build_index(user_id):
+    entries = [
+        ('tag', pk, name)
+        for pk, name in Tag.objects.filter(problems__user_id=user_id).distinct().values_list('pk', 'name')
+    ]
+    entries.extend(
+        ('problem', pk, title)
+        for pk, title in Problem.objects.filter(user_id=user_id).order_by().values_list('pk', 'title')
+    )
+    return PrefixIndex(entries)
+
+
+# user_id → [version, 最後に確認した時刻, PrefixIndex]
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_index(user_id):
+    now = time.monotonic()
+    with _lock:
+        cached = _indexes.get(user_id)
+        if cached:
+            _indexes.move_to_end(user_id)
+            if now - cached[1] < REVALIDATE_SECONDS:
+                return cached[2]
+
+    version = get_watermark(user_id)
+    if cached and cached[0] == version:
+        cached[1] = now
+        return cached[2]
+
+    index = build_index(user_id)
+    with _lock:
+        _indexes[user_id] = [version, now, index]
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def suggest(user_id, query, limit=MAX_RESULTS):
+    """[{'type', 'id', 'label', 'url'}, ...]"""
+    results = []
+    for kind, pk, label in get_index(user_id).search(query, limit):
+        if kind == 'tag':
+            url = f"{reverse('problem_list')}?tag={pk}"
+        else:
+            url = reverse('problem_detail', kwargs={'pk': pk})
+        results.append({'type': kind, 'id': pk, 'label': label, 'url': url})
+    return results
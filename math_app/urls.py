@@ -1,16 +1,23 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
 
     # 問題CRUD
     path('problems/', views.ProblemListView.as_view(), name='problem_list'),
+    path('problems/cards/', views.ProblemCardsView.as_view(), name='problem_cards'),
     path('problem/new/', views.ProblemCreateView.as_view(), name='problem_new'),
     path('problem/<int:pk>/', views.ProblemDetailView.as_view(), name='problem_detail'),
     path('problem/<int:pk>/edit/', views.ProblemUpdateView.as_view(), name='problem_edit'),
     path('problem/<int:pk>/delete/', views.ProblemDeleteView.as_view(), name='problem_delete'),
 
+    # ランダム出題
+    path('quiz/', views.quiz_view, name='quiz'),
+
+    # 学習統計
+    path('stats/', views.stats_view, name='stats'),
+
     # タグ別アーカイブ
     path('tag/<int:tag_id>/', views.TagArchiveView.as_view(), name='tag_archive'),
 
@@ -22,6 +29,18 @@ urlpatterns = [
     path('api/subjects/<int:subject_id>/tags/', views.tags_by_subject, name='tags_by_subject'),
     path('api/grades/<int:grade_id>/subjects/', views.subjects_by_grade, name='subjects_by_grade'),
 
+    # 単元タグ候補API
+    path('api/tags/suggest/', views.suggest_tags_view, name='suggest_tags'),
+
+    # 検索欄の入力候補API
+    path('api/suggest/', views.suggest_view, name='suggest'),
+
+    # 問題 JSON API（モバイルクライアント向け）
+    path('api/problems/', api.problem_list, name='api_problem_list'),
+    path('api/problems/bulk/', api.problem_bulk, name='api_problem_bulk'),
+    path('api/problems/sync/', api.problem_sync, name='api_problem_sync'),
+    path('api/problems/<int:pk>/', api.problem_detail, name='api_problem_detail'),
+
     # 認証
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -30,4 +49,8 @@ urlpatterns = [
     # 質問フォーム
     path('question/', views.question_view, name='question'),
     path('question/success/', views.question_success, name='question_success'),
+
+    # PWA
+    path('manifest.webmanifest', views.manifest, name='manifest'),
+    path('sw.js', views.service_worker, name='service_worker'),
 ]
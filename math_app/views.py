@@ -1,19 +1,33 @@
 # Django Views：問題のCRUD処理
+import json
 import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.db.models import Q
 from django.views.generic import CreateView, DetailView, ListView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.templatetags.static import static
+from django.urls import reverse, reverse_lazy
+from django.utils.http import urlencode
 
-from .models import Problem, Hint, Tag, Grade, UserProfile, Subject, Question
+from .models import Problem, Tag, Grade, UserProfile, Subject, Question, RelatedProblem
 from .forms import CustomUserCreationForm, QuestionForm
+from .api import APIError, decode_cursor, encode_cursor
+from .db import ReplicaReadMixin, read_from_replica
+from .dedup import find_similar_to_problem
+from .imagehash import find_duplicates_for_problem
+from .quiz import pick_quiz_problem
+from .ratelimit import rate_limit
+from .stats import stats_for_user
+from .tag_suggest import suggest_tags
+from .typeahead import suggest
+from .watermarks import ConditionalPageMixin
 
 logger = logging.getLogger(__name__)
 
@@ -54,13 +68,35 @@ class ProblemCreateView(LoginRequiredMixin, CreateView):
         """フォーム送信時、ログインユーザーを自動で割り当て"""
         form.instance.user = self.request.user
         messages.success(self.request, '問題を登録しました')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        
+        # 似た問題がすでに登録されていれば知らせる（保存時に作った署名で LSH を引く）
+        similar = find_similar_to_problem(self.object)
+        if similar:
+            # 似ている順（find_similar_to_problem の返す順）に並べる
+            similar_ids = [problem_id for problem_id, _ in similar[:3]]
+            titles = dict(Problem.objects.filter(pk__in=similar_ids).values_list('pk', 'title'))
+            messages.warning(
+                self.request,
+                f"似た問題がすでに登録されています：{'、'.join(titles[pk] for pk in similar_ids if pk in titles)}"
+            )
+        
+        # 同じ画像（撮り直し・再圧縮を含む）がすでにアップロードされていれば知らせる
+        duplicate_ids = find_duplicates_for_problem(self.object)
+        if duplicate_ids:
+            duplicate_ids = duplicate_ids[:3]
+            titles = dict(Problem.objects.filter(pk__in=duplicate_ids).values_list('pk', 'title'))
+            messages.warning(
+                self.request,
+                f"同じ画像がすでにアップロードされています：{'、'.join(titles[pk] for pk in duplicate_ids if pk in titles)}"
+            )
+        return response
 
 
 # ==============================================================================
 # 2) 問題詳細ビュー（DetailView + ヒント編集機能）
 # ==============================================================================
-class ProblemDetailView(LoginRequiredMixin, DetailView):
+class ProblemDetailView(ReplicaReadMixin, LoginRequiredMixin, ConditionalPageMixin, DetailView):
     """
     問題の詳細を表示し、ヒント（方針・公式・コツ）を表示・編集するビュー
     """
@@ -84,9 +120,66 @@ class ProblemDetailView(LoginRequiredMixin, DetailView):
         context['hint_technique'] = problem.hint_technique
         context['tags'] = problem.tags.all()
         
+        # 関連する問題（事前計算済みの上位 k 件を索引で 1 回だけ読む）
+        context['related_problems'] = (
+            RelatedProblem.objects
+            .filter(problem=problem)
+            .select_related('related')
+            .only('rank', 'problem_id', 'related__id', 'related__title', 'related__tag_snapshot')
+            .order_by('rank')
+        )
+        
+        # ランダム出題から来た場合は「次の問題」へのリンクを出す
+        context['quiz_mode'] = self.request.GET.get('quiz') == '1'
+        context['quiz_query'] = urlencode({
+            key: value for key, value in self.request.GET.items()
+            if key in QUIZ_FILTERS
+        })
+        
         return context
 
 
+# ランダム出題の絞り込み条件（GET パラメータ → 検索条件）
+QUIZ_FILTERS = {
+    'tag': 'tags__id',
+    'grade': 'grade_id',
+    'subject': 'tags__subject_id',
+}
+
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def quiz_view(request):
+    """条件（単元・学年・科目）に合う自分の問題を 1 問ランダムに選び、詳細ページへ移動"""
+    queryset = Problem.objects.filter(user=request.user)
+    filters = {}
+    for param, lookup in QUIZ_FILTERS.items():
+        value = request.GET.get(param, '')
+        if value.isdigit():
+            queryset = queryset.filter(**{lookup: value})
+            filters[param] = value
+    
+    problem, restarted = pick_quiz_problem(request, queryset)
+    if problem is None:
+        messages.info(request, '条件に合う問題がありません')
+        return redirect('problem_list')
+    if restarted:
+        messages.info(request, 'すべての問題を出題しました。最初から出題します')
+    
+    url = reverse('problem_detail', kwargs={'pk': problem.pk})
+    return redirect(f"{url}?{urlencode({'quiz': 1, **filters})}")
+
+
+# 学習統計（UserStat のロールアップを読むだけ）
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def stats_view(request):
+    context = stats_for_user(request.user)
+    context['by_week'] = context['by_week'][:12]  # 直近 12 週
+    return render(request, 'math_app/stats.html', context)
+
+
 # 問題更新（UpdateView）
 class ProblemUpdateView(LoginRequiredMixin, UpdateView):
     model = Problem
@@ -132,8 +225,33 @@ class ProblemDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+def filter_problem_cards(request):
+    """問題一覧のカード（検索・単元の絞り込み込み）。新しい順で、同時刻は ID で並べる"""
+    # カードに出す列だけを読む（ヒント本文は検索条件にだけ使う）
+    queryset = Problem.objects.filter(
+        user=request.user
+    ).for_cards().order_by('-created_at', '-id')
+    
+    # タグフィルタ
+    tag_id = request.GET.get('tag')
+    if tag_id:
+        queryset = queryset.filter(tags__id=tag_id)
+    
+    # 検索フィルタ
+    search_query = request.GET.get('q')
+    if search_query:
+        queryset = queryset.filter(
+            Q(title__icontains=search_query) |
+            Q(hint_approach__icontains=search_query) |
+            Q(hint_formula__icontains=search_query) |
+            Q(hint_technique__icontains=search_query)
+        )
+    
+    return queryset
+
+
 # 問題一覧（ListView：検索・フィルタ機能あり）
-class ProblemListView(LoginRequiredMixin, ListView):
+class ProblemListView(ReplicaReadMixin, LoginRequiredMixin, ConditionalPageMixin, ListView):
     model = Problem
     template_name = 'math_app/problem_list.html'
     context_object_name = 'problems'
@@ -141,30 +259,17 @@ class ProblemListView(LoginRequiredMixin, ListView):
     login_url = 'login'
     
     def get_queryset(self):
-        queryset = Problem.objects.filter(
-            user=self.request.user
-        ).order_by('-created_at')
-        
-        # タグフィルタ
-        tag_id = self.request.GET.get('tag')
-        if tag_id:
-            queryset = queryset.filter(tags__id=tag_id)
-        
-        # 検索フィルタ
-        search_query = self.request.GET.get('q')
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(hint_approach__icontains=search_query) |
-                Q(hint_formula__icontains=search_query) |
-                Q(hint_technique__icontains=search_query)
-            )
-        
-        return queryset
+        return filter_problem_cards(self.request)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
+        # 無限スクロール（ProblemCardsView）の続きの位置
+        page = context['page_obj']
+        if page is not None and page.has_next() and context['problems']:
+            last = list(context['problems'])[-1]
+            context['next_cursor'] = encode_cursor(last.created_at, last.pk)
+        
         # ユーザーが使用しているすべてのタグを取得
         user_tags = Tag.objects.filter(
             problems__user=self.request.user
@@ -177,8 +282,45 @@ class ProblemListView(LoginRequiredMixin, ListView):
         return context
 
 
+# 問題一覧の続きのカードだけを返す（無限スクロール用の HTML 断片）
+class ProblemCardsView(ReplicaReadMixin, LoginRequiredMixin, ConditionalPageMixin, ListView):
+    """
+    cursor（前回の最後のカードの位置）より後のカードを paginate_by 件返す
+    ヘッダーやサイドバー（単元の一覧）は作らない。次の cursor は X-Next-Cursor ヘッダーで返す
+    """
+    template_name = 'math_app/_problem_cards.html'
+    context_object_name = 'problems'
+    paginate_by = ProblemListView.paginate_by
+    login_url = 'login'
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            self.position = decode_cursor(request.GET.get('cursor', ''))
+        except APIError:
+            return HttpResponseBadRequest('invalid cursor')
+        return super().get(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        created_at, pk = self.position
+        # 1 件多く読み、続きがあるかを判定する
+        return list(
+            filter_problem_cards(self.request)
+            .filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))[:self.paginate_by + 1]
+        )
+    
+    def paginate_queryset(self, queryset, page_size):
+        return None, None, queryset[:page_size], len(queryset) > page_size
+    
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        problems = context['problems']
+        if context['is_paginated'] and problems:
+            response['X-Next-Cursor'] = encode_cursor(problems[-1].created_at, problems[-1].pk)
+        return response
+
+
 # タグ別アーカイブ
-class TagArchiveView(LoginRequiredMixin, ListView):
+class TagArchiveView(ReplicaReadMixin, LoginRequiredMixin, ConditionalPageMixin, ListView):
     model = Problem
     template_name = 'math_app/tag_archive.html'
     context_object_name = 'problems'
@@ -192,7 +334,7 @@ class TagArchiveView(LoginRequiredMixin, ListView):
         return Problem.objects.filter(
             user=self.request.user,
             tags=tag
-        ).order_by('-created_at')
+        ).for_cards().order_by('-created_at')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -230,6 +372,7 @@ def logout_view(request):
     return redirect('index')
 
 
+@rate_limit('signup')
 def signup_view(request):
     if request.user.is_authenticated:
         return redirect('problem_list')
@@ -257,6 +400,7 @@ def signup_view(request):
 
 
 # AJAX: 学年に紐づく単元タグ取得
+@read_from_replica
 @login_required(login_url='login')
 @require_http_methods(["GET"])
 def tags_by_grade(request, grade_id):
@@ -268,6 +412,7 @@ def tags_by_grade(request, grade_id):
 
 
 # AJAX: 科目に紐づく単元タグ取得
+@read_from_replica
 @login_required(login_url='login')
 @require_http_methods(["GET"])
 def tags_by_subject(request, subject_id):
@@ -279,6 +424,7 @@ def tags_by_subject(request, subject_id):
 
 
 # AJAX: 学年に紐づく科目取得
+@read_from_replica
 @login_required(login_url='login')
 @require_http_methods(["GET"])
 def subjects_by_grade(request, grade_id):
@@ -289,13 +435,34 @@ def subjects_by_grade(request, grade_id):
     return JsonResponse(data)
 
 
+# 検索欄の入力候補API（typeahead.py のメモリ上の索引から返す）
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def suggest_view(request):
+    query = request.GET.get('q', '')[:50]
+    return JsonResponse({'results': suggest(request.user.pk, query)})
+
+
+# 単元タグ候補API（問題登録フォームで、タイトル・ヒントの入力から単元を提案する）
+@read_from_replica
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def suggest_tags_view(request):
+    grade_id = request.GET.get('grade', '')
+    tags = suggest_tags(
+        request.user.pk,
+        request.GET.get('text', '')[:1000],
+        grade_id=int(grade_id) if grade_id.isdigit() else None,
+    )
+    return JsonResponse({'tags': tags})
+
+
 # AJAX: ヒント更新
 @login_required(login_url='login')
 @require_http_methods(["POST"])
 def update_hint(request, pk):
     try:
-        import json
-        
         # 問題を取得
         problem = get_object_or_404(Problem, id=pk, user=request.user)
         
@@ -325,9 +492,17 @@ def update_hint(request, pk):
         
         return JsonResponse({
             'success': True,
-            'message': 'ヒントを保存しました'
+            'message': 'ヒントを保存しました',
+            'html': getattr(problem, f'hint_{hint_type}_html'),
         })
     
+    except Http404:
+        # 削除された問題（オフライン中に積んだ編集の送り直しで起きる）
+        return JsonResponse({
+            'success': False,
+            'message': '問題が見つかりません'
+        }, status=404)
+    
     except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
@@ -343,6 +518,7 @@ def update_hint(request, pk):
 
 
 # 質問フォームビュー
+@rate_limit('question')
 def question_view(request):
     """開発者への質問フォーム"""
     if request.method == 'POST':
@@ -411,3 +587,45 @@ def question_success(request):
     """質問送信完了ページ"""
     return render(request, 'math_app/question_success.html')
 
+
+# ==============================================================================
+# PWA（マニフェスト・Service Worker）
+# ==============================================================================
+# キャッシュの内容・方針を変えたら上げる（古いキャッシュは Service Worker の activate で消える）
+PWA_CACHE_VERSION = 6
+
+# インストール時に先に保存しておくアプリの外枠（静的ファイル）
+PWA_APP_SHELL = [
+    'math_app/css/common.css',
+    'math_app/css/problem_list.css',
+    'math_app/css/problem_detail.css',
+    'math_app/css/tag_archive.css',
+    'math_app/js/problem_detail.js',
+    'math_app/js/pwa.js',
+    'math_app/js/typeahead.js',
+    'math_app/js/infinite_scroll.js',
+    'math_app/js/prefetch.js',
+    'math_app/pwa/icon-192.png',
+    'math_app/pwa/icon-512.png',
+]
+
+
+def manifest(request):
+    response = render(request, 'math_app/manifest.webmanifest', content_type='application/manifest+json')
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+def service_worker(request):
+    """
+    ルート（/sw.js）から配信し、サイト全体を Service Worker の管理範囲にする
+    更新をすぐ反映させるため、ブラウザには毎回確認させる
+    """
+    context = {
+        'cache_version': PWA_CACHE_VERSION,
+        'app_shell': json.dumps([static(path) for path in PWA_APP_SHELL]),
+        'media_url': settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else f'/{settings.MEDIA_URL}',
+    }
+    response = render(request, 'math_app/sw.js', context, content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,108 @@
+# ワーカー起動直後のウォームアップ処理
+#
+# デプロイ直後の最初のリクエストが URL リゾルバの構築・テンプレートのコンパイル・
+# DB 接続の確立を肩代わりしないよう、トラフィックを受ける前にまとめて済ませておく。
+# Gunicorn のフック（gunicorn.conf.py）と warmup 管理コマンドから呼ばれる。
+import logging
+import time
+from importlib import import_module
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver, resolve, reverse
+
+logger = logging.getLogger(__name__)
+
+
+def import_views():
+    """全アプリの views と URLconf を読み込む"""
+    count = 0
+    for app_config in apps.get_app_configs():
+        try:
+            import_module(f'{app_config.name}.views')
+        except ImportError:
+            continue
+        count += 1
+
+    # reverse_dict へのアクセスでリゾルバ全体が構築される
+    get_resolver().reverse_dict
+    return f'{count} modules'
+
+
+def compile_templates():
+    """math_app のテンプレートを事前にコンパイルしてキャッシュに載せる"""
+    template_root = Path(apps.get_app_config('math_app').path) / 'templates'
+    names = sorted(
+        path.relative_to(template_root).as_posix()
+        for path in template_root.rglob('*.html')
+    )
+    for name in names:
+        get_template(name)
+    return f'{len(names)} templates'
+
+
+def resolve_urls():
+    """math_app/urls.py の名前付き URL をすべて reverse → resolve する"""
+    from math_app import urls
+
+    count = 0
+    for pattern in urls.urlpatterns:
+        if not getattr(pattern, 'name', None):
+            continue
+        # パス変換子（<int:pk> など）にはダミー値を渡す
+        kwargs = {key: 1 for key in pattern.pattern.converters}
+        resolve(reverse(pattern.name, kwargs=kwargs))
+        count += 1
+    return f'{count} urls'
+
+
+def open_connections():
+    """設定済みの全データベースに接続しておく"""
+    for connection in connections.all():
+        connection.ensure_connection()
+    return ', '.join(connection.alias for connection in connections.all())
+
+
+def prime_taxonomy_tables():
+    """
+    学年・科目・単元タグの表を一度読んで、DB 側のページキャッシュを温めておく
+
+    結果はプロセス内に保持しない（学年・科目・単元タグの AJAX ビューは毎回 DB を読む）。
+    最初の絞り込みで表をディスクから読むのを、起動時に済ませておくだけのステップ。
+    """
+    from math_app.models import Grade, Subject, Tag
+
+    grades = len(Grade.objects.order_by('order').values_list('pk', 'name'))
+    subjects = len(Subject.objects.order_by('grade', 'order', 'name').values_list('pk', 'name'))
+    tags = len(Tag.objects.order_by('subject', 'order', 'name').values_list('pk', 'name'))
+    return f'{grades} grades, {subjects} subjects, {tags} tags'
+
+
+# (ステップ名, 関数, DB を使うか)
+STEPS = (
+    ('views', import_views, False),
+    ('templates', compile_templates, False),
+    ('urls', resolve_urls, False),
+    ('database', open_connections, True),
+    ('taxonomy', prime_taxonomy_tables, True),
+)
+
+
+def warm_up(include_db=True):
+    """
+    ウォームアップを順に実行し、[(ステップ名, 秒数, 詳細), ...] を返す
+
+    fork 前のマスタープロセスでは DB 接続を共有させないよう include_db=False で呼ぶ。
+    """
+    timings = []
+    for name, step, uses_db in STEPS:
+        if uses_db and not include_db:
+            continue
+        start = time.perf_counter()
+        detail = step()
+        elapsed = time.perf_counter() - start
+        timings.append((name, elapsed, detail))
+        logger.info(f"ウォームアップ: {name} {elapsed * 1000:.1f}ms ({detail})")
+    return timings
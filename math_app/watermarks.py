@@ -0,0 +1,92 @@
+# ユーザーごとの変更の目印（UserWatermark）と、それを使った問題一覧・詳細ページの条件付き GET
+#
+# 問題の作成・更新・削除、単元タグの付け替え・名前の変更、関連問題の再計算のたびに version を 1 進める
+# （signals.py / related.py）。ページの ETag は version・URL・ユーザー・CSRF クッキー・リリースから作るので、
+# ブラウザの再読み込みや「戻る」で If-None-Match が一致すれば、一覧のクエリもテンプレートも実行せずに 304 を返す。
+import hashlib
+from functools import cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import UserWatermark
+
+
+def bump_watermarks(user_ids):
+    """指定したユーザーの version を進める（行がなければ作る）"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    now = timezone.now()
+    updated = UserWatermark.objects.filter(user_id__in=user_ids).update(version=F('version') + 1, changed_at=now)
+    if updated < len(user_ids):
+        existing = set(UserWatermark.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        UserWatermark.objects.bulk_create(
+            [UserWatermark(user_id=user_id, version=1, changed_at=now) for user_id in user_ids - existing],
+            ignore_conflicts=True,
+        )
+
+
+def bump_all_watermarks():
+    """全ユーザーの version を進める（表示を変える一括処理の後に使う）"""
+    UserWatermark.objects.update(version=F('version') + 1, changed_at=timezone.now())
+
+
+def get_watermark(user_id):
+    return UserWatermark.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+
+
+@cache
+def release_token():
+    """settings.RELEASE_ID、未設定ならテンプレートの最終更新時刻"""
+    if settings.RELEASE_ID:
+        return settings.RELEASE_ID
+    templates = Path(__file__).resolve().parent / 'templates'
+    return str(max((path.stat().st_mtime_ns for path in templates.rglob('*') if path.is_file()), default=0))
+
+
+def has_pending_messages(request):
+    """表示待ちのメッセージがあるか（読んだ後も表示できるように used を戻す）"""
+    storage = messages.get_messages(request)
+    pending = any(True for _ in storage)
+    storage.used = False
+    return pending
+
+
+def page_etag(request, version):
+    key = '|'.join([
+        release_token(),
+        str(request.user.pk),
+        request.user.get_username(),
+        str(version),
+        request.get_full_path(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ])
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+class ConditionalPageMixin:
+    """
+    クラスベースビュー用：GET で UserWatermark から ETag を作り、一致すれば 304 を返す
+    表示待ちのメッセージがあるときは、それを出すために必ず描画する
+    LoginRequiredMixin より後（ログイン済みのときだけ get() が呼ばれる）で使う
+    """
+    
+    def get(self, request, *args, **kwargs):
+        if has_pending_messages(request):
+            return super().get(request, *args, **kwargs)
+        
+        etag = page_etag(request, get_watermark(request.user.pk))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+        else:
+            response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -13,7 +13,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
-import dj_database_url
 
 # .env ファイルを読み込む
 load_dotenv()
@@ -54,13 +53,16 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'math_app.middleware.PrefetchSessionMiddleware',  # 先読みではセッションを保存しない
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'axes.middleware.AxesMiddleware',  # django-axes
     'django.contrib.messages.middleware.MessageMiddleware',
+    'math_app.middleware.PrefetchMiddleware',  # 先読みでメッセージを読まない
+    'math_app.middleware.MessageCacheMiddleware',  # メッセージを出したページを保存させない
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'math_app.middleware.ReplicaRoutingMiddleware',  # 読み取りレプリカ
 ]
 
 ROOT_URLCONF = 'math_project.urls'
@@ -86,14 +88,39 @@ WSGI_APPLICATION = 'math_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DB の性能プロファイル
+# tuned: PostgreSQL はコネクションプール、SQLite は WAL などの PRAGMA を適用
+# default: Django 標準の設定のまま
+DB_PERFORMANCE_PROFILE = os.environ.get('DB_PERFORMANCE_PROFILE', 'tuned')
+DB_TUNED = DB_PERFORMANCE_PROFILE == 'tuned'
+
 # DATABASE_URL が設定されている場合は PostgreSQL を使用
 if os.getenv('DATABASE_URL'):
+    # PostgreSQL を使う場合のみ読み込む（SQLite の開発環境・cron では不要）
+    import dj_database_url
+
+    # psycopg 3 のネイティブプールを使う場合、永続接続（conn_max_age）は併用できない
+    DB_POOL = DB_TUNED and os.environ.get('DB_POOL', 'True') == 'True'
+
     DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
+            conn_max_age=0 if DB_POOL else 600,
+            conn_health_checks=True,
         )
     }
+
+    if DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        from psycopg_pool import ConnectionPool
+
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+            # 貸し出し前に接続が生きているか確認する（ヘルスチェック）
+            'check': ConnectionPool.check_connection,
+        }
 else:
     # 開発環境（SQLite）
     DATABASES = {
@@ -103,6 +130,52 @@ else:
         }
     }
 
+    if DB_TUNED:
+        # 書き込みトランザクションを最初からロックし、途中での database is locked を防ぐ
+        DATABASES['default']['OPTIONS'] = {
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+# 読み取り専用レプリカ（カンマ区切りの DB URL）
+# 例: DATABASE_REPLICA_URLS=postgres://...@replica1/db,postgres://...@replica2/db
+# ローカル確認用: DATABASE_REPLICA_URLS=sqlite:////path/to/replica.sqlite3
+REPLICA_DATABASES = []
+replica_urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+if replica_urls:
+    import dj_database_url
+
+    for index, url in enumerate(replica_urls, start=1):
+        alias = f'replica{index}'
+        DATABASES[alias] = dj_database_url.parse(
+            url,
+            conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0),
+            conn_health_checks=True,
+        )
+        # プライマリでプールを使っていればレプリカも同じ設定でプールする
+        default_pool = DATABASES['default'].get('OPTIONS', {}).get('pool')
+        if default_pool and DATABASES[alias]['ENGINE'] == 'django.db.backends.postgresql':
+            DATABASES[alias].setdefault('OPTIONS', {})['pool'] = dict(default_pool)
+        # テスト時はプライマリのテスト DB をそのまま参照する
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+        REPLICA_DATABASES.append(alias)
+
+    DATABASE_ROUTERS = ['math_app.db.ReplicaRouter']
+
+# 書き込み後、この秒数はレプリカを使わずプライマリから読む（read-your-writes）
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '10'))
+# 接続できなかったレプリカを使わない秒数
+REPLICA_RETRY_SECONDS = int(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+
+# SQLite 接続ごとに適用する PRAGMA（math_app/db.py の connection_created フックで適用）
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-20000')),  # 負の値は KiB 単位（約 20MB）
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+} if DB_TUNED else {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,6 +219,17 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = []
 
+# collectstatic でファイル名に内容のハッシュを付け、gzip / brotli の圧縮版も作る
+# （WhiteNoise はハッシュ付きのファイルを 1 年・immutable で返すので、CSS / JS を変えてもクエリ文字列で版を分けなくてよい）
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # アップロードされた画像を保存する場所の設定
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -262,3 +346,41 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # 開発環境
 # EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = 'noreply@mathhint-collector.com'
 
+
+# ============================================
+# キャッシュ設定
+# ============================================
+# 既定はプロセスごとのメモリ。複数ワーカー・複数台で状態を共有するときは REDIS_URL を設定する（redis パッケージが必要）
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mathhint',
+        },
+    }
+
+# ============================================
+# レート制限（math_app/ratelimit.py、トークンバケット）
+# ============================================
+# 「回数/秒数」：秒数あたりに補充されるトークン数（= 連続で受け付ける上限）
+RATE_LIMITS = {
+    'question': os.environ.get('RATE_LIMIT_QUESTION', '5/600'),  # 質問フォームの送信
+    'signup': os.environ.get('RATE_LIMIT_SIGNUP', '10/3600'),  # アカウント作成
+}
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+# リバースプロキシ越しの場合、X-Forwarded-For の最後の値（プロキシが付けたもの）をクライアントの IP とする
+RATE_LIMIT_USE_X_FORWARDED_FOR = os.environ.get('RATE_LIMIT_USE_X_FORWARDED_FOR', 'False') == 'True'
+
+# ============================================
+# 問題一覧・詳細の条件付き GET（math_app/watermarks.py）
+# ============================================
+# デプロイごとに変える値（テンプレートを変えたときに、古い HTML へ 304 を返さないように ETag に含める）
+# 未設定ならテンプレートの更新日時から作る
+RELEASE_ID = os.environ.get('RELEASE_ID', '')